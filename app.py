@@ -3,25 +3,18 @@ import pandas as pd
 import numpy as np
 import json
 import os
-import base64
-import io
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.chart import BarChart, LineChart, Reference, PieChart
-from openpyxl.chart.label import DataLabelList
-from openpyxl.utils.dataframe import dataframe_to_rows
-import base64
-from io import BytesIO
-from datetime import datetime
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
-from reportlab.lib.units import inch
-from config import ConfiguracaoTributaria
+import time
+from functools import partial
+from config import ConfiguracaoTributaria, ConfiguracaoSessao
 from calculadoras import CalculadoraTributosAtuais, CalculadoraIVADual
+from taxonomia import TaxonomiaCNAE
+from indice_memoria import IndiceMemoria
+from exportacao import ServicoExportacao, PARAMETROS_EXPORTACAO
+from sessao import GERENCIADOR_SESSOES
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from utils import (formatar_br, criar_grafico_comparativo, criar_grafico_aliquotas,
-                  criar_grafico_transicao, criar_grafico_incentivos)
+                   criar_grafico_transicao, criar_grafico_incentivos, SECOES_MEMORIA, LINHAS_POR_PAGINA,
+                   linhas_memoria, paginar_linhas, arquivo_memoria_calculo, impressao_digital)
 
 
 # Configuração da página
@@ -32,11 +25,23 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Início da execução do script (latência da página completa)
+inicio_execucao = time.perf_counter()
+
+
+# Recursos compilados uma vez por processo e compartilhados (somente leitura) por todas as sessões
+@st.cache_resource
+def carregar_recursos():
+    """Configuração padrão e taxonomia CNAE compartilhadas entre as sessões."""
+    config = ConfiguracaoTributaria()
+    return {"config": config, "taxonomia": TaxonomiaCNAE(config)}
+
 
 # Função para inicializar a sessão
 def inicializar_sessao():
+    # A sessão guarda apenas as tabelas que altera, sobrepostas à configuração compartilhada
     if 'config' not in st.session_state:
-        st.session_state.config = ConfiguracaoTributaria()
+        st.session_state.config = ConfiguracaoSessao(carregar_recursos()["config"])
 
     if 'calculadora_iva' not in st.session_state:
         st.session_state.calculadora_iva = CalculadoraIVADual(st.session_state.config)
@@ -44,12 +49,24 @@ def inicializar_sessao():
     if 'resultados' not in st.session_state:
         st.session_state.resultados = {}
 
+    # Impressão digital dos resultados, calculada uma vez por simulação e usada como chave dos gráficos
+    if 'impressao_resultados' not in st.session_state:
+        st.session_state.impressao_resultados = None
+
     if 'aliquotas_equivalentes' not in st.session_state:
         st.session_state.aliquotas_equivalentes = {}
 
     if 'memoria_calculo' not in st.session_state:
         st.session_state.memoria_calculo = {}
 
+    # Índice da memória de cálculo de todos os anos da última simulação
+    if 'indice_memoria' not in st.session_state:
+        st.session_state.indice_memoria = IndiceMemoria()
+
+    # Latência (ms) da última execução da página e de cada fragmento
+    if 'latencias' not in st.session_state:
+        st.session_state.latencias = {}
+
     # Dados do formulário (para persistência e exportação)
     if 'faturamento' not in st.session_state:
         st.session_state.faturamento = 0
@@ -108,7 +125,7 @@ def adicionar_incentivo(tipo, dados):
     }
 
     # Adicionar à configuração
-    st.session_state.config.icms_config[f"incentivos_{tipo}"].append(incentivo)
+    st.session_state.config.editar("icms_config")[f"incentivos_{tipo}"].append(incentivo)
     return True
 
 
@@ -116,980 +133,29 @@ def adicionar_incentivo(tipo, dados):
 def remover_incentivo(tipo, indice):
     """Remove um incentivo fiscal da configuração."""
     if 0 <= indice < len(st.session_state.config.icms_config[f"incentivos_{tipo}"]):
-        st.session_state.config.icms_config[f"incentivos_{tipo}"].pop(indice)
+        st.session_state.config.editar("icms_config")[f"incentivos_{tipo}"].pop(indice)
         return True
     return False
 
 
-# Função para exportar resultados
-def exportar_resultados(formato):
-    """Exporta os resultados para o formato especificado."""
-    if not st.session_state.resultados:
-        st.error("Execute uma simulação antes de exportar os resultados.")
-        return None
-
-    if formato == "excel":
-        output = BytesIO()
-
-        def exportar_excel():
-            """Exporta os resultados para um arquivo Excel detalhado."""
-            if not st.session_state.resultados:
-                st.warning("Execute uma simulação antes de exportar os resultados.")
-                return None
-
-            try:
-                # Criar um buffer em memória para o arquivo Excel
-                output = io.BytesIO()
-
-                # Criar workbook
-                wb = Workbook()
-
-                # Aba de Parâmetros
-                ws_parametros = wb.active
-                ws_parametros.title = "Parâmetros"
-
-                # Adicionar título
-                ws_parametros['A1'] = "Simulador da Reforma Tributária - IVA Dual (CBS/IBS)"
-                ws_parametros['A1'].font = Font(bold=True, size=14)
-                ws_parametros.merge_cells('A1:B1')
-
-                # Data do relatório
-                import datetime
-                ws_parametros['A2'] = "Data do relatório:"
-                ws_parametros['B2'] = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-
-                # Cabeçalho dos parâmetros
-                ws_parametros['A4'] = "Parâmetro"
-                ws_parametros['B4'] = "Valor"
-
-                # Estilo do cabeçalho
-                for cell in ws_parametros['A4:B4'][0]:
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
-
-                # Obter dados da sessão
-                # Aqui vamos assumir que os dados foram salvos no estado da sessão após a simulação
-                faturamento = st.session_state.get('faturamento', 0)
-                custos = st.session_state.get('custos_tributaveis', 0)
-                custos_simples = st.session_state.get('custos_simples', 0)
-                creditos_anteriores = st.session_state.get('creditos_anteriores', 0)
-                setor = st.session_state.get('setor', 'padrao')
-                regime = st.session_state.get('regime', 'real')
-                carga_atual = st.session_state.get('carga_atual', 25)
-
-                # Preencher dados dos parâmetros
-                parametros = [
-                    ["Faturamento Anual", f"R$ {formatar_br(faturamento)}"],
-                    ["Custos Tributáveis", f"R$ {formatar_br(custos)}"],
-                    ["Fornecedores do Simples", f"R$ {formatar_br(custos_simples)}"],
-                    ["Créditos Anteriores", f"R$ {formatar_br(creditos_anteriores)}"],
-                    ["Setor de Atividade", setor],
-                    ["Regime Tributário", regime],
-                    ["Carga Tributária Atual", f"{formatar_br(carga_atual)}%"],
-                ]
-
-                # Adicionar parâmetros
-                for i, (param, valor) in enumerate(parametros, 5):
-                    ws_parametros[f'A{i}'] = param
-                    ws_parametros[f'B{i}'] = valor
-
-                # Ajustar largura das colunas
-                ws_parametros.column_dimensions['A'].width = 25
-                ws_parametros.column_dimensions['B'].width = 25
-
-                # Aba de Resultados
-                ws_resultados = wb.create_sheet(title="Resultados")
-
-                # Adicionar título
-                ws_resultados['A1'] = "Resultados da Simulação"
-                ws_resultados['A1'].font = Font(bold=True, size=14)
-                ws_resultados.merge_cells('A1:I1')
-
-                # Cabeçalho dos resultados
-                cabecalhos = [
-                    "Ano", "CBS (R$)", "IBS (R$)", "Imposto Bruto (R$)", "Créditos (R$)",
-                    "Imposto Devido (R$)", "Carga Atual (R$)", "Diferença (R$)",
-                    "Alíquota Efetiva (%)"
-                ]
-
-                for col, header in enumerate(cabecalhos, 1):
-                    cell = ws_resultados.cell(row=3, column=col, value=header)
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
-
-                # Preparar dados
-                dados_tabela = []
-                for ano, resultado in st.session_state.resultados.items():
-                    valor_atual = st.session_state.aliquotas_equivalentes[ano]["valor_atual"]
-                    diferenca = resultado["imposto_devido"] - valor_atual
-
-                    dados_tabela.append({
-                        "Ano": ano,
-                        "CBS (R$)": resultado["cbs"],
-                        "IBS (R$)": resultado["ibs"],
-                        "Imposto Bruto (R$)": resultado["imposto_bruto"],
-                        "Créditos (R$)": resultado["creditos"],
-                        "Imposto Devido (R$)": resultado["imposto_devido"],
-                        "Carga Atual (R$)": valor_atual,
-                        "Diferença (R$)": diferenca,
-                        "Alíquota Efetiva (%)": resultado["aliquota_efetiva"] * 100
-                    })
-
-                # Ordenar dados por ano
-                dados_tabela.sort(key=lambda x: x["Ano"])
-
-                # Preencher tabela
-                for i, dados in enumerate(dados_tabela, 4):
-                    # Preencher dados sem formatação (para que os gráficos funcionem corretamente)
-                    for col, cabecalho in enumerate(cabecalhos, 1):
-                        valor = dados[cabecalho]
-                        cell = ws_resultados.cell(row=i, column=col, value=valor)
-
-                        # Formatação especial para colunas de valores
-                        if col > 1 and col < 9:  # Colunas de valores monetários
-                            cell.number_format = '#,##0.00'
-                        elif col == 9:  # Coluna de percentual
-                            cell.number_format = '0.00%'
-
-                        # Destacar diferenças
-                        if col == 8:  # Coluna de diferença
-                            if valor > 0:
-                                cell.font = Font(color="FF0000")  # Vermelho se aumentar
-                            elif valor < 0:
-                                cell.font = Font(color="008000")  # Verde se diminuir
-
-                # Ajustar largura das colunas
-                for col in range(1, len(cabecalhos) + 1):
-                    ws_resultados.column_dimensions[chr(64 + col)].width = 18
-
-                # Aba com Gráficos
-                ws_graficos = wb.create_sheet(title="Gráficos")
-
-                # Título da aba de gráficos
-                ws_graficos['A1'] = "Análise Gráfica dos Resultados"
-                ws_graficos['A1'].font = Font(bold=True, size=14)
-                ws_graficos.merge_cells('A1:F1')
-
-                # Criar gráfico de barras para comparação CBS/IBS
-                chart1 = BarChart()
-                chart1.title = "Comparativo: CBS vs IBS"
-                chart1.style = 10
-                chart1.type = "col"
-                chart1.grouping = "clustered"
-                chart1.y_axis.title = "Valor (R$)"
-                chart1.x_axis.title = "Ano"
-
-                data = Reference(ws_resultados, min_col=2, max_col=3, min_row=3, max_row=3 + len(dados_tabela))
-                cats = Reference(ws_resultados, min_col=1, min_row=4, max_row=3 + len(dados_tabela))
-
-                chart1.add_data(data, titles_from_data=True)
-                chart1.set_categories(cats)
-                chart1.height = 15
-                chart1.width = 20
-
-                # Adicionar este gráfico na planilha
-                ws_graficos.add_chart(chart1, "A3")
-
-                # Criar gráfico de comparação entre imposto devido e carga atual
-                chart2 = BarChart()
-                chart2.title = "Comparativo: Imposto Devido vs. Carga Atual"
-                chart2.style = 11
-                chart2.type = "col"
-                chart2.grouping = "clustered"
-                chart2.y_axis.title = "Valor (R$)"
-                chart2.x_axis.title = "Ano"
-
-                data = Reference(ws_resultados, min_col=6, max_col=7, min_row=3, max_row=3 + len(dados_tabela))
-
-                chart2.add_data(data, titles_from_data=True)
-                chart2.set_categories(cats)
-                chart2.height = 15
-                chart2.width = 20
-
-                # Adicionar na planilha
-                ws_graficos.add_chart(chart2, "A20")
-
-                # Criar gráfico de linha para a alíquota efetiva
-                chart3 = LineChart()
-                chart3.title = "Evolução da Alíquota Efetiva"
-                chart3.style = 12
-                chart3.y_axis.title = "Alíquota (%)"
-                chart3.x_axis.title = "Ano"
-
-                data = Reference(ws_resultados, min_col=9, max_col=9, min_row=3, max_row=3 + len(dados_tabela))
-
-                chart3.add_data(data, titles_from_data=True)
-                chart3.set_categories(cats)
-                chart3.height = 15
-                chart3.width = 20
-
-                # Adicionar rótulos de dados
-                chart3.dataLabels = DataLabelList()
-                chart3.dataLabels.showVal = True
-
-                # Adicionar na planilha
-                ws_graficos.add_chart(chart3, "H3")
-
-                # Aba de Incentivos Fiscais
-                ws_incentivos = wb.create_sheet(title="Incentivos Fiscais")
-
-                # Título da aba de incentivos
-                ws_incentivos['A1'] = "Incentivos Fiscais Configurados"
-                ws_incentivos['A1'].font = Font(bold=True, size=14)
-                ws_incentivos.merge_cells('A1:D1')
-
-                # Incentivos de Saída
-                ws_incentivos['A3'] = "Incentivos de Saída"
-                ws_incentivos['A3'].font = Font(bold=True)
-                ws_incentivos.merge_cells('A3:D3')
-
-                # Cabeçalho dos incentivos
-                cabecalhos_inc = ["Descrição", "Tipo", "Percentual", "% Operações"]
-                for col, header in enumerate(cabecalhos_inc, 1):
-                    cell = ws_incentivos.cell(row=4, column=col, value=header)
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
-
-                # Preencher dados dos incentivos de saída
-                row = 5
-                for i, incentivo in enumerate(st.session_state.config.icms_config["incentivos_saida"]):
-                    ws_incentivos.cell(row=row, column=1, value=incentivo["descricao"])
-                    ws_incentivos.cell(row=row, column=2, value=incentivo["tipo"])
-                    ws_incentivos.cell(row=row, column=3, value=incentivo["percentual"])
-                    ws_incentivos.cell(row=row, column=4, value=incentivo["percentual_operacoes"])
-
-                    # Formatar células
-                    ws_incentivos.cell(row=row, column=3).number_format = '0.00%'
-                    ws_incentivos.cell(row=row, column=4).number_format = '0.00%'
-
-                    row += 1
-
-                # Preencher incentivos de entrada
-                row += 2
-                ws_incentivos.cell(row=row, column=1, value="Incentivos de Entrada")
-                ws_incentivos.cell(row=row, column=1).font = Font(bold=True)
-                ws_incentivos.merge_cells(f'A{row}:D{row}')
-
-                row += 1
-                for col, header in enumerate(cabecalhos_inc, 1):
-                    cell = ws_incentivos.cell(row=row, column=col, value=header)
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
-
-                row += 1
-                for i, incentivo in enumerate(st.session_state.config.icms_config["incentivos_entrada"]):
-                    ws_incentivos.cell(row=row, column=1, value=incentivo["descricao"])
-                    ws_incentivos.cell(row=row, column=2, value=incentivo["tipo"])
-                    ws_incentivos.cell(row=row, column=3, value=incentivo["percentual"])
-                    ws_incentivos.cell(row=row, column=4, value=incentivo["percentual_operacoes"])
-
-                    # Formatar células
-                    ws_incentivos.cell(row=row, column=3).number_format = '0.00%'
-                    ws_incentivos.cell(row=row, column=4).number_format = '0.00%'
-
-                    row += 1
-
-                # Preencher incentivos de apuração
-                row += 2
-                ws_incentivos.cell(row=row, column=1, value="Incentivos de Apuração")
-                ws_incentivos.cell(row=row, column=1).font = Font(bold=True)
-                ws_incentivos.merge_cells(f'A{row}:D{row}')
-
-                row += 1
-                for col, header in enumerate(cabecalhos_inc, 1):
-                    cell = ws_incentivos.cell(row=row, column=col, value=header)
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
-
-                row += 1
-                for i, incentivo in enumerate(st.session_state.config.icms_config["incentivos_apuracao"]):
-                    ws_incentivos.cell(row=row, column=1, value=incentivo["descricao"])
-                    ws_incentivos.cell(row=row, column=2, value=incentivo["tipo"])
-                    ws_incentivos.cell(row=row, column=3, value=incentivo["percentual"])
-                    ws_incentivos.cell(row=row, column=4, value=incentivo["percentual_operacoes"])
-
-                    # Formatar células
-                    ws_incentivos.cell(row=row, column=3).number_format = '0.00%'
-                    ws_incentivos.cell(row=row, column=4).number_format = '0.00%'
-
-                    row += 1
-
-                # Ajustar largura das colunas
-                ws_incentivos.column_dimensions['A'].width = 30
-                ws_incentivos.column_dimensions['B'].width = 25
-                ws_incentivos.column_dimensions['C'].width = 15
-                ws_incentivos.column_dimensions['D'].width = 15
-
-                # Aba de Memória de Cálculo
-                ws_memoria = wb.create_sheet(title="Memória de Cálculo")
-
-                # Título da aba
-                ws_memoria['A1'] = "Memória de Cálculo Detalhada"
-                ws_memoria['A1'].font = Font(bold=True, size=14)
-                ws_memoria.merge_cells('A1:E1')
-
-                # Selecionar o primeiro ano disponível para a memória de cálculo
-                if st.session_state.resultados:
-                    primeiro_ano = sorted(st.session_state.resultados.keys())[0]
-
-                    # Adicionar título do ano
-                    ws_memoria['A3'] = f"Memória de Cálculo - Ano {primeiro_ano}"
-                    ws_memoria['A3'].font = Font(bold=True)
-                    ws_memoria.merge_cells('A3:E3')
-
-                    # Obter a memória de cálculo
-                    memoria = st.session_state.memoria_calculo
-
-                    # Função auxiliar para adicionar seções
-                    def adicionar_secao(titulo, secao_info, linha_inicio):
-                        linha = linha_inicio
-
-                        # Adicionar título da seção
-                        ws_memoria.cell(row=linha, column=1, value=titulo)
-                        ws_memoria.cell(row=linha, column=1).font = Font(bold=True)
-                        ws_memoria.merge_cells(f'A{linha}:E{linha}')
-
-                        linha += 1
-
-                        # Adicionar conteúdo
-                        if isinstance(secao_info, list):
-                            # Caso de caminhos aninhados
-                            if len(secao_info) >= 2 and secao_info[0] in memoria and secao_info[1] in memoria[
-                                secao_info[0]]:
-                                dados_secao = memoria[secao_info[0]][secao_info[1]]
-                                if dados_secao:
-                                    for item in dados_secao:
-                                        ws_memoria.cell(row=linha, column=1, value=item)
-                                        ws_memoria.merge_cells(f'A{linha}:E{linha}')
-                                        linha += 1
-                                else:
-                                    ws_memoria.cell(row=linha, column=1, value="Não disponível")
-                                    ws_memoria.merge_cells(f'A{linha}:E{linha}')
-                                    linha += 1
-                            else:
-                                ws_memoria.cell(row=linha, column=1, value="Dados não disponíveis para esta seção")
-                                ws_memoria.merge_cells(f'A{linha}:E{linha}')
-                                linha += 1
-                        else:
-                            # Caso de chave direta
-                            if secao_info in memoria and memoria[secao_info]:
-                                for item in memoria[secao_info]:
-                                    ws_memoria.cell(row=linha, column=1, value=item)
-                                    ws_memoria.merge_cells(f'A{linha}:E{linha}')
-                                    linha += 1
-                            else:
-                                ws_memoria.cell(row=linha, column=1, value="Não disponível")
-                                ws_memoria.merge_cells(f'A{linha}:E{linha}')
-                                linha += 1
-
-                        linha += 1
-                        return linha
-
-                    # Adicionar seções da memória de cálculo
-                    linha_atual = 5
-                    linha_atual = adicionar_secao("VALIDAÇÃO DE DADOS", "validacao", linha_atual)
-                    linha_atual = adicionar_secao("BASE TRIBUTÁVEL", "base_tributavel", linha_atual)
-                    linha_atual = adicionar_secao("ALÍQUOTAS", "aliquotas", linha_atual)
-                    linha_atual = adicionar_secao("CÁLCULO DA CBS", "cbs", linha_atual)
-                    linha_atual = adicionar_secao("CÁLCULO DO IBS", "ibs", linha_atual)
-                    linha_atual = adicionar_secao("CÁLCULO DOS CRÉDITOS", "creditos", linha_atual)
-                    linha_atual = adicionar_secao("CÁLCULO DO IMPOSTO DEVIDO", "imposto_devido", linha_atual)
-
-                    # Calcular os impostos atuais
-                    ws_memoria.cell(row=linha_atual, column=1, value="CÁLCULO DOS IMPOSTOS ATUAIS")
-                    ws_memoria.cell(row=linha_atual, column=1).font = Font(bold=True, size=12)
-                    ws_memoria.merge_cells(f'A{linha_atual}:E{linha_atual}')
-                    linha_atual += 2
-
-                    if "impostos_atuais" in memoria:
-                        linha_atual = adicionar_secao("PIS", ["impostos_atuais", "PIS"], linha_atual)
-                        linha_atual = adicionar_secao("COFINS", ["impostos_atuais", "COFINS"], linha_atual)
-                        linha_atual = adicionar_secao("ICMS", ["impostos_atuais", "ICMS"], linha_atual)
-                        linha_atual = adicionar_secao("ISS", ["impostos_atuais", "ISS"], linha_atual)
-                        linha_atual = adicionar_secao("IPI", ["impostos_atuais", "IPI"], linha_atual)
-                        linha_atual = adicionar_secao("TOTAL IMPOSTOS ATUAIS", ["impostos_atuais", "total"],
-                                                      linha_atual)
-
-                    # Adicionar créditos cruzados e total devido
-                    if "creditos_cruzados" in memoria and memoria["creditos_cruzados"]:
-                        linha_atual = adicionar_secao("CRÉDITOS CRUZADOS", "creditos_cruzados", linha_atual)
-
-                    linha_atual = adicionar_secao("TOTAL DEVIDO", "total_devido", linha_atual)
-
-                # Ajustar largura das colunas
-                ws_memoria.column_dimensions['A'].width = 100
-
-                # Aba com Alíquotas Setoriais
-                ws_setores = wb.create_sheet(title="Alíquotas Setoriais")
-
-                # Título
-                ws_setores['A1'] = "Alíquotas por Setor - LC 214/2025"
-                ws_setores['A1'].font = Font(bold=True, size=14)
-                ws_setores.merge_cells('A1:C1')
-
-                # Cabeçalho
-                cabecalhos = ["Setor", "IBS (%)", "Redução CBS (%)"]
-                for col, header in enumerate(cabecalhos, 1):
-                    cell = ws_setores.cell(row=3, column=col, value=header)
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')
-
-                # Dados das alíquotas setoriais
-                row = 4
-                for setor, valores in st.session_state.config.setores_especiais.items():
-                    ws_setores.cell(row=row, column=1, value=setor)
-                    ws_setores.cell(row=row, column=2, value=valores["IBS"])
-                    ws_setores.cell(row=row, column=3, value=valores["reducao_CBS"])
-
-                    # Formatação
-                    ws_setores.cell(row=row, column=2).number_format = '0.00%'
-                    ws_setores.cell(row=row, column=3).number_format = '0.00%'
-
-                    row += 1
-
-                # Ajustar largura das colunas
-                ws_setores.column_dimensions['A'].width = 20
-                ws_setores.column_dimensions['B'].width = 15
-                ws_setores.column_dimensions['C'].width = 20
-
-                # Rodapé em todas as abas
-                for ws in wb.worksheets:
-                    row = ws.max_row + 2
-                    ws.cell(row=row, column=1, value="© 2025 Expertzy Inteligência Tributária")
-                    ws.cell(row=row, column=1).font = Font(italic=True, size=9)
-
-                # Salvar o arquivo
-                wb.save(output)
-
-                # Retornar o arquivo como base64 para download
-                output.seek(0)
-                b64 = base64.b64encode(output.read()).decode()
-                return b64
-
-            except Exception as e:
-                import traceback
-                st.error(f"Erro ao gerar Excel: {e}")
-                st.error(traceback.format_exc())
-                return None
-
-        # Substituir no app.py a parte onde está o botão de exportação para Excel:
-        if st.button("Exportar para Excel", key="bt_excel"):
-            with st.spinner("Gerando arquivo Excel..."):
-                b64_excel = exportar_excel()
-                if b64_excel:
-                    href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64_excel}" download="simulacao_iva_dual.xlsx">Download do arquivo Excel</a>'
-                    st.markdown(href, unsafe_allow_html=True)
-        return output.getvalue()
-    elif formato == "pdf":
-        output = BytesIO()
-
-        def exportar_pdf():
-            """Exporta os resultados para um arquivo PDF detalhado."""
-            if not st.session_state.resultados:
-                st.warning("Execute uma simulação antes de exportar os resultados.")
-                return None
-
-            try:
-                # Criar um buffer em memória para o PDF
-                buffer = io.BytesIO()
-
-                # Configuração do documento
-                doc = SimpleDocTemplate(
-                    buffer,
-                    pagesize=letter,
-                    rightMargin=72,
-                    leftMargin=72,
-                    topMargin=72,
-                    bottomMargin=72
-                )
+# Serviço de exportação compartilhado pelas sessões do processo
+@st.cache_resource
+def servico_exportacao():
+    """Laço asyncio e pool de threads que geram os arquivos Excel e PDF em segundo plano."""
+    return ServicoExportacao()
 
-                # Lista de elementos para o PDF
-                elementos = []
-
-                # Estilos
-                estilos = getSampleStyleSheet()
-                titulo_estilo = estilos['Heading1']
-                subtitulo_estilo = estilos['Heading2']
-                subsecao_estilo = estilos['Heading3']
-                normal_estilo = estilos['Normal']
-
-                # Criar estilo para código/memória de cálculo
-                codigo_estilo = ParagraphStyle(
-                    'CodigoEstilo',
-                    parent=estilos['Normal'],
-                    fontName='Courier',
-                    fontSize=8,
-                    leading=10,
-                    leftIndent=36,
-                )
 
-                # Adicionar título
-                elementos.append(Paragraph("Relatório de Simulação - IVA Dual (CBS/IBS)", titulo_estilo))
-                elementos.append(Spacer(1, 0.25 * inch))
-
-                # Data do relatório
-                import datetime
-                data_hora = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-                elementos.append(Paragraph(f"Data do relatório: {data_hora}", normal_estilo))
-                elementos.append(Spacer(1, 0.1 * inch))
-
-                # Parâmetros da simulação
-                elementos.append(Paragraph("Parâmetros da Simulação", subtitulo_estilo))
-                elementos.append(Spacer(1, 0.1 * inch))
-
-                # Obter dados da sessão
-                faturamento = st.session_state.get('faturamento', 0)
-                custos = st.session_state.get('custos_tributaveis', 0)
-                custos_simples = st.session_state.get('custos_simples', 0)
-                creditos_anteriores = st.session_state.get('creditos_anteriores', 0)
-                setor = st.session_state.get('setor', 'padrao')
-                regime = st.session_state.get('regime', 'real')
-                carga_atual = st.session_state.get('carga_atual', 25)
-                aliquota_entrada = st.session_state.get('aliquota_entrada', 19)
-                aliquota_saida = st.session_state.get('aliquota_saida', 19)
-
-                # Tabela com parâmetros
-                dados_parametros = [
-                    ["Parâmetro", "Valor"],
-                    ["Faturamento Anual", f"R$ {formatar_br(faturamento)}"],
-                    ["Custos Tributáveis", f"R$ {formatar_br(custos)}"],
-                    ["Fornecedores do Simples", f"R$ {formatar_br(custos_simples)}"],
-                    ["Créditos Anteriores", f"R$ {formatar_br(creditos_anteriores)}"],
-                    ["Setor de Atividade", setor],
-                    ["Regime Tributário", regime],
-                    ["Carga Tributária Atual", f"{formatar_br(carga_atual)}%"],
-                    ["Alíquota ICMS Entrada", f"{formatar_br(aliquota_entrada)}%"],
-                    ["Alíquota ICMS Saída", f"{formatar_br(aliquota_saida)}%"]
-                ]
-
-                tabela_parametros = Table(dados_parametros, colWidths=[2.5 * inch, 2.5 * inch])
-                tabela_parametros.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (1, 0), 'CENTER'),
-                    ('FONTNAME', (0, 0), (1, 0), 'Helvetica-Bold'),
-                    ('BOTTOMPADDING', (0, 0), (1, 0), 12),
-                    ('BACKGROUND', (0, 1), (1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ]))
-
-                elementos.append(tabela_parametros)
-                elementos.append(Spacer(1, 0.2 * inch))
-
-                # Incentivos Fiscais
-                elementos.append(Paragraph("Incentivos Fiscais Configurados", subtitulo_estilo))
-                elementos.append(Spacer(1, 0.1 * inch))
-
-                # Incentivos de Saída
-                incentivos_saida = st.session_state.config.icms_config["incentivos_saida"]
-                if incentivos_saida:
-                    elementos.append(Paragraph("Incentivos de Saída", subsecao_estilo))
-
-                    dados_saida = [["Descrição", "Tipo", "Percentual", "% Operações"]]
-                    for inc in incentivos_saida:
-                        dados_saida.append([
-                            inc["descricao"],
-                            inc["tipo"],
-                            f"{formatar_br(inc['percentual'] * 100)}%",
-                            f"{formatar_br(inc['percentual_operacoes'] * 100)}%"
-                        ])
-
-                    tabela_saida = Table(dados_saida, colWidths=[2 * inch, 2 * inch, 1 * inch, 1 * inch])
-                    tabela_saida.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ]))
-
-                    elementos.append(tabela_saida)
-                    elementos.append(Spacer(1, 0.2 * inch))
-                else:
-                    elementos.append(Paragraph("Nenhum incentivo de saída configurado.", normal_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                # Incentivos de Entrada
-                incentivos_entrada = st.session_state.config.icms_config["incentivos_entrada"]
-                if incentivos_entrada:
-                    elementos.append(Paragraph("Incentivos de Entrada", subsecao_estilo))
-
-                    dados_entrada = [["Descrição", "Tipo", "Percentual", "% Operações"]]
-                    for inc in incentivos_entrada:
-                        dados_entrada.append([
-                            inc["descricao"],
-                            inc["tipo"],
-                            f"{formatar_br(inc['percentual'] * 100)}%",
-                            f"{formatar_br(inc['percentual_operacoes'] * 100)}%"
-                        ])
-
-                    tabela_entrada = Table(dados_entrada, colWidths=[2 * inch, 2 * inch, 1 * inch, 1 * inch])
-                    tabela_entrada.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ]))
-
-                    elementos.append(tabela_entrada)
-                    elementos.append(Spacer(1, 0.2 * inch))
-                else:
-                    elementos.append(Paragraph("Nenhum incentivo de entrada configurado.", normal_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                # Incentivos de Apuração
-                incentivos_apuracao = st.session_state.config.icms_config["incentivos_apuracao"]
-                if incentivos_apuracao:
-                    elementos.append(Paragraph("Incentivos de Apuração", subsecao_estilo))
-
-                    dados_apuracao = [["Descrição", "Tipo", "Percentual", "% do Saldo"]]
-                    for inc in incentivos_apuracao:
-                        dados_apuracao.append([
-                            inc["descricao"],
-                            inc["tipo"],
-                            f"{formatar_br(inc['percentual'] * 100)}%",
-                            f"{formatar_br(inc['percentual_operacoes'] * 100)}%"
-                        ])
-
-                    tabela_apuracao = Table(dados_apuracao, colWidths=[2 * inch, 2 * inch, 1 * inch, 1 * inch])
-                    tabela_apuracao.setStyle(TableStyle([
-                        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ]))
-
-                    elementos.append(tabela_apuracao)
-                    elementos.append(Spacer(1, 0.2 * inch))
-                else:
-                    elementos.append(Paragraph("Nenhum incentivo de apuração configurado.", normal_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                # Colocar este código após adicionar os incentivos de apuração e antes de executar a simulação
-                if st.session_state.config.icms_config["incentivos_apuracao"]:
-                    st.success(
-                        f"{len(st.session_state.config.icms_config['incentivos_apuracao'])} incentivo(s) de apuração configurado(s). Estes serão aplicados sobre o saldo devedor após a compensação de débitos e créditos.")
-
-                # Adicionar após a simulação, dentro do bloco de exibição de resultados
-                if "resultados" in st.session_state and st.session_state.resultados and \
-                        st.session_state.config.icms_config["incentivos_apuracao"]:
-                    # Obter o primeiro ano
-                    primeiro_ano = min(st.session_state.resultados.keys())
-                    resultado = st.session_state.resultados[primeiro_ano]
-
-                    # Verificar se há economia de ICMS
-                    if "economia_icms" in resultado["impostos_atuais"] and resultado["impostos_atuais"][
-                        "economia_icms"] > 0:
-                        st.info(f"Os incentivos de apuração configurados contribuíram para a economia fiscal. " +
-                                f"O ICMS devido foi reduzido pela aplicação dos incentivos de apuração.")
-
-                        # Adicionar uma métrica visual
-                        col1, col2, col3 = st.columns(3)
-                        with col1:
-                            st.metric(
-                                label="ICMS sem Incentivos",
-                                value=f"R$ {formatar_br(resultado['impostos_atuais']['ICMS'] + resultado['impostos_atuais']['economia_icms'])}"
-                            )
-                        with col2:
-                            st.metric(
-                                label="ICMS com Incentivos",
-                                value=f"R$ {formatar_br(resultado['impostos_atuais']['ICMS'])}",
-                                delta=f"-{formatar_br(resultado['impostos_atuais']['economia_icms'])}"
-                            )
-                        with col3:
-                            # Calcular percentual de economia
-                            perc_economia = (resultado['impostos_atuais']['economia_icms'] /
-                                             (resultado['impostos_atuais']['ICMS'] + resultado['impostos_atuais'][
-                                                 'economia_icms'])) * 100
-                            st.metric(
-                                label="Economia Percentual",
-                                value=f"{formatar_br(perc_economia)}%"
-                            )
-
-                # Resultados da simulação
-                elementos.append(Paragraph("Resultados da Simulação", subtitulo_estilo))
-                elementos.append(Spacer(1, 0.1 * inch))
-
-                # Preparar dados da tabela de resultados
-                dados_tabela = [
-                    ["Ano", "CBS (R$)", "IBS (R$)", "Imposto Bruto (R$)", "Créditos (R$)",
-                     "Imposto Devido (R$)", "Carga Atual (R$)", "Diferença (R$)", "Alíquota (%)"]
-                ]
-
-                # Ordenar resultados por ano
-                anos_ordenados = sorted(st.session_state.resultados.keys())
-
-                for ano in anos_ordenados:
-                    resultado = st.session_state.resultados[ano]
-                    valor_atual = st.session_state.aliquotas_equivalentes[ano]["valor_atual"]
-                    diferenca = resultado["imposto_devido"] - valor_atual
-
-                    dados_tabela.append([
-                        str(ano),
-                        f"R$ {formatar_br(resultado['cbs'])}",
-                        f"R$ {formatar_br(resultado['ibs'])}",
-                        f"R$ {formatar_br(resultado['imposto_bruto'])}",
-                        f"R$ {formatar_br(resultado['creditos'])}",
-                        f"R$ {formatar_br(resultado['imposto_devido'])}",
-                        f"R$ {formatar_br(valor_atual)}",
-                        f"R$ {formatar_br(diferenca)}",
-                        f"{formatar_br(resultado['aliquota_efetiva'] * 100)}%"
-                    ])
-
-                # Criar a tabela de resultados
-                tabela_resultados = Table(dados_tabela, colWidths=[0.5 * inch, 0.85 * inch, 0.85 * inch,
-                                                                   0.9 * inch, 0.85 * inch, 0.9 * inch,
-                                                                   0.85 * inch, 0.85 * inch, 0.7 * inch])
-
-                tabela_resultados.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
-                ]))
-
-                elementos.append(tabela_resultados)
-                elementos.append(Spacer(1, 0.2 * inch))
-
-                # Análise dos resultados
-                elementos.append(Paragraph("Análise dos Resultados", subtitulo_estilo))
-                elementos.append(Spacer(1, 0.1 * inch))
-
-                # Adicionar texto de análise
-                if len(anos_ordenados) >= 2:
-                    ano_inicial = min(anos_ordenados)
-                    ano_final = max(anos_ordenados)
-
-                    resultado_inicial = st.session_state.resultados[ano_inicial]
-                    resultado_final = st.session_state.resultados[ano_final]
-
-                    # Variação do imposto devido
-                    variacao_imposto = resultado_final["imposto_devido"] - resultado_inicial["imposto_devido"]
-                    percentual_var = (variacao_imposto / resultado_inicial["imposto_devido"]) * 100 if \
-                    resultado_inicial["imposto_devido"] > 0 else 0
-
-                    # Variação da alíquota efetiva
-                    variacao_aliquota = resultado_final["aliquota_efetiva"] - resultado_inicial["aliquota_efetiva"]
-                    percentual_var_aliq = variacao_aliquota * 100
-
-                    texto_analise = f"""
-                    Durante o período de transição do IVA Dual (de {ano_inicial} a {ano_final}), observa-se uma 
-                    variação significativa na carga tributária da empresa. O imposto devido no IVA Dual passa 
-                    de R$ {formatar_br(resultado_inicial["imposto_devido"])} para R$ {formatar_br(resultado_final["imposto_devido"])}, 
-                    representando uma variação de {formatar_br(percentual_var)}%.
-
-                    A alíquota efetiva evolui de {formatar_br(resultado_inicial["aliquota_efetiva"] * 100)}% para 
-                    {formatar_br(resultado_final["aliquota_efetiva"] * 100)}%, uma variação de {formatar_br(percentual_var_aliq)} pontos percentuais.
-
-                    Esta evolução reflete a implementação progressiva do novo sistema tributário, conforme 
-                    estabelecido pela Lei Complementar 214/2025. Vale destacar que o impacto da reforma varia de 
-                    acordo com o setor de atividade, o regime tributário e a estrutura de custos da empresa.
-                    """
-
-                    elementos.append(Paragraph(texto_analise.strip(), normal_estilo))
-                    elementos.append(Spacer(1, 0.2 * inch))
-
-                # Adicionar comentário sobre ICMS e incentivos fiscais
-                if st.session_state.config.icms_config["incentivos_saida"] or st.session_state.config.icms_config[
-                    "incentivos_entrada"] or st.session_state.config.icms_config["incentivos_apuracao"]:
-                    resultado = st.session_state.resultados[anos_ordenados[0]]
-                    icms_devido = resultado["impostos_atuais"].get("ICMS", 0)
-                    economia_icms = resultado["impostos_atuais"].get("economia_icms", 0)
-                    total_incentivos = len(st.session_state.config.icms_config["incentivos_saida"]) + len(
-                        st.session_state.config.icms_config["incentivos_entrada"]) + len(
-                        st.session_state.config.icms_config["incentivos_apuracao"])
-
-                    texto_incentivos = f"""
-                    A simulação considera {total_incentivos} incentivos fiscais configurados, resultando em uma 
-                    economia fiscal de R$ {formatar_br(economia_icms)} no ICMS. Sem estes incentivos, o ICMS devido 
-                    seria de R$ {formatar_br(icms_devido + economia_icms)}, em vez dos atuais R$ {formatar_br(icms_devido)}.
-
-                    Durante a transição para o IVA Dual, é importante considerar como estes incentivos serão tratados, 
-                    pois a reforma tributária pode afetar significativamente os benefícios fiscais existentes.
-                    """
-
-                    elementos.append(Paragraph("Impacto dos Incentivos Fiscais", subsecao_estilo))
-                    elementos.append(Paragraph(texto_incentivos.strip(), normal_estilo))
-                    elementos.append(Spacer(1, 0.2 * inch))
-
-                # Memória de Cálculo
-                elementos.append(PageBreak())
-                elementos.append(Paragraph("Memória de Cálculo", titulo_estilo))
-                elementos.append(Spacer(1, 0.25 * inch))
-
-                # Selecionar primeiro ano para demonstração
-                if st.session_state.resultados:
-                    primeiro_ano = min(anos_ordenados)
-                    memoria = st.session_state.memoria_calculo
-
-                    # Validação de dados
-                    elementos.append(Paragraph("Validação de Dados", subtitulo_estilo))
-                    if "validacao" in memoria and memoria["validacao"]:
-                        for linha in memoria["validacao"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    else:
-                        elementos.append(Paragraph("Dados validados com sucesso.", codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Base tributável
-                    elementos.append(Paragraph("Base Tributável", subtitulo_estilo))
-                    if "base_tributavel" in memoria and memoria["base_tributavel"]:
-                        for linha in memoria["base_tributavel"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Alíquotas
-                    elementos.append(Paragraph("Alíquotas", subtitulo_estilo))
-                    if "aliquotas" in memoria and memoria["aliquotas"]:
-                        for linha in memoria["aliquotas"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Cálculo da CBS
-                    elementos.append(Paragraph("Cálculo da CBS", subtitulo_estilo))
-                    if "cbs" in memoria and memoria["cbs"]:
-                        for linha in memoria["cbs"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Cálculo do IBS
-                    elementos.append(Paragraph("Cálculo do IBS", subtitulo_estilo))
-                    if "ibs" in memoria and memoria["ibs"]:
-                        for linha in memoria["ibs"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Nova página para o resto da memória
-                    elementos.append(PageBreak())
-
-                    # Cálculo dos Créditos
-                    elementos.append(Paragraph("Cálculo dos Créditos", subtitulo_estilo))
-                    if "creditos" in memoria and memoria["creditos"]:
-                        for linha in memoria["creditos"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Cálculo do Imposto Devido
-                    elementos.append(Paragraph("Cálculo do Imposto Devido", subtitulo_estilo))
-                    if "imposto_devido" in memoria and memoria["imposto_devido"]:
-                        for linha in memoria["imposto_devido"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Cálculo dos Impostos Atuais
-                    elementos.append(PageBreak())
-                    elementos.append(Paragraph("Cálculo dos Impostos Atuais", titulo_estilo))
-                    elementos.append(Spacer(1, 0.25 * inch))
-
-                    if "impostos_atuais" in memoria:
-                        # PIS
-                        elementos.append(Paragraph("PIS", subtitulo_estilo))
-                        if "PIS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["PIS"]:
-                            for linha in memoria["impostos_atuais"]["PIS"]:
-                                elementos.append(Paragraph(linha, codigo_estilo))
-                        elementos.append(Spacer(1, 0.1 * inch))
-
-                        # COFINS
-                        elementos.append(Paragraph("COFINS", subtitulo_estilo))
-                        if "COFINS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["COFINS"]:
-                            for linha in memoria["impostos_atuais"]["COFINS"]:
-                                elementos.append(Paragraph(linha, codigo_estilo))
-                        elementos.append(Spacer(1, 0.1 * inch))
-
-                        # ICMS (mais detalhado)
-                        elementos.append(Paragraph("ICMS", subtitulo_estilo))
-                        if "ICMS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["ICMS"]:
-                            for linha in memoria["impostos_atuais"]["ICMS"]:
-                                elementos.append(Paragraph(linha, codigo_estilo))
-                        elementos.append(Spacer(1, 0.1 * inch))
-
-                        elementos.append(PageBreak())
-
-                        # ISS
-                        elementos.append(Paragraph("ISS", subtitulo_estilo))
-                        if "ISS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["ISS"]:
-                            for linha in memoria["impostos_atuais"]["ISS"]:
-                                elementos.append(Paragraph(linha, codigo_estilo))
-                        elementos.append(Spacer(1, 0.1 * inch))
-
-                        # IPI
-                        elementos.append(Paragraph("IPI", subtitulo_estilo))
-                        if "IPI" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["IPI"]:
-                            for linha in memoria["impostos_atuais"]["IPI"]:
-                                elementos.append(Paragraph(linha, codigo_estilo))
-                        elementos.append(Spacer(1, 0.1 * inch))
-
-                        # Total Impostos Atuais
-                        elementos.append(Paragraph("Total Impostos Atuais", subtitulo_estilo))
-                        if "total" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["total"]:
-                            for linha in memoria["impostos_atuais"]["total"]:
-                                elementos.append(Paragraph(linha, codigo_estilo))
-                        elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Créditos Cruzados
-                    if "creditos_cruzados" in memoria and memoria["creditos_cruzados"]:
-                        elementos.append(Paragraph("Créditos Cruzados", subtitulo_estilo))
-                        for linha in memoria["creditos_cruzados"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                        elementos.append(Spacer(1, 0.1 * inch))
-
-                    # Total Devido
-                    elementos.append(Paragraph("Total Devido", subtitulo_estilo))
-                    if "total_devido" in memoria and memoria["total_devido"]:
-                        for linha in memoria["total_devido"]:
-                            elementos.append(Paragraph(linha, codigo_estilo))
-                    elementos.append(Spacer(1, 0.1 * inch))
-
-                # Rodapé
-                elementos.append(Spacer(1, 0.5 * inch))
-                elementos.append(Paragraph("© 2025 Expertzy Inteligência Tributária",
-                                           ParagraphStyle('rodape',
-                                                          parent=normal_estilo,
-                                                          alignment=1,  # centralizado
-                                                          fontSize=8,
-                                                          textColor=colors.darkgrey)))
-
-                # Construir o PDF
-                doc.build(elementos)
-
-                # Retornar o conteúdo do buffer
-                buffer.seek(0)
-                b64 = base64.b64encode(buffer.read()).decode()
-                return b64
-
-            except Exception as e:
-                import traceback
-                st.error(f"Erro ao gerar PDF: {e}")
-                st.error(traceback.format_exc())
-                return None
-
-        # Substituir no app.py a parte onde está o botão de exportação para PDF:
-        if st.button("Exportar para PDF", key="bt_pdf"):
-            with st.spinner("Gerando arquivo PDF..."):
-                b64_pdf = exportar_pdf()
-                if b64_pdf:
-                    href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="simulacao_iva_dual.pdf">Download do arquivo PDF</a>'
-                    st.markdown(href, unsafe_allow_html=True)
-        return output.getvalue()
-
-    return None
+def instantaneo_exportacao():
+    """Dados da simulação usados na exportação, copiados para serem lidos fora da thread do script."""
+    return {
+        "parametros": {chave: st.session_state.get(chave, padrao) for chave, padrao in PARAMETROS_EXPORTACAO.items()},
+        "resultados": st.session_state.resultados,
+        "aliquotas_equivalentes": st.session_state.aliquotas_equivalentes,
+        "memoria_calculo": st.session_state.memoria_calculo,
+        "indice_memoria": st.session_state.indice_memoria,
+        "icms_config": st.session_state.config.copiar("icms_config"),
+        "setores_especiais": st.session_state.config.copiar("setores_especiais")
+    }
 
 
 # Função para executar a simulação
@@ -1109,8 +175,8 @@ def executar_simulacao(dados_empresa, ano_inicial, ano_final):
     st.session_state.aliquota_saida = dados_empresa.get("aliquota_saida", 19)
 
     # Atualizar configurações do ICMS
-    st.session_state.config.icms_config["aliquota_entrada"] = dados_empresa.get("aliquota_entrada", 19) / 100
-    st.session_state.config.icms_config["aliquota_saida"] = dados_empresa.get("aliquota_saida", 19) / 100
+    st.session_state.config.editar("icms_config")["aliquota_entrada"] = dados_empresa.get("aliquota_entrada", 19) / 100
+    st.session_state.config.editar("icms_config")["aliquota_saida"] = dados_empresa.get("aliquota_saida", 19) / 100
 
     # Preparar dados para a simulação
     dados_simulacao = {
@@ -1123,27 +189,45 @@ def executar_simulacao(dados_empresa, ano_inicial, ano_final):
         "imposto_devido": 0  # Será calculado iterativamente
     }
 
+    # Setor e incidência definidos pela CNAE, quando informada
+    if dados_empresa.get("incidencia"):
+        dados_simulacao["cnae"] = dados_empresa.get("cnae")
+        dados_simulacao["incidencia"] = dados_empresa["incidencia"]
+
     # Definir anos para simulação
     anos = list(range(ano_inicial, ano_final + 1))
 
+    # Projeções de receita e custos (sem projeção, os mesmos dados valem para todos os anos)
+    projecoes = None
+    if dados_empresa.get("crescimento_receita") or dados_empresa.get("inflacao_custos"):
+        projecoes = {
+            "crescimento_receita": dados_empresa.get("crescimento_receita", 0) / 100,
+            "inflacao_custos": dados_empresa.get("inflacao_custos", 0) / 100
+        }
+
     try:
         # Executar simulação
-        resultados = st.session_state.calculadora_iva.calcular_comparativo(dados_simulacao, anos)
+        resultados = st.session_state.calculadora_iva.calcular_comparativo(dados_simulacao, anos, projecoes)
         st.session_state.resultados = resultados
+        st.session_state.impressao_resultados = impressao_digital(resultados)
 
-        # Calcular alíquotas equivalentes
+        # Calcular alíquotas equivalentes (com a receita e os custos projetados de cada ano)
         carga_atual = dados_empresa.get("carga_atual", 25)
         aliquotas_equivalentes = {}
+        dados_por_ano = (st.session_state.calculadora_iva.dados_projetados(dados_simulacao, anos, projecoes)
+                         if projecoes else dict.fromkeys(anos, dados_simulacao))
 
         for ano in anos:
             aliquotas_equivalentes[ano] = st.session_state.calculadora_iva.calcular_aliquotas_equivalentes(
-                dados_simulacao, carga_atual, ano
+                dados_por_ano[ano], carga_atual, ano
             )
 
         st.session_state.aliquotas_equivalentes = aliquotas_equivalentes
 
         # Obter memória de cálculo
         st.session_state.memoria_calculo = st.session_state.calculadora_iva.memoria_calculo
+        st.session_state.indice_memoria = st.session_state.calculadora_iva.indice_memoria
+        st.session_state.calculadora_iva.liberar_memoria()
 
         # Verificar dados específicos para incentivos de apuração
         for ano, resultado in resultados.items():
@@ -1161,6 +245,184 @@ def executar_simulacao(dados_empresa, ano_inicial, ano_final):
         return False
 
 
+def registrar_latencia(nome, inicio):
+    """Registra em ms o tempo de execução da página ou de um fragmento."""
+    st.session_state.latencias[nome] = (time.perf_counter() - inicio) * 1000
+
+
+def acompanhar_sessao():
+    """Registra a atividade da sessão no gerenciador de memória, reidratando os artefatos descarregados."""
+    contexto = get_script_run_ctx()
+    if contexto:
+        GERENCIADOR_SESSOES.iniciar_execucao(contexto.session_id, contexto.session_state)
+
+
+# Fragmentos da página de Simulação: cada um é reexecutado isoladamente quando seus widgets mudam
+@st.fragment
+def editor_incentivos(tipo, titulo, tipos_incentivo, rotulo_operacoes):
+    """Lista e formulário dos incentivos de um tipo (saida, entrada ou apuracao)."""
+    inicio = time.perf_counter()
+    acompanhar_sessao()
+    incentivos = st.session_state.config.icms_config[f"incentivos_{tipo}"]
+    st.subheader(f"Incentivos de {titulo}")
+
+    # A lista é preenchida depois do formulário, já com o incentivo adicionado (sem st.rerun)
+    lista = st.container()
+
+    # Formulário para adicionar novo incentivo
+    with st.form(key=f"form_incentivo_{tipo}"):
+        st.subheader(f"Adicionar Incentivo de {titulo}")
+
+        descricao = st.text_input("Descrição", value="", key=f"desc_{tipo}")
+        tipo_incentivo = st.selectbox("Tipo", tipos_incentivo, key=f"tipo_{tipo}")
+        percentual = st.number_input("Percentual do Incentivo (%)", min_value=0.0, max_value=100.0,
+                                     value=0.0, step=1.0, key=f"perc_{tipo}")
+        operacoes = st.number_input(rotulo_operacoes, min_value=0.0, max_value=100.0,
+                                    value=100.0, step=1.0, key=f"oper_{tipo}")
+        adicionar = st.form_submit_button("Adicionar")
+
+    if adicionar:
+        dados_incentivo = {
+            "descricao": descricao or f"Incentivo {titulo} {len(incentivos) + 1}",
+            "tipo": tipo_incentivo,
+            "percentual": percentual,
+            "perc_operacoes": operacoes
+        }
+        if adicionar_incentivo(tipo, dados_incentivo):
+            st.success(f"Incentivo de {titulo.lower()} adicionado com sucesso!")
+
+    # Listar incentivos existentes (a remoção é feita no callback, antes da reexecução do fragmento); a lista
+    # é lida de novo porque a primeira edição a copia da configuração base para a sessão
+    incentivos = st.session_state.config.icms_config[f"incentivos_{tipo}"]
+    with lista:
+        if incentivos:
+            st.write("Incentivos configurados:")
+            for i, incentivo in enumerate(incentivos):
+                col_inc1, col_inc2, col_inc3 = st.columns([3, 1, 1])
+                with col_inc1:
+                    st.write(f"{incentivo['descricao']} ({incentivo['tipo']})")
+                with col_inc2:
+                    st.write(f"{formatar_br(incentivo['percentual'] * 100)}%")
+                with col_inc3:
+                    st.button(f"Remover#{tipo[0]}{i}", key=f"remover_{tipo}_{i}",
+                              on_click=remover_incentivo, args=(tipo, i))
+
+    registrar_latencia(f"incentivos_{tipo}", inicio)
+
+
+@st.fragment
+def tabela_resultados():
+    """Tabela formatada dos resultados da simulação."""
+    inicio = time.perf_counter()
+    acompanhar_sessao()
+    st.subheader("Resultados da Simulação")
+
+    # Preparar dados para a tabela
+    dados_tabela = []
+    anos = sorted(st.session_state.resultados.keys())
+
+    for ano in anos:
+        resultado = st.session_state.resultados[ano]
+        valor_atual = st.session_state.aliquotas_equivalentes[ano]["valor_atual"]
+        diferenca = resultado["imposto_devido"] - valor_atual
+
+        dados_tabela.append({
+            "Ano": ano,
+            "CBS (R$)": resultado["cbs"],
+            "IBS (R$)": resultado["ibs"],
+            "Subtotal IVA (R$)": resultado["imposto_bruto"],
+            "Créditos (R$)": resultado["creditos"],
+            "IVA Devido (R$)": resultado["imposto_devido"],
+            "Saldo Credor Final (R$)": sum(resultado.get("saldos_finais", {}).values()),
+            "Impostos Atuais (R$)": resultado["impostos_atuais"]["total"],
+            "Total (R$)": resultado["total_devido"],
+            "Alíquota Efetiva (%)": resultado["aliquota_efetiva"] * 100,
+            "Variação (R$)": diferenca
+        })
+
+    # Converter para DataFrame
+    df_resultados = pd.DataFrame(dados_tabela)
+
+    # Formatar valores
+    cols_dinheiro = ["CBS (R$)", "IBS (R$)", "Subtotal IVA (R$)", "Créditos (R$)",
+                     "IVA Devido (R$)", "Saldo Credor Final (R$)", "Impostos Atuais (R$)", "Total (R$)",
+                     "Variação (R$)"]
+
+    for col in cols_dinheiro:
+        df_resultados[col] = df_resultados[col].apply(lambda x: f"R$ {formatar_br(x)}")
+
+    df_resultados["Alíquota Efetiva (%)"] = df_resultados["Alíquota Efetiva (%)"].apply(lambda x: f"{formatar_br(x)}%")
+
+    # Exibir tabela
+    st.dataframe(df_resultados.set_index("Ano"), use_container_width=True)
+    registrar_latencia("tabela_resultados", inicio)
+
+
+@st.fragment
+def grafico_resultados(funcao_grafico, titulo, chave):
+    """Um gráfico dos resultados (uma aba da Análise Gráfica)."""
+    inicio = time.perf_counter()
+    acompanhar_sessao()
+    grafico = funcao_grafico(st.session_state.resultados, titulo, st.session_state.impressao_resultados)
+    if grafico:
+        st.plotly_chart(grafico, use_container_width=True, key=chave)
+    registrar_latencia(chave, inicio)
+
+
+# Formatos de exportação: rótulo do botão, tipo MIME e nome do arquivo
+FORMATOS_EXPORTACAO = {
+    "excel": ("Exportar para Excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+              "simulacao_iva_dual.xlsx"),
+    "pdf": ("Exportar para PDF", "application/pdf", "simulacao_iva_dual.pdf")
+}
+
+
+@st.fragment
+def painel_exportacao():
+    """Botões de exportação dos resultados; os arquivos são gerados em segundo plano."""
+    inicio = time.perf_counter()
+    acompanhar_sessao()
+    st.subheader("Exportar Resultados")
+    colunas = st.columns(len(FORMATOS_EXPORTACAO))
+
+    for coluna, (formato, (rotulo, tipo_mime, nome_arquivo)) in zip(colunas, FORMATOS_EXPORTACAO.items()):
+        with coluna:
+            if st.button(rotulo, key=f"bt_{formato}"):
+                if not st.session_state.resultados:
+                    st.error("Execute uma simulação antes de exportar os resultados.")
+                else:
+                    st.session_state[f"tarefa_{formato}"] = servico_exportacao().solicitar(
+                        formato, instantaneo_exportacao())
+
+            chave = st.session_state.get(f"tarefa_{formato}")
+            tarefa = servico_exportacao().consultar(chave) if chave else None
+            if tarefa is None:
+                continue
+            if tarefa["estado"] in ("na_fila", "executando"):
+                andamento_exportacao(chave)
+            elif tarefa["estado"] == "erro":
+                st.error(f"Erro ao gerar o arquivo: {tarefa['erro']}")
+            else:
+                # Os bytes são lidos do serviço apenas no clique e servidos pelo endpoint de arquivos do Streamlit
+                st.download_button(f"Baixar arquivo ({formatar_br(tarefa['duracao'])} s)",
+                                   data=partial(servico_exportacao().arquivo, chave),
+                                   file_name=nome_arquivo, mime=tipo_mime, on_click="ignore",
+                                   key=f"download_{formato}")
+    registrar_latencia("exportacao", inicio)
+
+
+@st.fragment(run_every=1.0)
+def andamento_exportacao(chave):
+    """Progresso de uma exportação em andamento; ao terminar, a página é atualizada para exibir o arquivo."""
+    tarefa = servico_exportacao().consultar(chave)
+    if tarefa is None or tarefa["estado"] not in ("na_fila", "executando"):
+        st.rerun()
+    st.progress(tarefa["progresso"], text=f"Gerando arquivo: {tarefa['etapa']}")
+
+
+# Memória da sessão: artefatos descarregados em disco voltam antes da inicialização
+acompanhar_sessao()
+
 # Inicializar sessão
 inicializar_sessao()
 
@@ -1171,6 +433,21 @@ st.sidebar.image(
     use_container_width=True)
 opcao_sidebar = st.sidebar.radio("Navegação", ["Simulação", "Configurações", "Memória de Cálculo", "Sobre"])
 
+# Latências da última execução (página completa e fragmentos)
+if st.session_state.latencias:
+    with st.sidebar.expander("Desempenho", expanded=False):
+        for nome, latencia in st.session_state.latencias.items():
+            st.write(f"{nome}: {formatar_br(latencia)} ms")
+
+        # Memória medida ao fim da execução anterior de cada sessão
+        metricas_sessoes = GERENCIADOR_SESSOES.metricas()
+        contexto = get_script_run_ctx()
+        if contexto and contexto.session_id in metricas_sessoes:
+            st.write(f"Memória da sessão: {formatar_br(metricas_sessoes[contexto.session_id]['residente'] / 1024)} KB")
+        st.write(f"Sessões: {len(metricas_sessoes)} | residente: "
+                 f"{formatar_br(sum(m['residente'] for m in metricas_sessoes.values()) / 1024 ** 2)} MB | em disco: "
+                 f"{formatar_br(sum(m['em_disco'] for m in metricas_sessoes.values()) / 1024 ** 2)} MB")
+
 # Conteúdo principal
 if opcao_sidebar == "Simulação":
     st.title("Simulação do IVA Dual (CBS/IBS)")
@@ -1193,6 +470,8 @@ if opcao_sidebar == "Simulação":
                                                   format="%.2f")
 
             setor = st.selectbox("Setor de Atividade", list(st.session_state.config.setores_especiais.keys()))
+            cnae = st.text_input("CNAE - Subclasse (opcional)", value="",
+                                 help="Ex: 4711-3/01. Quando informada, define o setor e a incidência de ICMS/ISS/IPI.")
             regime = st.selectbox("Regime Tributário", ["real", "presumido", "simples"])
 
             # Parâmetros de ICMS
@@ -1214,21 +493,42 @@ if opcao_sidebar == "Simulação":
             carga_atual = st.number_input("Carga Tributária Atual Estimada (%)", min_value=0.0, max_value=100.0,
                                           value=25.0, step=0.5, format="%.2f")
 
+            # Projeções anuais (o ano inicial é a base)
+            st.subheader("Projeções")
+            crescimento_receita = st.number_input("Crescimento Anual da Receita (%)", min_value=-100.0, value=0.0,
+                                                  step=0.5, format="%.2f")
+            inflacao_custos = st.number_input("Inflação Anual dos Custos (%)", min_value=-100.0, value=0.0,
+                                              step=0.5, format="%.2f")
+
             # Botão para simular
             simular = st.form_submit_button("Simular")
 
         # Processar simulação se o botão for clicado
         if simular:
+            incidencia = None
+            if cnae.strip():
+                try:
+                    classificacao = carregar_recursos()["taxonomia"].classificar(cnae)
+                    setor = classificacao["setor"]
+                    incidencia = classificacao["incidencia"]
+                    st.info(f"CNAE {cnae}: {classificacao['descricao']} (setor {setor})")
+                except ValueError as e:
+                    st.error(str(e))
+
             dados_empresa = {
                 "faturamento": faturamento,
                 "custos_tributaveis": custos,
                 "custos_simples": custos_simples,
                 "creditos_anteriores": creditos_anteriores,
                 "setor": setor,
+                "cnae": cnae.strip(),
+                "incidencia": incidencia,
                 "regime": regime,
                 "aliquota_entrada": aliquota_entrada,
                 "aliquota_saida": aliquota_saida,
-                "carga_atual": carga_atual
+                "carga_atual": carga_atual,
+                "crescimento_receita": crescimento_receita,
+                "inflacao_custos": inflacao_custos
             }
 
             with st.spinner("Executando simulação..."):
@@ -1237,188 +537,34 @@ if opcao_sidebar == "Simulação":
                 if sucesso:
                     st.success("Simulação concluída com sucesso!")
 
-        # Incentivos fiscais (expander)
+        # Incentivos fiscais (expander): cada tipo é um fragmento, reexecutado sem a página inteira
         with st.expander("Incentivos Fiscais de ICMS"):
             # Tabs para separar os tipos de incentivos
             tab_saida, tab_entrada, tab_apuracao = st.tabs(
                 ["Incentivos de Saída", "Incentivos de Entrada", "Incentivos de Apuração"])
 
-            # Incentivos de Saída
             with tab_saida:
-                st.subheader("Incentivos de Saída")
-
-                # Listar incentivos existentes
-                if st.session_state.config.icms_config["incentivos_saida"]:
-                    st.write("Incentivos configurados:")
-                    for i, incentivo in enumerate(st.session_state.config.icms_config["incentivos_saida"]):
-                        col_inc1, col_inc2, col_inc3 = st.columns([3, 1, 1])
-                        with col_inc1:
-                            st.write(f"{incentivo['descricao']} ({incentivo['tipo']})")
-                        with col_inc2:
-                            st.write(f"{formatar_br(incentivo['percentual'] * 100)}%")
-                        with col_inc3:
-                            if st.button(f"Remover#s{i}", key=f"remover_saida_{i}"):
-                                remover_incentivo("saida", i)
-                                st.rerun()
-
-                # Formulário para adicionar novo incentivo
-                with st.form(key="form_incentivo_saida"):
-                    st.subheader("Adicionar Incentivo de Saída")
-
-                    desc_saida = st.text_input("Descrição", value="", key="desc_saida")
-                    tipo_saida = st.selectbox(
-                        "Tipo",
-                        ["Nenhum", "Redução de Alíquota", "Crédito Presumido/Outorgado", "Redução de Base de Cálculo",
-                         "Diferimento"],
-                        key="tipo_saida"
-                    )
-                    perc_saida = st.number_input("Percentual do Incentivo (%)", min_value=0.0, max_value=100.0,
-                                                 value=0.0, step=1.0, key="perc_saida")
-                    oper_saida = st.number_input("Percentual de Operações (%)", min_value=0.0, max_value=100.0,
-                                                 value=100.0, step=1.0, key="oper_saida")
-                    adicionar_saida = st.form_submit_button("Adicionar")
-
-                if adicionar_saida:
-                    dados_incentivo = {
-                        "descricao": desc_saida or f"Incentivo Saída {len(st.session_state.config.icms_config['incentivos_saida']) + 1}",
-                        "tipo": tipo_saida,
-                        "percentual": perc_saida,
-                        "perc_operacoes": oper_saida
-                    }
-                    if adicionar_incentivo("saida", dados_incentivo):
-                        st.success("Incentivo de saída adicionado com sucesso!")
-                        st.rerun()
-
-            # Incentivos de Entrada
+                editor_incentivos("saida", "Saída",
+                                  ["Nenhum", "Redução de Alíquota", "Crédito Presumido/Outorgado",
+                                   "Redução de Base de Cálculo", "Diferimento"],
+                                  "Percentual de Operações (%)")
+
             with tab_entrada:
-                st.subheader("Incentivos de Entrada")
-
-                # Listar incentivos existentes
-                if st.session_state.config.icms_config["incentivos_entrada"]:
-                    st.write("Incentivos configurados:")
-                    for i, incentivo in enumerate(st.session_state.config.icms_config["incentivos_entrada"]):
-                        col_inc1, col_inc2, col_inc3 = st.columns([3, 1, 1])
-                        with col_inc1:
-                            st.write(f"{incentivo['descricao']} ({incentivo['tipo']})")
-                        with col_inc2:
-                            st.write(f"{formatar_br(incentivo['percentual'] * 100)}%")
-                        with col_inc3:
-                            if st.button(f"Remover#e{i}", key=f"remover_entrada_{i}"):
-                                remover_incentivo("entrada", i)
-                                st.rerun()
-
-                # Formulário para adicionar novo incentivo
-                with st.form(key="form_incentivo_entrada"):
-                    st.subheader("Adicionar Incentivo de Entrada")
-
-                    desc_entrada = st.text_input("Descrição", value="", key="desc_entrada")
-                    tipo_entrada = st.selectbox(
-                        "Tipo",
-                        ["Nenhum", "Redução de Alíquota", "Crédito Presumido/Outorgado", "Redução de Base de Cálculo", "Estorno de Crédito"],
-                        key="tipo_entrada"
-                    )
-                    perc_entrada = st.number_input("Percentual do Incentivo (%)", min_value=0.0, max_value=100.0, value=0.0, step=1.0, key="perc_entrada")
-                    oper_entrada = st.number_input("Percentual de Operações (%)", min_value=0.0, max_value=100.0, value=100.0, step=1.0, key="oper_entrada")
-
-                    adicionar_entrada = st.form_submit_button("Adicionar")
-
-                if adicionar_entrada:
-                    dados_incentivo = {
-                        "descricao": desc_entrada or f"Incentivo Entrada {len(st.session_state.config.icms_config['incentivos_entrada']) + 1}",
-                        "tipo": tipo_entrada,
-                        "percentual": perc_entrada,
-                        "perc_operacoes": oper_entrada
-                    }
-                    if adicionar_incentivo("entrada", dados_incentivo):
-                        st.success("Incentivo de entrada adicionado com sucesso!")
-                        st.rerun()
-
-            # Incentivos de Apuração
+                editor_incentivos("entrada", "Entrada",
+                                  ["Nenhum", "Redução de Alíquota", "Crédito Presumido/Outorgado",
+                                   "Redução de Base de Cálculo", "Estorno de Crédito"],
+                                  "Percentual de Operações (%)")
+
             with tab_apuracao:
-                st.subheader("Incentivos de Apuração")
-
-                # Listar incentivos existentes
-                if st.session_state.config.icms_config["incentivos_apuracao"]:
-                    st.write("Incentivos configurados:")
-                    for i, incentivo in enumerate(st.session_state.config.icms_config["incentivos_apuracao"]):
-                        col_inc1, col_inc2, col_inc3 = st.columns([3, 1, 1])
-                        with col_inc1:
-                            st.write(f"{incentivo['descricao']} ({incentivo['tipo']})")
-                        with col_inc2:
-                            st.write(f"{formatar_br(incentivo['percentual'] * 100)}%")
-                        with col_inc3:
-                            if st.button(f"Remover#a{i}", key=f"remover_apuracao_{i}"):
-                                remover_incentivo("apuracao", i)
-                                st.rerun()
-
-                # Formulário para adicionar novo incentivo
-                with st.form(key="form_incentivo_apuracao"):
-                    st.subheader("Adicionar Incentivo de Apuração")
-
-                    desc_apuracao = st.text_input("Descrição", value="", key="desc_apuracao")
-                    tipo_apuracao = st.selectbox(
-                        "Tipo",
-                        ["Nenhum", "Crédito Presumido/Outorgado", "Redução do Saldo Devedor"],
-                        key="tipo_apuracao"
-                    )
-                    perc_apuracao = st.number_input("Percentual do Incentivo (%)", min_value=0.0, max_value=100.0, value=0.0, step=1.0, key="perc_apuracao")
-                    oper_apuracao = st.number_input("Percentual do Saldo (%)", min_value=0.0, max_value=100.0, value=100.0, step=1.0, key="oper_apuracao")
-
-                    adicionar_apuracao = st.form_submit_button("Adicionar")
-
-                if adicionar_apuracao:
-                    dados_incentivo = {
-                        "descricao": desc_apuracao or f"Incentivo Apuração {len(st.session_state.config.icms_config['incentivos_apuracao']) + 1}",
-                        "tipo": tipo_apuracao,
-                        "percentual": perc_apuracao,
-                        "perc_operacoes": oper_apuracao
-                    }
-                    if adicionar_incentivo("apuracao", dados_incentivo):
-                        st.success("Incentivo de apuração adicionado com sucesso!")
-                        st.rerun()
+                editor_incentivos("apuracao", "Apuração",
+                                  ["Nenhum", "Crédito Presumido/Outorgado", "Redução do Saldo Devedor"],
+                                  "Percentual do Saldo (%)")
 
     # Coluna para exibição dos resultados
     with col2:
         if st.session_state.resultados:
-            # Exibir tabela de resultados
-            st.subheader("Resultados da Simulação")
-
-            # Preparar dados para a tabela
-            dados_tabela = []
-            anos = sorted(st.session_state.resultados.keys())
-
-            for ano in anos:
-                resultado = st.session_state.resultados[ano]
-                valor_atual = st.session_state.aliquotas_equivalentes[ano]["valor_atual"]
-                diferenca = resultado["imposto_devido"] - valor_atual
-
-                dados_tabela.append({
-                    "Ano": ano,
-                    "CBS (R$)": resultado["cbs"],
-                    "IBS (R$)": resultado["ibs"],
-                    "Subtotal IVA (R$)": resultado["imposto_bruto"],
-                    "Créditos (R$)": resultado["creditos"],
-                    "IVA Devido (R$)": resultado["imposto_devido"],
-                    "Impostos Atuais (R$)": resultado["impostos_atuais"]["total"],
-                    "Total (R$)": resultado["total_devido"],
-                    "Alíquota Efetiva (%)": resultado["aliquota_efetiva"] * 100,
-                    "Variação (R$)": diferenca
-                })
-
-            # Converter para DataFrame
-            df_resultados = pd.DataFrame(dados_tabela)
-
-            # Formatar valores
-            cols_dinheiro = ["CBS (R$)", "IBS (R$)", "Subtotal IVA (R$)", "Créditos (R$)",
-                            "IVA Devido (R$)", "Impostos Atuais (R$)", "Total (R$)", "Variação (R$)"]
-
-            for col in cols_dinheiro:
-                df_resultados[col] = df_resultados[col].apply(lambda x: f"R$ {formatar_br(x)}")
-
-            df_resultados["Alíquota Efetiva (%)"] = df_resultados["Alíquota Efetiva (%)"].apply(lambda x: f"{formatar_br(x)}%")
-
-            # Exibir tabela
-            st.dataframe(df_resultados.set_index("Ano"), use_container_width=True)
+            # Tabela, gráficos e exportação em fragmentos independentes
+            tabela_resultados()
 
             # Exibir gráficos
             st.subheader("Análise Gráfica")
@@ -1427,44 +573,18 @@ if opcao_sidebar == "Simulação":
             tab_comp, tab_aliq, tab_trans, tab_inc = st.tabs(["Composição Tributária", "Alíquota Efetiva", "Evolução na Transição", "Impacto dos Incentivos"])
 
             with tab_comp:
-                grafico_comp = criar_grafico_comparativo(st.session_state.resultados, "Comparativo de Impostos por Ano")
-                if grafico_comp:
-                    st.plotly_chart(grafico_comp, use_container_width=True)
+                grafico_resultados(criar_grafico_comparativo, "Comparativo de Impostos por Ano", "grafico_comp")
 
             with tab_aliq:
-                grafico_aliq = criar_grafico_aliquotas(st.session_state.resultados, "Evolução da Alíquota Efetiva")
-                if grafico_aliq:
-                    st.plotly_chart(grafico_aliq, use_container_width=True)
+                grafico_resultados(criar_grafico_aliquotas, "Evolução da Alíquota Efetiva", "grafico_aliq")
 
             with tab_trans:
-                grafico_trans = criar_grafico_transicao(st.session_state.resultados, "Evolução Tributária na Transição")
-                if grafico_trans:
-                    st.plotly_chart(grafico_trans, use_container_width=True)
+                grafico_resultados(criar_grafico_transicao, "Evolução Tributária na Transição", "grafico_trans")
 
             with tab_inc:
-                grafico_inc = criar_grafico_incentivos(st.session_state.resultados, "Impacto dos Incentivos Fiscais no ICMS")
-                if grafico_inc:
-                    st.plotly_chart(grafico_inc, use_container_width=True)
-
-            # Botões para exportar resultados
-            st.subheader("Exportar Resultados")
-            col_exp1, col_exp2 = st.columns(2)
-
-            with col_exp1:
-                if st.button("Exportar para Excel", key="bt_excel"):
-                    with st.spinner("Gerando arquivo Excel..."):
-                        b64_excel = exportar_excel()
-                        if b64_excel:
-                            href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64_excel}" download="simulacao_iva_dual.xlsx">Download do arquivo Excel</a>'
-                            st.markdown(href, unsafe_allow_html=True)
-
-            with col_exp2:
-                if st.button("Exportar para PDF", key="bt_pdf"):
-                    with st.spinner("Gerando arquivo PDF..."):
-                        b64_pdf = exportar_pdf()
-                        if b64_pdf:
-                            href = f'<a href="data:application/pdf;base64,{b64_pdf}" download="simulacao_iva_dual.pdf">Download do arquivo PDF</a>'
-                            st.markdown(href, unsafe_allow_html=True)
+                grafico_resultados(criar_grafico_incentivos, "Impacto dos Incentivos Fiscais no ICMS", "grafico_inc")
+
+            painel_exportacao()
 
 # Tab de Configurações
 elif opcao_sidebar == "Configurações":
@@ -1503,8 +623,8 @@ elif opcao_sidebar == "Configurações":
             )
 
         if st.button("Atualizar Alíquotas Base", key="update_aliq"):
-            st.session_state.config.aliquotas_base["CBS"] = cbs_aliq / 100
-            st.session_state.config.aliquotas_base["IBS"] = ibs_aliq / 100
+            st.session_state.config.editar("aliquotas_base")["CBS"] = cbs_aliq / 100
+            st.session_state.config.editar("aliquotas_base")["IBS"] = ibs_aliq / 100
             st.success("Alíquotas base atualizadas com sucesso!")
 
     # Tab Fases de Transição
@@ -1538,7 +658,7 @@ elif opcao_sidebar == "Configurações":
 
         if st.button("Atualizar Fases de Transição", key="update_fases"):
             for ano, valor in valores_fases.items():
-                st.session_state.config.fase_transicao[ano] = valor
+                st.session_state.config.editar("fase_transicao")[ano] = valor
             st.success("Fases de transição atualizadas com sucesso!")
 
     # Tab Setores
@@ -1566,9 +686,10 @@ elif opcao_sidebar == "Configurações":
 
         if st.button("Atualizar Configurações Setoriais", key="update_setores"):
             # Atualizar as configurações com os valores editados
+            setores_especiais = st.session_state.config.editar("setores_especiais")
             for i, setor in enumerate(edited_df["Setor"]):
-                st.session_state.config.setores_especiais[setor]["IBS"] = edited_df.iloc[i]["IBS (%)"] / 100
-                st.session_state.config.setores_especiais[setor]["reducao_CBS"] = edited_df.iloc[i]["Redução CBS (%)"] / 100
+                setores_especiais[setor]["IBS"] = edited_df.iloc[i]["IBS (%)"] / 100
+                setores_especiais[setor]["reducao_CBS"] = edited_df.iloc[i]["Redução CBS (%)"] / 100
 
             st.success("Configurações setoriais atualizadas com sucesso!")
 
@@ -1630,174 +751,58 @@ elif opcao_sidebar == "Memória de Cálculo":
         # Obter memória de cálculo
         memoria = st.session_state.memoria_calculo
 
+        # Consulta ao índice com a memória de todos os anos da simulação
+        consulta = st.text_input("Buscar em todos os anos (ex: crédito presumido ano:2028..2032, 40%, 1.000..5.000)",
+                                 value="", key="consulta_indice_memoria").strip()
+        if consulta:
+            encontradas = st.session_state.indice_memoria.consultar(consulta)
+            st.caption(f"{len(encontradas)} linhas encontradas")
+            if encontradas:
+                titulos = {"/".join(caminho): titulo for titulo, caminho in SECOES_MEMORIA}
+                linhas = [f"[{item['ano'] or '-'}] {titulos.get(item['secao'], item['secao'])}: {item['linha']}"
+                          for item in encontradas]
+                pagina = 1
+                if len(linhas) > LINHAS_POR_PAGINA:
+                    total_paginas = -(-len(linhas) // LINHAS_POR_PAGINA)
+                    pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas,
+                                             value=1, step=1, key="pagina_indice_memoria")
+                bloco, _ = paginar_linhas(linhas, pagina)
+                st.text(bloco)
+
         if memoria:
-            # Exibir em seções expansíveis
             st.subheader(f"Memória de Cálculo - Ano {ano_selecionado}")
 
-            # Validação de dados
-            with st.expander("Validação de Dados", expanded=False):
-                for linha in memoria.get("validacao", []):
-                    st.write(linha)
-
-            # Base tributável
-            with st.expander("Base Tributável", expanded=False):
-                for linha in memoria.get("base_tributavel", []):
-                    st.write(linha)
-
-            # Alíquotas
-            with st.expander("Alíquotas", expanded=False):
-                for linha in memoria.get("aliquotas", []):
-                    st.write(linha)
-
-            # CBS
-            with st.expander("Cálculo da CBS", expanded=False):
-                for linha in memoria.get("cbs", []):
-                    st.write(linha)
-
-            # IBS
-            with st.expander("Cálculo do IBS", expanded=False):
-                for linha in memoria.get("ibs", []):
-                    st.write(linha)
-
-            # Créditos
-            with st.expander("Cálculo dos Créditos", expanded=False):
-                for linha in memoria.get("creditos", []):
-                    st.write(linha)
-
-            # Imposto devido
-            with st.expander("Cálculo do Imposto Devido", expanded=False):
-                for linha in memoria.get("imposto_devido", []):
-                    st.write(linha)
-
-            # Impostos Atuais
-            with st.expander("Cálculo dos Impostos Atuais", expanded=True):
-                # PIS
-                st.markdown("**PIS:**")
-                for linha in memoria.get("impostos_atuais", {}).get("PIS", []):
-                    st.write(linha)
-
-                # COFINS
-                st.markdown("**COFINS:**")
-                for linha in memoria.get("impostos_atuais", {}).get("COFINS", []):
-                    st.write(linha)
-
-                # ICMS
-                st.markdown("**ICMS:**")
-                for linha in memoria.get("impostos_atuais", {}).get("ICMS", []):
-                    st.write(linha)
-
-                # ISS
-                st.markdown("**ISS:**")
-                for linha in memoria.get("impostos_atuais", {}).get("ISS", []):
-                    st.write(linha)
-
-                # IPI
-                st.markdown("**IPI:**")
-                for linha in memoria.get("impostos_atuais", {}).get("IPI", []):
-                    st.write(linha)
-
-                # Total Impostos Atuais
-                st.markdown("**Total Impostos Atuais:**")
-                for linha in memoria.get("impostos_atuais", {}).get("total", []):
-                    st.write(linha)
-
-            # Créditos Cruzados
-            if memoria.get("creditos_cruzados"):
-                with st.expander("Créditos Cruzados", expanded=False):
-                    for linha in memoria.get("creditos_cruzados", []):
-                        st.write(linha)
-
-            # Total Devido
-            with st.expander("Total Devido", expanded=False):
-                for linha in memoria.get("total_devido", []):
-                    st.write(linha)
-
-            # Opção para exportar a memória de cálculo
-            if st.button("Exportar Memória de Cálculo", key="export_memoria"):
-                try:
-                    # Criar uma string formatada com a memória de cálculo
-                    texto_memoria = f"MEMÓRIA DE CÁLCULO - ANO {ano_selecionado}\n\n"
-
-                    # Adicionar seções
-                    texto_memoria += "=== VALIDAÇÃO DE DADOS ===\n"
-                    for linha in memoria.get("validacao", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    texto_memoria += "=== BASE TRIBUTÁVEL ===\n"
-                    for linha in memoria.get("base_tributavel", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    texto_memoria += "=== ALÍQUOTAS ===\n"
-                    for linha in memoria.get("aliquotas", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    texto_memoria += "=== CÁLCULO DA CBS ===\n"
-                    for linha in memoria.get("cbs", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    texto_memoria += "=== CÁLCULO DO IBS ===\n"
-                    for linha in memoria.get("ibs", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    texto_memoria += "=== CÁLCULO DOS CRÉDITOS ===\n"
-                    for linha in memoria.get("creditos", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    texto_memoria += "=== CÁLCULO DO IMPOSTO DEVIDO ===\n"
-                    for linha in memoria.get("imposto_devido", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    texto_memoria += "=== CÁLCULO DOS IMPOSTOS ATUAIS ===\n"
-
-                    texto_memoria += "\n--- PIS ---\n"
-                    for linha in memoria.get("impostos_atuais", {}).get("PIS", []):
-                        texto_memoria += f"{linha}\n"
-
-                    texto_memoria += "\n--- COFINS ---\n"
-                    for linha in memoria.get("impostos_atuais", {}).get("COFINS", []):
-                        texto_memoria += f"{linha}\n"
-
-                    texto_memoria += "\n--- ICMS ---\n"
-                    for linha in memoria.get("impostos_atuais", {}).get("ICMS", []):
-                        texto_memoria += f"{linha}\n"
-
-                    texto_memoria += "\n--- ISS ---\n"
-                    for linha in memoria.get("impostos_atuais", {}).get("ISS", []):
-                        texto_memoria += f"{linha}\n"
-
-                    texto_memoria += "\n--- IPI ---\n"
-                    for linha in memoria.get("impostos_atuais", {}).get("IPI", []):
-                        texto_memoria += f"{linha}\n"
-
-                    texto_memoria += "\n--- TOTAL IMPOSTOS ATUAIS ---\n"
-                    for linha in memoria.get("impostos_atuais", {}).get("total", []):
-                        texto_memoria += f"{linha}\n"
-                    texto_memoria += "\n"
-
-                    if memoria.get("creditos_cruzados"):
-                        texto_memoria += "=== CRÉDITOS CRUZADOS ===\n"
-                        for linha in memoria.get("creditos_cruzados", []):
-                            texto_memoria += f"{linha}\n"
-                        texto_memoria += "\n"
-
-                    texto_memoria += "=== TOTAL DEVIDO ===\n"
-                    for linha in memoria.get("total_devido", []):
-                        texto_memoria += f"{linha}\n"
-
-                    # Gerar arquivo para download
-                    b64 = base64.b64encode(texto_memoria.encode()).decode()
-                    href = f'<a href="data:file/txt;base64,{b64}" download="memoria_calculo_{ano_selecionado}.txt">Baixar arquivo de memória de cálculo</a>'
-                    st.markdown(href, unsafe_allow_html=True)
-
-                except Exception as e:
-                    st.error(f"Erro ao exportar memória de cálculo: {str(e)}")
+            # Busca: seções com resultados são abertas e mostram apenas as linhas encontradas
+            busca = st.text_input("Buscar na memória de cálculo", value="", key="busca_memoria").strip().lower()
+
+            # Cada seção é um único bloco de texto, renderizado apenas quando aberta e paginado
+            for i, (titulo_secao, caminho) in enumerate(SECOES_MEMORIA):
+                linhas = linhas_memoria(memoria, caminho)
+                if busca:
+                    linhas = [linha for linha in linhas if busca in str(linha).lower()]
+                if not linhas:
+                    continue
+
+                aberta = st.toggle(f"{titulo_secao} ({len(linhas)} linhas)",
+                                   value=bool(busca) or caminho[0] == "impostos_atuais",
+                                   key=f"secao_memoria_{i}")
+                if not aberta:
+                    continue
+
+                pagina = 1
+                if len(linhas) > LINHAS_POR_PAGINA:
+                    total_paginas = -(-len(linhas) // LINHAS_POR_PAGINA)
+                    pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas,
+                                             value=1, step=1, key=f"pagina_memoria_{i}")
+                bloco, _ = paginar_linhas(linhas, pagina)
+                st.text(bloco)
+
+            # Opção para exportar a memória de cálculo (arquivo gerado no clique, em cache pelo conteúdo da memória)
+            st.download_button("Exportar Memória de Cálculo",
+                               data=partial(arquivo_memoria_calculo, memoria,
+                                            f"MEMÓRIA DE CÁLCULO - ANO {ano_selecionado}"),
+                               file_name=f"memoria_calculo_{ano_selecionado}.txt", mime="text/plain",
+                               on_click="ignore", key="export_memoria")
 
 # Tab Sobre
 elif opcao_sidebar == "Sobre":
@@ -1872,15 +877,30 @@ elif opcao_sidebar == "Sobre":
         
         **Tecnologias Utilizadas:**
         - Python 3.9+
-        - Streamlit 1.32.0+
+        - Streamlit 1.52.0+
         - Pandas, NumPy, Matplotlib
         - Plotly
         
         **Estrutura do Código:**
         - `app.py`: Aplicação principal (interface Streamlit)
-        - `config.py`: Configurações tributárias
+        - `config.py`: Configurações tributárias (padrão compartilhada entre sessões e sobreposição por sessão)
         - `calculadoras.py`: Classes de cálculo (CalculadoraTributosAtuais, CalculadoraIVADual)
         - `utils.py`: Funções utilitárias
+        - `apuracao.py`: Livro de apuração plurianual com transporte de saldos credores (CBS, IBS, ICMS)
+        - `taxonomia.py`: Taxonomia setorial indexada pela CNAE (setor do IVA Dual e incidência de ICMS/ISS/IPI)
+        - `mensal.py`: Simulação mensal (2026-2033) com saldos credores, diferimento e desembolso de caixa
+        - `capital_giro.py`: Capital de giro diário com split payment da CBS/IBS e custo de financiamento
+        - `insumo_produto.py`: Modelo de Leontief para a carga tributária embutida ao longo das cadeias produtivas
+        - `cadeia.py`: Grafo de compras intragrupo com propagação esparsa de débitos e créditos
+        - `fornecedores.py`: Cadastro CNPJ → regime com índice hash em memória mapeada e créditos a partir do razão de compras
+        - `simples.py`: DAS do Simples Nacional (Anexos I a V) e comparação com o regime regular do IVA Dual
+        - `otimizador.py`: Otimizador da escolha de regime (Real, Presumido, Simples e Simples híbrido) por empresa e ano
+        - `icms_interestadual.py`: Matriz 27 × 27 de alíquotas de ICMS, FCP e DIFAL para operações entre UFs
+        - `distribuicao_ibs.py`: Repartição do IBS por destino entre estados e municípios
+        - `iss_municipal.py`: Alíquotas de ISS por município e item da LC 116/2003 (índice de chave composta)
+        - `indice_memoria.py`: Índice invertido da memória de cálculo de todos os anos (termos e faixas numéricas)
+        - `sessao.py`: Orçamento de memória por sessão e descarga em disco dos artefatos das sessões ociosas
+        - `exportacao.py`: Geração dos arquivos Excel e PDF em segundo plano (asyncio e pool de threads) com cache por simulação
         
         **Licença de Uso:**
         Este software é proprietário e sua distribuição, modificação ou uso comercial sem autorização é proibido.
@@ -1888,4 +908,8 @@ elif opcao_sidebar == "Sobre":
 
 # Rodapé
 st.markdown("---")
-st.markdown("© 2025 Expertzy Inteligência Tributária. Todos os direitos reservados.")
\ No newline at end of file
+st.markdown("© 2025 Expertzy Inteligência Tributária. Todos os direitos reservados.")
+# Latência da execução completa da página e memória residente da sessão
+registrar_latencia("pagina", inicio_execucao)
+if get_script_run_ctx():
+    GERENCIADOR_SESSOES.finalizar_execucao(get_script_run_ctx().session_id, list(st.session_state.keys()))
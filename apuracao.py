@@ -0,0 +1,74 @@
+import numpy as np
+
+
+# Tributos com saldo credor transportado entre períodos
+TRIBUTOS_SALDO = ("CBS", "IBS", "ICMS")
+
+
+def compensar_creditos(debito, creditos, saldo_anterior):
+    """Compensa o débito do período com os créditos do período e o saldo credor anterior.
+
+    Funciona com valores escalares ou arrays NumPy. Retorna o valor devido, o crédito utilizado
+    e o saldo credor a transportar para o período seguinte.
+    """
+    disponivel = saldo_anterior + creditos
+    devido = np.maximum(0, debito - disponivel)
+    utilizado = np.minimum(debito, disponivel)
+    saldo_final = disponivel - utilizado
+    return devido, utilizado, saldo_final
+
+
+def dividir_saldo_inicial(valor, aliquota_cbs, aliquota_ibs):
+    """Divide um saldo credor único (ex: `creditos_anteriores`) entre CBS e IBS pela proporção das alíquotas."""
+    total = aliquota_cbs + aliquota_ibs
+    proporcao_cbs = np.divide(aliquota_cbs, total, out=np.zeros_like(np.asarray(total, dtype=float)),
+                              where=np.asarray(total) > 0)
+    return valor * proporcao_cbs, valor * (1 - proporcao_cbs)
+
+
+class LivroCreditos:
+    """Livro de apuração plurianual com transporte de saldos credores de CBS, IBS e ICMS.
+
+    A dependência entre anos é resolvida por um laço sobre os anos (poucas iterações), enquanto cada
+    passo é vetorizado sobre todas as empresas da carteira.
+    """
+
+    def __init__(self, saldos_iniciais):
+        # Saldos no formato empresa × tributo (ordem de TRIBUTOS_SALDO)
+        self.saldos_iniciais = np.asarray(saldos_iniciais, dtype=float)
+        self.saldos = self.saldos_iniciais.copy()
+
+    def lancar(self, debitos, creditos):
+        """Apura um período: débitos e créditos no formato empresa × tributo."""
+        saldo_anterior = self.saldos
+        devido, utilizado, self.saldos = compensar_creditos(debitos, creditos, saldo_anterior)
+        return {
+            "saldo_inicial": saldo_anterior,
+            "devido": devido,
+            "utilizado": utilizado,
+            "saldo_final": self.saldos
+        }
+
+    def executar(self, debitos, creditos):
+        """Apura todos os anos em sequência: débitos e créditos no formato ano × empresa × tributo."""
+        debitos = np.asarray(debitos, dtype=float)
+        creditos = np.asarray(creditos, dtype=float)
+
+        saldo_inicial = np.empty_like(debitos)
+        devido = np.empty_like(debitos)
+        utilizado = np.empty_like(debitos)
+        saldo_final = np.empty_like(debitos)
+
+        for i in range(debitos.shape[0]):
+            periodo = self.lancar(debitos[i], creditos[i])
+            saldo_inicial[i] = periodo["saldo_inicial"]
+            devido[i] = periodo["devido"]
+            utilizado[i] = periodo["utilizado"]
+            saldo_final[i] = periodo["saldo_final"]
+
+        return {
+            "saldo_inicial": saldo_inicial,
+            "devido": devido,
+            "utilizado": utilizado,
+            "saldo_final": saldo_final
+        }
@@ -0,0 +1,178 @@
+import numpy as np
+
+from apuracao import LivroCreditos
+from calculadoras import CalculadoraIVADual, CalculadoraTributosAtuais, preparar_lote
+
+# Regimes das entidades do grupo (fornecedores do Simples e rurais seguem regras_credito)
+REGIMES = ("real", "presumido", "simples", "rural")
+
+
+class MatrizEsparsa:
+    """Matriz esparsa no formato CSR, implementada apenas com NumPy (sem SciPy).
+
+    Criada a partir de arestas (linha, coluna, valor); arestas repetidas são somadas.
+    """
+
+    def __init__(self, linhas, colunas, valores, forma):
+        linhas = np.asarray(linhas, dtype=np.int64)
+        colunas = np.asarray(colunas, dtype=np.int64)
+        valores = np.asarray(valores, dtype=float)
+
+        ordem = np.lexsort((colunas, linhas))
+        self.linhas = linhas[ordem]
+        self.colunas = colunas[ordem]
+        self.valores = valores[ordem]
+        self.forma = forma
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(self.linhas, minlength=forma[0]))))
+
+    def transposta(self):
+        """Retorna a matriz transposta."""
+        return MatrizEsparsa(self.colunas, self.linhas, self.valores, (self.forma[1], self.forma[0]))
+
+    def multiplicar(self, x):
+        """Produto matriz × vetor (ou matriz densa coluna × k), por soma segmentada das linhas."""
+        x = np.asarray(x, dtype=float)
+        resultado = np.zeros((self.forma[0],) + x.shape[1:])
+        if self.valores.size == 0:
+            return resultado
+
+        produtos = x[self.colunas] * self.valores.reshape((-1,) + (1,) * (x.ndim - 1))
+        nao_vazias = np.flatnonzero(np.diff(self.indptr))
+        resultado[nao_vazias] = np.add.reduceat(produtos, self.indptr[nao_vazias], axis=0)
+        return resultado
+
+    def somar_linhas(self):
+        """Soma dos valores de cada linha."""
+        return np.bincount(self.linhas, weights=self.valores, minlength=self.forma[0])
+
+
+class CadeiaSuprimentos:
+    """Simulação de um grupo econômico como grafo de compras entre entidades.
+
+    As entidades são os nós (no formato de `preparar_lote`, com o campo `regime`) e as compras
+    intragrupo são arestas fornecedor → comprador ponderadas pelo valor. Compras de fornecedores do regime
+    normal geram o crédito do imposto destacado (alíquotas do setor do fornecedor); compras de fornecedores
+    do Simples Nacional e de produtores rurais seguem `calcular_creditos` (alíquotas do comprador e limites
+    de `regras_credito`).
+    Todos os anos da transição são avaliados de uma só vez (arrays entidade × ano).
+    """
+
+    def __init__(self, configuracao, entidades, transacoes, identificadores=None):
+        self.config = configuracao
+        self.calculadora_iva = CalculadoraIVADual(configuracao)
+        self.calculadora_atual = CalculadoraTributosAtuais(configuracao)
+
+        self.lote = preparar_lote(entidades, configuracao)
+        self.n = self.lote["faturamento"].size
+        self.identificadores = list(identificadores) if identificadores is not None else list(range(self.n))
+
+        regimes_invalidos = set(self.lote["regime"]) - set(REGIMES)
+        if regimes_invalidos:
+            raise ValueError(f"Regimes não suportados: {', '.join(sorted(regimes_invalidos))}")
+
+        # Arestas fornecedor → comprador; rótulos são convertidos para índices
+        posicao = {identificador: i for i, identificador in enumerate(self.identificadores)}
+        try:
+            fornecedores = np.array([posicao[t[0]] for t in transacoes], dtype=np.int64)
+            compradores = np.array([posicao[t[1]] for t in transacoes], dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"Entidade não cadastrada nas transações: {e}")
+        valores = np.array([t[2] for t in transacoes], dtype=float)
+        if np.any(fornecedores == compradores):
+            raise ValueError("Transações de uma entidade com ela mesma não são permitidas")
+
+        # Linha = comprador: o produto com um vetor por fornecedor soma o que cada comprador adquiriu
+        self.compras = MatrizEsparsa(compradores, fornecedores, valores, (self.n, self.n))
+        self.vendas_intragrupo = self.compras.transposta().somar_linhas()
+
+        if np.any(self.vendas_intragrupo > self.lote["faturamento"] + 1e-6):
+            raise ValueError("Vendas intragrupo superiores ao faturamento da entidade")
+
+    def compras_por_regime(self):
+        """Compras intragrupo de cada comprador por regime do fornecedor (dicionário regime → array)."""
+        return {regime: self.compras.multiplicar((self.lote["regime"] == regime).astype(float)) for regime in REGIMES}
+
+    def simular(self, anos=None):
+        """Propaga débitos e créditos pelo grafo para todos os anos e consolida o grupo."""
+        if anos is None:
+            anos = list(self.config.fase_transicao.keys())
+        anos = sorted(anos)
+
+        lote = self.lote
+        fator_transicao = np.array([self.config.fase_transicao.get(ano, 1.0) for ano in anos])[np.newaxis, :]
+        regras = self.calculadora_iva.obter_regras_lote(lote["setor"][:, np.newaxis], fator_transicao)
+
+        # Débitos de cada entidade (entidade × ano); Simples e produtor rural não apuram CBS/IBS no grupo
+        apura_iva = np.isin(lote["regime"], ("real", "presumido"))[:, np.newaxis]
+        base = lote["faturamento"][:, np.newaxis] * regras["fator_base"] * fator_transicao
+        debito_cbs = base * regras["CBS"] * apura_iva
+        debito_ibs = base * regras["IBS"] * apura_iva
+
+        # Créditos intragrupo de fornecedores do regime normal: imposto destacado por unidade vendida por
+        # cada fornecedor (alíquotas do setor do fornecedor), propagado pelas arestas
+        normal = np.isin(lote["regime"], ("real", "presumido"))[:, np.newaxis]
+        destacado_cbs = np.where(normal, regras["CBS"] * regras["fator_base"], 0)
+        destacado_ibs = np.where(normal, regras["IBS"] * regras["fator_base"], 0)
+        credito_intra_cbs = self.compras.multiplicar(destacado_cbs)
+        credito_intra_ibs = self.compras.multiplicar(destacado_ibs)
+
+        # Compras de fornecedores do Simples e de produtores rurais do grupo entram nos custos do comprador
+        # e recebem a mesma regra de `calcular_creditos` (alíquotas do próprio comprador)
+        compras_regime = self.compras_por_regime()
+        custos = {campo: lote[campo][:, np.newaxis] for campo in
+                  ("custos_tributaveis", "custos_simples", "custos_rurais", "custos_importacoes")}
+        custos["custos_simples"] = custos["custos_simples"] + compras_regime["simples"][:, np.newaxis]
+        custos["custos_rurais"] = custos["custos_rurais"] + compras_regime["rural"][:, np.newaxis]
+        imposto_bruto = debito_cbs + debito_ibs
+        credito_custos_cbs, credito_custos_ibs = self.calculadora_iva.calcular_creditos_lote(
+            custos, regras["CBS"], regras["IBS"], imposto_bruto)
+
+        creditos_cbs = (credito_custos_cbs + credito_intra_cbs) * apura_iva
+        creditos_ibs = (credito_custos_ibs + credito_intra_ibs) * apura_iva
+
+        # Parcela intragrupo dos créditos de Simples (proporcional às compras, após o limite de 40%) e rurais
+        aliquota_total = regras["CBS"] + regras["IBS"]
+        participacao_cbs = np.divide(regras["CBS"], aliquota_total, out=np.zeros_like(aliquota_total),
+                                     where=aliquota_total > 0)
+        credito_simples = np.minimum(custos["custos_simples"] * self.config.regras_credito["simples"] * aliquota_total,
+                                     imposto_bruto * 0.40)
+        credito_intra_simples = credito_simples * np.divide(
+            compras_regime["simples"][:, np.newaxis], custos["custos_simples"],
+            out=np.zeros_like(credito_simples), where=custos["custos_simples"] > 0)
+        credito_intra_rural = compras_regime["rural"][:, np.newaxis] * (
+            regras["CBS"] * self.config.regras_credito["rural"] + regras["IBS"])
+
+        # Livro de apuração por entidade com transporte de saldo entre anos (ano × entidade × tributo)
+        saldo_inicial = lote["creditos_anteriores"] * apura_iva[:, 0]
+        proporcao_cbs = participacao_cbs[:, 0]
+        livro = LivroCreditos(np.stack([saldo_inicial * proporcao_cbs, saldo_inicial * (1 - proporcao_cbs)], axis=1))
+        apuracao = livro.executar(np.stack([debito_cbs.T, debito_ibs.T], axis=2),
+                                  np.stack([creditos_cbs.T, creditos_ibs.T], axis=2))
+        devido = apuracao["devido"].sum(axis=2)
+
+        # Tributos atuais: as compras intragrupo entram como custos de cada comprador
+        lote_atual = dict(lote)
+        lote_atual["custos_tributaveis"] = lote["custos_tributaveis"] + self.compras.somar_linhas()
+        impostos_atuais = self.calculadora_atual.calcular_lote(lote_atual, anos)["total"]
+
+        credito_intragrupo = (credito_intra_cbs + credito_intra_ibs + credito_intra_simples
+                              + credito_intra_rural) * apura_iva
+
+        resultado = {
+            "anos": anos,
+            "entidades": self.identificadores,
+            "vendas_intragrupo": self.vendas_intragrupo,
+            "debito": (debito_cbs + debito_ibs).T,
+            "credito_intragrupo": credito_intragrupo.T,
+            "creditos": (creditos_cbs + creditos_ibs).T,
+            "imposto_devido": devido,
+            "saldo_credor": apuracao["saldo_final"].sum(axis=2),
+            "impostos_atuais": impostos_atuais,
+            "total_devido": devido + impostos_atuais
+        }
+        resultado["consolidado"] = {
+            chave: resultado[chave].sum(axis=1)
+            for chave in ("debito", "credito_intragrupo", "creditos", "imposto_devido", "saldo_credor",
+                          "impostos_atuais", "total_devido")
+        }
+        return resultado
@@ -1,12 +1,150 @@
-from config import ConfiguracaoTributaria
+import numpy as np
+
+from apuracao import TRIBUTOS_SALDO, LivroCreditos, compensar_creditos, dividir_saldo_inicial
+from config import ConfiguracaoTributaria, TRIBUTOS_ATUAIS
+from indice_memoria import IndiceMemoria
 from utils import formatar_br
 
 
+# Campos numéricos aceitos no cálculo em lote
+CAMPOS_LOTE = ("faturamento", "custos_tributaveis", "custos_simples", "custos_rurais", "custos_importacoes",
+               "creditos_anteriores")
+
+# Saldos credores iniciais informados por empresa, na ordem de TRIBUTOS_SALDO (NaN: não informado)
+CAMPOS_SALDO_INICIAL = ("saldo_inicial_cbs", "saldo_inicial_ibs", "saldo_inicial_icms")
+
+# Campos de custo corrigidos pela inflação nas projeções (ver `projetar_lote`)
+CAMPOS_CUSTO = ("custos_tributaveis", "custos_simples", "custos_rurais", "custos_importacoes")
+
+
+def preparar_lote(empresas, configuracao):
+    """Converte os dados de um conjunto de empresas em arrays NumPy para o cálculo vetorizado.
+
+    Aceita uma lista de dicionários no formato de `dados`, um dicionário de listas/arrays ou um DataFrame.
+    O setor é convertido para o índice em `setores_especiais` e, quando não informada, a incidência de
+    ICMS/ISS/IPI é obtida da configuração do setor.
+    """
+    if hasattr(empresas, "columns"):
+        empresas = {coluna: empresas[coluna].to_numpy() for coluna in empresas.columns}
+    elif isinstance(empresas, (list, tuple)):
+        chaves = set().union(*(empresa.keys() for empresa in empresas)) if empresas else set()
+        padroes = dict({"setor": "padrao", "regime": "real", "aliquota_iss": np.nan},
+                       **{campo: np.nan for campo in CAMPOS_SALDO_INICIAL})
+        empresas = {chave: [empresa.get(chave, padroes.get(chave, 0)) for empresa in empresas] for chave in chaves}
+
+    n = len(empresas["faturamento"])
+    lote = {}
+    for campo in CAMPOS_LOTE:
+        lote[campo] = np.asarray(empresas.get(campo, np.zeros(n)), dtype=float)
+
+    # Setor como índice na ordem de setores_especiais
+    setores = list(configuracao.setores_especiais.keys())
+    setor = np.asarray(empresas.get("setor", np.full(n, "padrao")))
+    if setor.dtype.kind in "iu":
+        lote["setor"] = setor.astype(np.int16)
+    else:
+        nomes, inverso = np.unique(setor.astype(str), return_inverse=True)
+        indices = np.array([setores.index(nome) if nome in setores else setores.index("padrao") for nome in nomes],
+                           dtype=np.int16)
+        lote["setor"] = indices[inverso]
+
+    lote["regime"] = np.asarray(empresas.get("regime", np.full(n, "real"))).astype(str)
+
+    # Alíquota de ISS própria da empresa (NaN: alíquota padrão da configuração)
+    if "aliquota_iss" in empresas:
+        lote["aliquota_iss"] = np.asarray(empresas["aliquota_iss"], dtype=float)
+
+    # Saldos credores iniciais próprios (NaN: repartição de creditos_anteriores, como em `obter_saldos_iniciais`)
+    for campo in CAMPOS_SALDO_INICIAL:
+        if campo in empresas:
+            lote[campo] = np.asarray(empresas[campo], dtype=float)
+
+    # Incidência dos tributos atuais (informada, ex: pela TaxonomiaCNAE, ou definida pelo setor)
+    for tributo in ("ICMS", "ISS", "IPI"):
+        if tributo in empresas:
+            lote[tributo] = np.asarray(empresas[tributo], dtype=bool)
+        else:
+            tabela = np.array([configuracao.obter_incidencia_atual(setor)[tributo] for setor in setores], dtype=bool)
+            lote[tributo] = tabela[lote["setor"]]
+
+    return lote
+
+
+def serie_anual(taxas, anos):
+    """Converte taxas anuais em um array ano × 1 (ou ano × empresa), com o primeiro ano (base) zerado.
+
+    `taxas` pode ser um escalar, uma sequência alinhada a `anos` (ou ano × empresa) ou um dicionário
+    ano → taxa. A taxa de cada ano é a variação frente ao ano anterior.
+    """
+    if isinstance(taxas, dict):
+        taxas = [taxas.get(ano, 0.0) for ano in anos]
+    taxas = np.array(taxas, dtype=float)
+    if taxas.ndim == 0:
+        taxas = np.full(len(anos), float(taxas))
+    if taxas.ndim == 1:
+        taxas = taxas[:, np.newaxis]
+    taxas[0] = 0.0
+    return taxas
+
+
+def indice_projecao(taxas, anos):
+    """Índice acumulado das taxas anuais de variação (1 no ano base)."""
+    return np.cumprod(1 + serie_anual(taxas, anos), axis=0)
+
+
+def projetar_lote(lote, anos, projecoes):
+    """Projeta um lote (ver `preparar_lote`) para vários anos, montando arrays ano × empresa de uma vez.
+
+    `projecoes` aceita:
+    - "crescimento_receita": variação anual do faturamento;
+    - "inflacao_custos": variação anual dos custos (CAMPOS_CUSTO);
+    - "deriva_custos": dicionário campo de custo → pontos percentuais do custo total transferidos por
+      ano dos custos tributáveis para o campo (ex: {"custos_simples": 0.01});
+    - "valores": dicionário ano → {campo: valor} com valores explícitos que substituem os projetados.
+    Os saldos credores iniciais (`creditos_anteriores`, `saldo_inicial_*`) e os campos por empresa não são projetados.
+    """
+    anos = sorted(anos)
+    projetado = dict(lote)
+
+    indice_receita = indice_projecao(projecoes.get("crescimento_receita", 0.0), anos)
+    projetado["faturamento"] = lote["faturamento"][np.newaxis, :] * indice_receita
+    if "rbt12" in lote:
+        projetado["rbt12"] = lote["rbt12"][np.newaxis, :] * indice_receita
+
+    indice_custos = indice_projecao(projecoes.get("inflacao_custos", 0.0), anos)
+    for campo in CAMPOS_CUSTO:
+        projetado[campo] = lote[campo][np.newaxis, :] * indice_custos
+
+    # Deriva do mix de custos: transferência acumulada a partir dos custos tributáveis
+    for campo, taxas in projecoes.get("deriva_custos", {}).items():
+        if campo not in CAMPOS_CUSTO or campo == "custos_tributaveis":
+            raise ValueError(f"Campo de deriva inválido: {campo}")
+        deriva = np.cumsum(serie_anual(taxas, anos), axis=0)
+        custo_total = sum(projetado[custo] for custo in CAMPOS_CUSTO)
+        transferido = np.clip(deriva * custo_total, -projetado[campo], projetado["custos_tributaveis"])
+        projetado[campo] = projetado[campo] + transferido
+        projetado["custos_tributaveis"] = projetado["custos_tributaveis"] - transferido
+
+    # Valores explícitos por ano
+    for ano, valores in projecoes.get("valores", {}).items():
+        if ano not in anos:
+            continue
+        for campo, valor in valores.items():
+            if campo not in ("faturamento", "rbt12") + CAMPOS_CUSTO or campo not in projetado:
+                raise ValueError(f"Campo não projetável: {campo}")
+            projetado[campo][anos.index(ano)] = valor
+
+    return projetado
+
+
 class CalculadoraTributosAtuais:
     """Implementa os cálculos dos tributos do sistema atual (PIS, COFINS, ICMS, ISS, IPI)."""
 
-    def __init__(self, configuracao):
+    FATOR_CREDITO_IPI = 0.7  # Fator de aproveitamento de crédito do IPI
+
+    def __init__(self, configuracao, tabela_iss=None):
         self.config = configuracao
+        self.tabela_iss = tabela_iss  # TabelaISS (iss_municipal) com alíquotas por município e item
         self.memoria_calculo = {}  # Para armazenar os passos do cálculo
 
     def calcular_todos_impostos(self, dados, ano):
@@ -26,46 +164,62 @@ class CalculadoraTributosAtuais:
             faturamento = dados.get("faturamento", 0)
             custos = dados.get("custos_tributaveis", 0)
             setor = dados.get("setor", "padrao")
+            incidencia = dados.get("incidencia") or self.config.obter_incidencia_atual(setor)
+
+            # Regras do regime de apuração (real: não cumulativo; presumido: cumulativo; simples: DAS)
+            regime = dados.get("regime", "real")
+            parametros = self.config.obter_parametros_regime(regime)
+            das = self.calcular_das_atual(dados) if parametros["das"] else None
+
+            devidos_federais = {}
+            for tributo in ("PIS", "COFINS"):
+                if das is not None:
+                    devidos_federais[tributo] = das[tributo]
+                    self.memoria_calculo[tributo].append(
+                        f"Simples Nacional: parcela do DAS (Anexo {das['anexo']}, alíquota efetiva {formatar_br(das['aliquota_efetiva'] * 100)}%) = R$ {formatar_br(das[tributo])}")
+                    continue
 
-            # Cálculo do PIS
-            aliquota_pis = self.config.impostos_atuais["PIS"]
-            self.memoria_calculo["PIS"].append(f"Faturamento: R$ {formatar_br(faturamento)}")
-            self.memoria_calculo["PIS"].append(f"Alíquota PIS: {formatar_br(aliquota_pis * 100)}%")
-
-            credito_pis = 0
-            if faturamento > 0:
-                credito_pis = custos * aliquota_pis
-                self.memoria_calculo["PIS"].append(f"Custos tributáveis: R$ {formatar_br(custos)}")
-                self.memoria_calculo["PIS"].append(
-                    f"Crédito PIS: R$ {formatar_br(custos)} × {formatar_br(aliquota_pis * 100)}% = R$ {formatar_br(credito_pis)}")
-
-            pis_devido = faturamento * aliquota_pis - credito_pis
-            self.memoria_calculo["PIS"].append(
-                f"PIS bruto: R$ {formatar_br(faturamento)} × {formatar_br(aliquota_pis * 100)}% = R$ {formatar_br(faturamento * aliquota_pis)}")
-            self.memoria_calculo["PIS"].append(
-                f"PIS devido: R$ {formatar_br(faturamento * aliquota_pis)} - R$ {formatar_br(credito_pis)} = R$ {formatar_br(pis_devido)}")
-
-            # Cálculo do COFINS
-            aliquota_cofins = self.config.impostos_atuais["COFINS"]
-            self.memoria_calculo["COFINS"].append(f"Faturamento: R$ {formatar_br(faturamento)}")
-            self.memoria_calculo["COFINS"].append(f"Alíquota COFINS: {formatar_br(aliquota_cofins * 100)}%")
-
-            credito_cofins = 0
-            if faturamento > 0:
-                credito_cofins = custos * aliquota_cofins
-                self.memoria_calculo["COFINS"].append(f"Custos tributáveis: R$ {formatar_br(custos)}")
-                self.memoria_calculo["COFINS"].append(
-                    f"Crédito COFINS: R$ {formatar_br(custos)} × {formatar_br(aliquota_cofins * 100)}% = R$ {formatar_br(credito_cofins)}")
-
-            cofins_devido = faturamento * aliquota_cofins - credito_cofins
-            self.memoria_calculo["COFINS"].append(
-                f"COFINS bruto: R$ {formatar_br(faturamento)} × {formatar_br(aliquota_cofins * 100)}% = R$ {formatar_br(faturamento * aliquota_cofins)}")
-            self.memoria_calculo["COFINS"].append(
-                f"COFINS devido: R$ {formatar_br(faturamento * aliquota_cofins)} - R$ {formatar_br(credito_cofins)} = R$ {formatar_br(cofins_devido)}")
-
-            # Cálculo do ICMS
-            # Substituir o cálculo do ICMS pelo método detalhado
-            resultado_icms = self.calcular_icms_detalhado(dados)
+                aliquota = parametros[tributo]
+                self.memoria_calculo[tributo].append(f"Faturamento: R$ {formatar_br(faturamento)}")
+                self.memoria_calculo[tributo].append(
+                    f"Alíquota {tributo} ({'não cumulativo' if parametros['credito_pis_cofins'] else 'cumulativo'} - {regime}): {formatar_br(aliquota * 100)}%")
+
+                credito = 0
+                if faturamento > 0 and parametros["credito_pis_cofins"]:
+                    credito = custos * aliquota * parametros["credito_pis_cofins"]
+                    self.memoria_calculo[tributo].append(f"Custos tributáveis: R$ {formatar_br(custos)}")
+                    self.memoria_calculo[tributo].append(
+                        f"Crédito {tributo}: R$ {formatar_br(custos)} × {formatar_br(aliquota * 100)}% = R$ {formatar_br(credito)}")
+                elif not parametros["credito_pis_cofins"]:
+                    self.memoria_calculo[tributo].append("Regime cumulativo: sem direito a créditos")
+
+                devidos_federais[tributo] = faturamento * aliquota - credito
+                self.memoria_calculo[tributo].append(
+                    f"{tributo} bruto: R$ {formatar_br(faturamento)} × {formatar_br(aliquota * 100)}% = R$ {formatar_br(faturamento * aliquota)}")
+                self.memoria_calculo[tributo].append(
+                    f"{tributo} devido: R$ {formatar_br(faturamento * aliquota)} - R$ {formatar_br(credito)} = R$ {formatar_br(devidos_federais[tributo])}")
+
+            pis_devido = devidos_federais["PIS"]
+            cofins_devido = devidos_federais["COFINS"]
+
+            # Cálculo do ICMS (apenas para setores com incidência)
+            if das is not None:
+                resultado_icms = {
+                    "icms_devido": das["ICMS"] if incidencia["ICMS"] else 0,
+                    "economia_tributaria": 0,
+                    "saldo_credor": 0,
+                    "memoria_calculo": [f"Simples Nacional: parcela do DAS = R$ {formatar_br(das['ICMS'])}"
+                                        if incidencia["ICMS"] else f"Não aplicável ao setor {setor}"]
+                }
+            elif incidencia["ICMS"]:
+                resultado_icms = self.calcular_icms_detalhado(dados)
+            else:
+                resultado_icms = {
+                    "icms_devido": 0,
+                    "economia_tributaria": 0,
+                    "saldo_credor": 0,
+                    "memoria_calculo": [f"Não aplicável ao setor {setor}"]
+                }
             icms_devido = resultado_icms["icms_devido"]
 
             # Atualizar a memória de cálculo
@@ -73,12 +227,15 @@ class CalculadoraTributosAtuais:
 
             # Cálculo do ISS (apenas para setores de serviços)
             iss_devido = 0
-            if setor in ["servicos", "educacao", "saude"]:
-                aliquota_iss = self.config.impostos_atuais["ISS"]["padrao"]
+            if das is not None and incidencia["ISS"]:
+                iss_devido = das["ISS"]
+                self.memoria_calculo["ISS"].append(f"Simples Nacional: parcela do DAS = R$ {formatar_br(iss_devido)}")
+            elif incidencia["ISS"]:
+                aliquota_iss, origem = self.obter_aliquota_iss(dados)
                 iss_devido = faturamento * aliquota_iss
 
                 self.memoria_calculo["ISS"].append(f"Faturamento: R$ {formatar_br(faturamento)}")
-                self.memoria_calculo["ISS"].append(f"Alíquota ISS: {formatar_br(aliquota_iss * 100)}%")
+                self.memoria_calculo["ISS"].append(f"Alíquota ISS ({origem}): {formatar_br(aliquota_iss * 100)}%")
                 self.memoria_calculo["ISS"].append(
                     f"ISS devido: R$ {formatar_br(faturamento)} × {formatar_br(aliquota_iss * 100)}% = R$ {formatar_br(iss_devido)}")
             else:
@@ -86,9 +243,12 @@ class CalculadoraTributosAtuais:
 
             # Cálculo do IPI (apenas para indústria)
             ipi_devido = 0
-            if setor == "industria":
+            if das is not None and incidencia["IPI"]:
+                ipi_devido = das["IPI"]
+                self.memoria_calculo["IPI"].append(f"Simples Nacional: parcela do DAS = R$ {formatar_br(ipi_devido)}")
+            elif incidencia["IPI"]:
                 aliquota_ipi = self.config.impostos_atuais["IPI"]["industria"]
-                fator_credito_ipi = 0.7  # Fator de aproveitamento de crédito do IPI
+                fator_credito_ipi = self.FATOR_CREDITO_IPI
 
                 credito_ipi = 0
                 if faturamento > 0:
@@ -109,8 +269,38 @@ class CalculadoraTributosAtuais:
             else:
                 self.memoria_calculo["IPI"].append(f"Não aplicável ao setor {setor}")
 
+            # Redução progressiva dos tributos atuais durante a transição
+            reducao = self.config.obter_reducao_transicao(ano)
+            devidos = {"PIS": pis_devido, "COFINS": cofins_devido, "ICMS": icms_devido, "ISS": iss_devido,
+                       "IPI": ipi_devido}
+            aplicaveis = {"PIS": True, "COFINS": True, "ICMS": incidencia["ICMS"], "ISS": incidencia["ISS"],
+                          "IPI": incidencia["IPI"]}
+            fatores = {}
+
+            for tributo, valor in devidos.items():
+                fator = 1 - reducao.get(tributo, 0.0)
+                fatores[tributo] = fator
+                devidos[tributo] = valor * fator
+
+                if aplicaveis[tributo]:
+                    self.memoria_calculo[tributo].append(
+                        f"Redução da transição ({ano}): {formatar_br(reducao.get(tributo, 0.0) * 100)}% - fator remanescente {formatar_br(fator * 100)}%")
+                    self.memoria_calculo[tributo].append(
+                        f"{tributo} após transição: R$ {formatar_br(valor)} × {formatar_br(fator * 100)}% = R$ {formatar_br(devidos[tributo])}")
+
+            pis_devido = devidos["PIS"]
+            cofins_devido = devidos["COFINS"]
+            icms_devido = devidos["ICMS"]
+            iss_devido = devidos["ISS"]
+            ipi_devido = devidos["IPI"]
+            economia_icms = resultado_icms["economia_tributaria"] * fatores["ICMS"]
+            saldo_credor_icms = resultado_icms.get("saldo_credor", 0) * fatores["ICMS"]
+
             # Cálculo do total
             total = pis_devido + cofins_devido + icms_devido + iss_devido + ipi_devido
+            self.memoria_calculo["total"].append(
+                f"Fatores remanescentes em {ano}: " + " | ".join(
+                    f"{tributo} {formatar_br(fator * 100)}%" for tributo, fator in fatores.items()))
             self.memoria_calculo["total"].append(f"Total de tributos = PIS + COFINS + ICMS + ISS + IPI")
             self.memoria_calculo["total"].append(
                 f"Total de tributos = R$ {formatar_br(pis_devido)} + R$ {formatar_br(cofins_devido)} + R$ {formatar_br(icms_devido)} + R$ {formatar_br(iss_devido)} + R$ {formatar_br(ipi_devido)}")
@@ -124,7 +314,8 @@ class CalculadoraTributosAtuais:
                 "ISS": iss_devido,
                 "IPI": ipi_devido,
                 "total": total,
-                "economia_icms": resultado_icms["economia_tributaria"]  # Novo campo
+                "economia_icms": economia_icms,
+                "saldo_credor_icms": saldo_credor_icms
             }
 
             return impostos
@@ -132,7 +323,61 @@ class CalculadoraTributosAtuais:
         except Exception as e:
             print(f"Erro no cálculo de impostos atuais: {e}")
             # Retornar valores padrão em caso de erro
-            return {"PIS": 0, "COFINS": 0, "ICMS": 0, "ISS": 0, "IPI": 0, "total": 0}
+            return {"PIS": 0, "COFINS": 0, "ICMS": 0, "ISS": 0, "IPI": 0, "total": 0, "saldo_credor_icms": 0}
+
+    def obter_aliquota_iss(self, dados):
+        """Alíquota de ISS da empresa e sua origem (informada, tabela municipal ou padrão).
+
+        `receitas_iss` é uma lista de dicionários {"municipio", "item", "valor"} com as receitas de
+        serviço por município (código IBGE) e item da LC 116/2003.
+        """
+        padrao = self.config.impostos_atuais["ISS"]["padrao"]
+        aliquota = dados.get("aliquota_iss")
+        if aliquota is not None and not np.isnan(aliquota):
+            return aliquota, "informada"
+
+        receitas = dados.get("receitas_iss")
+        if receitas and self.tabela_iss is not None:
+            aliquota = self.tabela_iss.aliquotas_medias(
+                np.zeros(len(receitas), dtype=np.int64), [receita["municipio"] for receita in receitas],
+                [receita.get("item", "") for receita in receitas], [receita["valor"] for receita in receitas],
+                1, padrao)[0]
+            return float(aliquota), f"média de {len(receitas)} município(s)/item(ns)"
+        return padrao, "padrão"
+
+    def calcular_aliquotas_iss_lote(self, empresas, municipios, itens, receitas, n):
+        """Alíquotas de ISS de N empresas a partir das receitas por município e item (triplas esparsas).
+
+        O resultado pode ser atribuído a `lote["aliquota_iss"]`; sem tabela, vale a alíquota padrão.
+        """
+        padrao = self.config.impostos_atuais["ISS"]["padrao"]
+        if self.tabela_iss is None:
+            return np.full(n, padrao)
+        return self.tabela_iss.aliquotas_medias(empresas, municipios, itens, receitas, n, padrao)
+
+    def calcular_das_atual(self, dados):
+        """Parcelas de PIS, COFINS, ICMS, ISS e IPI no DAS de uma empresa do Simples Nacional."""
+        setores = list(self.config.setores_especiais.keys())
+        setor = dados.get("setor", "padrao")
+        indice_setor = np.array([setores.index(setor) if setor in setores else setores.index("padrao")])
+        faturamento = np.array([dados.get("faturamento", 0)], dtype=float)
+        rbt12 = np.array([dados.get("rbt12", dados.get("faturamento", 0))], dtype=float)
+        anexo = None if dados.get("anexo") is None else [dados["anexo"]]
+
+        resultado = self.calcular_das_lote(faturamento, rbt12, indice_setor, anexo)
+        parcelas = {tributo: float(resultado["valores"][0, i]) for i, tributo in enumerate(TRIBUTOS_ATUAIS)}
+        return dict(parcelas, anexo=int(resultado["anexo"][0]), aliquota_efetiva=float(resultado["aliquota_efetiva"][0]))
+
+    def calcular_das_lote(self, faturamento, rbt12, setor, anexo=None):
+        """Parcelas do DAS correspondentes aos tributos atuais (empresa × tributo, ordem de TRIBUTOS_ATUAIS)."""
+        # Importação local: simples.py depende deste módulo
+        from simples import CalculadoraSimplesNacional, TRIBUTOS_DAS
+
+        calculadora = CalculadoraSimplesNacional(self.config)
+        anexos = calculadora.definir_anexos(setor, anexo)
+        das = calculadora.calcular_das(faturamento, rbt12, anexos)
+        colunas = [TRIBUTOS_DAS.index(tributo) for tributo in TRIBUTOS_ATUAIS]
+        return {"valores": das["valores"][:, colunas], "anexo": anexos, "aliquota_efetiva": das["aliquota_efetiva"]}
 
     def calcular_icms_detalhado(self, dados):
         """Implementa o cálculo detalhado do ICMS considerando múltiplos incentivos fiscais."""
@@ -146,6 +391,7 @@ class CalculadoraTributosAtuais:
             aliquota_saida = self.config.icms_config.get("aliquota_saida", 0.19)
             incentivos_saida = self.config.icms_config.get("incentivos_saida", [])
             incentivos_entrada = self.config.icms_config.get("incentivos_entrada", [])
+            incentivos_apuracao = self.config.icms_config.get("incentivos_apuracao", [])
 
             # Criar memória de cálculo detalhada
             memoria_calculo = []
@@ -164,7 +410,7 @@ class CalculadoraTributosAtuais:
                 f"Crédito normal: R$ {formatar_br(custos)} × {formatar_br(aliquota_entrada * 100)}% = R$ {formatar_br(credito_normal)}")
 
             # Se não houver incentivos configurados, retornar cálculo padrão
-            if not incentivos_saida and not incentivos_entrada:
+            if not incentivos_saida and not incentivos_entrada and not incentivos_apuracao:
                 icms_devido = debito_icms_normal - credito_normal
                 memoria_calculo.append(f"Nenhum incentivo fiscal aplicado")
                 memoria_calculo.append(
@@ -184,6 +430,7 @@ class CalculadoraTributosAtuais:
                     "icms_devido": max(0, icms_devido),
                     "economia_tributaria": economia,
                     "percentual_economia": percentual_economia,
+                    "saldo_credor": max(0, -icms_devido),
                     "memoria_calculo": memoria_calculo
                 }
 
@@ -338,80 +585,76 @@ class CalculadoraTributosAtuais:
 
                 credito_total += credito_incentivado
 
-                # Processar incentivos de apuração (aplicados sobre o saldo devedor)
-                incentivos_apuracao = self.config.icms_config.get("incentivos_apuracao", [])
-                icms_antes_incentivos_apuracao = max(0, debito_total - credito_total)
+            # Adicionar crédito das operações não incentivadas
+            if custos_nao_incentivados > 0:
+                credito_nao_incentivado = custos_nao_incentivados * aliquota_entrada
+                credito_total += credito_nao_incentivado
 
-                memoria_calculo.append(f"\n== Processando incentivos de apuração do ICMS ==")
+                memoria_calculo.append(f"\nOperações de entrada não incentivadas:")
+                memoria_calculo.append(f"Custos não incentivados: R$ {formatar_br(custos_nao_incentivados)}")
                 memoria_calculo.append(
-                    f"ICMS antes dos incentivos de apuração: R$ {formatar_br(icms_antes_incentivos_apuracao)}")
+                    f"Crédito sobre operações não incentivadas: R$ {formatar_br(custos_nao_incentivados)} × {formatar_br(aliquota_entrada * 100)}% = R$ {formatar_br(credito_nao_incentivado)}")
 
-                # Se não há saldo devedor ou incentivos de apuração, não aplicar
-                if icms_antes_incentivos_apuracao <= 0 or not incentivos_apuracao:
-                    memoria_calculo.append(f"Não há saldo devedor ou incentivos de apuração configurados.")
-                    icms_devido = icms_antes_incentivos_apuracao
-                else:
-                    reducao_total = 0
+            memoria_calculo.append(f"\nTotal de créditos após incentivos: R$ {formatar_br(credito_total)}")
 
-                    for idx, incentivo in enumerate(incentivos_apuracao, 1):
-                        tipo = incentivo.get("tipo", "Nenhum")
-                        percentual = incentivo.get("percentual", 0.0)
-                        percentual_saldo = incentivo.get("percentual_operacoes", 1.0)  # Percentual do saldo
-                        descricao = incentivo.get("descricao", f"Incentivo Apuração {idx}")
+            memoria_calculo.append(f"\n== Cálculo final do ICMS ==")
+            memoria_calculo.append(f"Débitos totais: R$ {formatar_br(debito_total)}")
+            memoria_calculo.append(f"Créditos totais: R$ {formatar_br(credito_total)}")
+            memoria_calculo.append(
+                f"Saldo: R$ {formatar_br(debito_total)} - R$ {formatar_br(credito_total)} = R$ {formatar_br(debito_total - credito_total)}")
 
-                        if tipo == "Nenhum" or percentual <= 0:
-                            continue
+            # Processar incentivos de apuração (aplicados sobre o saldo devedor)
+            icms_antes_incentivos_apuracao = max(0, debito_total - credito_total)
 
-                        saldo_afetado = icms_antes_incentivos_apuracao * percentual_saldo
+            memoria_calculo.append(f"\n== Processando incentivos de apuração do ICMS ==")
+            memoria_calculo.append(
+                f"ICMS antes dos incentivos de apuração: R$ {formatar_br(icms_antes_incentivos_apuracao)}")
 
-                        memoria_calculo.append(f"\nIncentivo de apuração {idx}: {descricao}")
-                        memoria_calculo.append(f"Tipo: {tipo}")
-                        memoria_calculo.append(f"Percentual do incentivo: {formatar_br(percentual * 100)}%")
-                        memoria_calculo.append(f"Percentual do saldo: {formatar_br(percentual_saldo * 100)}%")
-                        memoria_calculo.append(f"Saldo afetado: R$ {formatar_br(saldo_afetado)}")
+            # Se não há saldo devedor ou incentivos de apuração, não aplicar
+            if icms_antes_incentivos_apuracao <= 0 or not incentivos_apuracao:
+                memoria_calculo.append(f"Não há saldo devedor ou incentivos de apuração configurados.")
+                icms_devido = icms_antes_incentivos_apuracao
+            else:
+                reducao_total = 0
 
-                        if tipo == "Crédito Presumido/Outorgado":
-                            reducao = saldo_afetado * percentual
-                            memoria_calculo.append(
-                                f"Crédito outorgado: R$ {formatar_br(saldo_afetado)} × {formatar_br(percentual * 100)}% = R$ {formatar_br(reducao)}")
+                for idx, incentivo in enumerate(incentivos_apuracao, 1):
+                    tipo = incentivo.get("tipo", "Nenhum")
+                    percentual = incentivo.get("percentual", 0.0)
+                    percentual_saldo = incentivo.get("percentual_operacoes", 1.0)  # Percentual do saldo
+                    descricao = incentivo.get("descricao", f"Incentivo Apuração {idx}")
 
-                        elif tipo == "Redução do Saldo Devedor":
-                            reducao = saldo_afetado * percentual
-                            memoria_calculo.append(
-                                f"Redução direta: R$ {formatar_br(saldo_afetado)} × {formatar_br(percentual * 100)}% = R$ {formatar_br(reducao)}")
+                    if tipo == "Nenhum" or percentual <= 0:
+                        continue
 
-                        else:
-                            reducao = 0
-                            memoria_calculo.append(f"Tipo de incentivo não implementado para apuração")
+                    saldo_afetado = icms_antes_incentivos_apuracao * percentual_saldo
 
-                        reducao_total += reducao
+                    memoria_calculo.append(f"\nIncentivo de apuração {idx}: {descricao}")
+                    memoria_calculo.append(f"Tipo: {tipo}")
+                    memoria_calculo.append(f"Percentual do incentivo: {formatar_br(percentual * 100)}%")
+                    memoria_calculo.append(f"Percentual do saldo: {formatar_br(percentual_saldo * 100)}%")
+                    memoria_calculo.append(f"Saldo afetado: R$ {formatar_br(saldo_afetado)}")
 
-                    # Aplicar reduções
-                    icms_devido = max(0, icms_antes_incentivos_apuracao - reducao_total)
+                    if tipo == "Crédito Presumido/Outorgado":
+                        reducao = saldo_afetado * percentual
+                        memoria_calculo.append(
+                            f"Crédito outorgado: R$ {formatar_br(saldo_afetado)} × {formatar_br(percentual * 100)}% = R$ {formatar_br(reducao)}")
 
-                    memoria_calculo.append(f"\nTotal de reduções de apuração: R$ {formatar_br(reducao_total)}")
-                    memoria_calculo.append(f"ICMS devido após incentivos de apuração: R$ {formatar_br(icms_devido)}")
+                    elif tipo == "Redução do Saldo Devedor":
+                        reducao = saldo_afetado * percentual
+                        memoria_calculo.append(
+                            f"Redução direta: R$ {formatar_br(saldo_afetado)} × {formatar_br(percentual * 100)}% = R$ {formatar_br(reducao)}")
 
-            # Adicionar crédito das operações não incentivadas
-            if custos_nao_incentivados > 0:
-                credito_nao_incentivado = custos_nao_incentivados * aliquota_entrada
-                credito_total += credito_nao_incentivado
+                    else:
+                        reducao = 0
+                        memoria_calculo.append(f"Tipo de incentivo não implementado para apuração")
 
-                memoria_calculo.append(f"\nOperações de entrada não incentivadas:")
-                memoria_calculo.append(f"Custos não incentivados: R$ {formatar_br(custos_nao_incentivados)}")
-                memoria_calculo.append(
-                    f"Crédito sobre operações não incentivadas: R$ {formatar_br(custos_nao_incentivados)} × {formatar_br(aliquota_entrada * 100)}% = R$ {formatar_br(credito_nao_incentivado)}")
-
-            memoria_calculo.append(f"\nTotal de créditos após incentivos: R$ {formatar_br(credito_total)}")
+                    reducao_total += reducao
 
-            # Cálculo do ICMS devido
-            icms_devido = max(0, debito_total - credito_total)
+                # Aplicar reduções
+                icms_devido = max(0, icms_antes_incentivos_apuracao - reducao_total)
 
-            memoria_calculo.append(f"\n== Cálculo final do ICMS ==")
-            memoria_calculo.append(f"Débitos totais: R$ {formatar_br(debito_total)}")
-            memoria_calculo.append(f"Créditos totais: R$ {formatar_br(credito_total)}")
-            memoria_calculo.append(
-                f"ICMS devido: R$ {formatar_br(debito_total)} - R$ {formatar_br(credito_total)} = R$ {formatar_br(icms_devido)}")
+                memoria_calculo.append(f"\nTotal de reduções de apuração: R$ {formatar_br(reducao_total)}")
+                memoria_calculo.append(f"ICMS devido após incentivos de apuração: R$ {formatar_br(icms_devido)}")
 
             # Calcular economia tributária
             icms_sem_incentivo = debito_icms_normal - credito_normal
@@ -428,6 +671,7 @@ class CalculadoraTributosAtuais:
                 "icms_devido": max(0, icms_devido),  # Garantir que não seja negativo
                 "economia_tributaria": economia,
                 "percentual_economia": percentual_economia,
+                "saldo_credor": max(0, credito_total - debito_total),
                 "memoria_calculo": memoria_calculo
             }
 
@@ -437,9 +681,183 @@ class CalculadoraTributosAtuais:
                 "icms_devido": 0,
                 "economia_tributaria": 0,
                 "percentual_economia": 0,
+                "saldo_credor": 0,
                 "memoria_calculo": [f"Erro no cálculo: {str(e)}"]
             }
 
+    def calcular_icms_lote(self, faturamento, custos, diferimento_como_prazo=False):
+        """Versão vetorizada de `calcular_icms_detalhado` para arrays de faturamento e custos.
+
+        Com `diferimento_como_prazo`, o incentivo de Diferimento não reduz o débito: o valor diferido é
+        devolvido em `diferimentos` (lista de (prazo em meses, valor)) para ser deslocado no tempo.
+        """
+        aliquota_entrada = self.config.icms_config.get("aliquota_entrada", 0.19)
+        aliquota_saida = self.config.icms_config.get("aliquota_saida", 0.19)
+        incentivos_saida = self.config.icms_config.get("incentivos_saida", [])
+        incentivos_entrada = self.config.icms_config.get("incentivos_entrada", [])
+        incentivos_apuracao = self.config.icms_config.get("incentivos_apuracao", [])
+
+        debito_normal = faturamento * aliquota_saida
+        credito_normal = custos * aliquota_entrada
+
+        if not incentivos_saida and not incentivos_entrada and not incentivos_apuracao:
+            return {
+                "icms_devido": np.maximum(0, debito_normal - credito_normal),
+                "economia_tributaria": np.zeros_like(faturamento),
+                "saldo_credor": np.maximum(0, credito_normal - debito_normal)
+            }
+
+        # Débitos: cada incentivo de saída alcança uma fração das operações ainda não incentivadas
+        debito_total = np.zeros_like(faturamento)
+        diferimentos = []
+        faturamento_nao_incentivado = faturamento.copy()
+        for incentivo in incentivos_saida:
+            tipo = incentivo.get("tipo", "Nenhum")
+            percentual = incentivo.get("percentual", 0.0)
+            if tipo == "Nenhum" or percentual <= 0:
+                continue
+
+            faturamento_incentivado = faturamento_nao_incentivado * incentivo.get("percentual_operacoes", 1.0)
+            faturamento_nao_incentivado = faturamento_nao_incentivado - faturamento_incentivado
+
+            if tipo == "Diferimento" and diferimento_como_prazo:
+                prazo = incentivo.get("prazo_meses", self.config.icms_config.get("prazo_diferimento_meses", 12))
+                diferimentos.append((prazo, faturamento_incentivado * aliquota_saida * percentual))
+                debito_total += faturamento_incentivado * aliquota_saida
+                continue
+
+            reduz_debito = tipo in ("Redução de Alíquota", "Crédito Presumido/Outorgado",
+                                    "Redução de Base de Cálculo", "Diferimento")
+            debito_total += faturamento_incentivado * aliquota_saida * ((1 - percentual) if reduz_debito else 1)
+        debito_total += faturamento_nao_incentivado * aliquota_saida
+
+        # Créditos: mesma lógica para os incentivos de entrada
+        credito_total = np.zeros_like(custos)
+        custos_nao_incentivados = custos.copy()
+        for incentivo in incentivos_entrada:
+            tipo = incentivo.get("tipo", "Nenhum")
+            percentual = incentivo.get("percentual", 0.0)
+            if tipo == "Nenhum" or percentual <= 0:
+                continue
+
+            custos_incentivados = custos_nao_incentivados * incentivo.get("percentual_operacoes", 1.0)
+            custos_nao_incentivados = custos_nao_incentivados - custos_incentivados
+
+            if tipo in ("Redução de Alíquota", "Estorno de Crédito"):
+                fator = 1 - percentual
+            elif tipo == "Crédito Presumido/Outorgado":
+                fator = 1 + percentual
+            else:
+                fator = 1
+            credito_total += custos_incentivados * aliquota_entrada * fator
+        credito_total += custos_nao_incentivados * aliquota_entrada
+
+        # Incentivos de apuração sobre o saldo devedor
+        saldo_devedor = np.maximum(0, debito_total - credito_total)
+        reducao_total = np.zeros_like(saldo_devedor)
+        for incentivo in incentivos_apuracao:
+            tipo = incentivo.get("tipo", "Nenhum")
+            percentual = incentivo.get("percentual", 0.0)
+            if tipo in ("Crédito Presumido/Outorgado", "Redução do Saldo Devedor") and percentual > 0:
+                reducao_total += saldo_devedor * incentivo.get("percentual_operacoes", 1.0) * percentual
+
+        icms_devido = np.maximum(0, saldo_devedor - reducao_total)
+
+        return {
+            "icms_devido": icms_devido,
+            "economia_tributaria": (debito_normal - credito_normal) - icms_devido,
+            "saldo_credor": np.maximum(0, credito_total - debito_total),
+            "diferimentos": diferimentos
+        }
+
+    def calcular_valores_integrais(self, lote, diferimento_como_prazo=False):
+        """Calcula os tributos atuais por empresa, antes da extinção progressiva da transição.
+
+        Retorna arrays empresa × tributo (ordem de TRIBUTOS_ATUAIS) e os dados auxiliares do ICMS.
+        """
+        faturamento = lote["faturamento"]
+        custos = lote["custos_tributaveis"]
+        com_faturamento = faturamento > 0
+
+        valores = np.zeros((faturamento.size, len(TRIBUTOS_ATUAIS)))
+
+        # PIS e COFINS pela tabela de regimes (alíquota e aproveitamento de crédito por empresa)
+        parametros = self.config.tabela_parametros_regimes(lote.get("regime", np.full(faturamento.size, "real")))
+        for tributo in ("PIS", "COFINS"):
+            aliquota = parametros[tributo]
+            credito = np.where(com_faturamento, custos * aliquota * parametros["credito_pis_cofins"], 0)
+            valores[:, TRIBUTOS_ATUAIS.index(tributo)] = faturamento * aliquota - credito
+
+        # IPI (setores industriais)
+        aliquota_ipi = self.config.impostos_atuais["IPI"]["industria"]
+        credito_ipi = np.where(com_faturamento, custos * aliquota_ipi * self.FATOR_CREDITO_IPI, 0)
+        valores[:, TRIBUTOS_ATUAIS.index("IPI")] = np.where(lote["IPI"], faturamento * aliquota_ipi - credito_ipi, 0)
+
+        # ICMS (com incentivos configurados)
+        resultado_icms = self.calcular_icms_lote(faturamento, custos, diferimento_como_prazo)
+        valores[:, TRIBUTOS_ATUAIS.index("ICMS")] = np.where(lote["ICMS"], resultado_icms["icms_devido"], 0)
+
+        # ISS (setores de serviços): alíquota própria da empresa (ver `calcular_aliquotas_iss_lote`) ou padrão
+        aliquota_iss = self.config.impostos_atuais["ISS"]["padrao"]
+        if "aliquota_iss" in lote:
+            aliquota_iss = np.where(np.isnan(lote["aliquota_iss"]), aliquota_iss, lote["aliquota_iss"])
+        valores[:, TRIBUTOS_ATUAIS.index("ISS")] = np.where(lote["ISS"], faturamento * aliquota_iss, 0)
+
+        # Simples Nacional: os tributos atuais são as parcelas do DAS (sem apuração própria de ICMS)
+        das = parametros["das"]
+        if np.any(das):
+            incidencia = np.stack([lote[tributo] if tributo in ("ICMS", "ISS", "IPI") else np.ones(faturamento.size, bool)
+                                   for tributo in TRIBUTOS_ATUAIS], axis=1)
+            parcelas = self.calcular_das_lote(faturamento[das], lote.get("rbt12", faturamento)[das], lote["setor"][das])
+            valores[das] = parcelas["valores"] * incidencia[das]
+        icms_apurado = lote["ICMS"] & ~das
+
+        return {
+            "valores": valores,
+            "economia_icms": np.where(icms_apurado, resultado_icms["economia_tributaria"], 0),
+            "saldo_credor_icms": np.where(icms_apurado, resultado_icms["saldo_credor"], 0),
+            "diferimentos": [(prazo, np.where(icms_apurado, valor, 0))
+                             for prazo, valor in resultado_icms.get("diferimentos", [])]
+        }
+
+    def calcular_lote(self, lote, anos):
+        """Calcula os tributos atuais de um lote de empresas (ver `preparar_lote`) em vários anos.
+
+        Os tributos são calculados uma vez por empresa e a extinção progressiva da transição é aplicada
+        em um único passo com a matriz ano × tributo de `matriz_fatores_transicao`.
+        Em um lote projetado (ver `projetar_lote`), cada par (ano, empresa) é apurado como uma linha.
+        Retorna arrays no formato ano × empresa × tributo, na ordem de TRIBUTOS_ATUAIS.
+        """
+        forma = lote["faturamento"].shape
+        if len(forma) == 2:
+            lote = {campo: valores.ravel() if np.ndim(valores) == 2 else np.tile(valores, forma[0])
+                    for campo, valores in lote.items()}
+        integrais = self.calcular_valores_integrais(lote)
+        valores = integrais["valores"].reshape((-1,) + forma[-1:] + (len(TRIBUTOS_ATUAIS),))
+        economia_icms = integrais["economia_icms"].reshape((-1, forma[-1]))
+        saldo_credor_icms = integrais["saldo_credor_icms"].reshape((-1, forma[-1]))
+
+        # Extinção progressiva dos tributos atuais: (ano × 1 × tributo) · (1 ou ano × empresa × tributo)
+        fatores = self.config.matriz_fatores_transicao(anos)
+        por_ano = fatores[:, np.newaxis, :] * valores
+        fator_icms = fatores[:, np.newaxis, TRIBUTOS_ATUAIS.index("ICMS")]
+
+        self.memoria_calculo = {"transicao": [f"Fatores remanescentes dos tributos atuais ({', '.join(TRIBUTOS_ATUAIS)}):"]}
+        for ano, linha in zip(anos, fatores):
+            self.memoria_calculo["transicao"].append(
+                f"{ano}: " + " | ".join(f"{tributo} {formatar_br(fator * 100)}%"
+                                        for tributo, fator in zip(TRIBUTOS_ATUAIS, linha)))
+
+        return {
+            "anos": list(anos),
+            "tributos": TRIBUTOS_ATUAIS,
+            "fatores_transicao": fatores,
+            "valores": por_ano,
+            "total": por_ano.sum(axis=2),
+            "economia_icms": fator_icms * economia_icms,
+            "saldo_credor_icms": fator_icms * saldo_credor_icms
+        }
+
     def obter_memoria_calculo(self):
         """Retorna a memória de cálculo dos tributos."""
         return self.memoria_calculo
@@ -448,10 +866,12 @@ class CalculadoraTributosAtuais:
 class CalculadoraIVADual:
     """Implementa os cálculos do IVA Dual conforme as regras da reforma tributária."""
 
-    def __init__(self, configuracao):
+    def __init__(self, configuracao, tabela_iss=None):
         self.config = configuracao
         self.memoria_calculo = {}  # Para armazenar os passos do cálculo
+        self.indice_memoria = IndiceMemoria()  # Memória de todos os anos da última comparação
         self.calculadora_atual = None
+        self.tabela_iss = tabela_iss
 
     def validar_dados(self, dados):
         """Valida os dados da empresa."""
@@ -481,8 +901,9 @@ class CalculadoraIVADual:
         self.memoria_calculo["base_tributavel"].append(
             f"Base de Cálculo: R$ {formatar_br(dados['faturamento'])} × {formatar_br(fator_transicao * 100)}% = R$ {formatar_br(base)}")
 
-        # Ajuste para setores especiais
-        if dados["setor"] in self.config.setores_especiais and dados["setor"] != "padrao":
+        # Ajuste para setores especiais (apenas os que possuem redução de alíquota)
+        regras_setor = self.config.setores_especiais.get(dados["setor"], self.config.setores_especiais["padrao"])
+        if dados["setor"] != "padrao" and regras_setor["reducao_CBS"] > 0:
             base_especial = dados["faturamento"] * (fator_transicao * 0.5)  # Redução adicional de 50% na base
             self.memoria_calculo["base_tributavel"].append(
                 f"Setor especial ({dados['setor']}): Redução adicional de 50% na base")
@@ -494,6 +915,10 @@ class CalculadoraIVADual:
 
     def calcular_creditos(self, dados, ano):
         """Calcula os créditos tributários disponíveis."""
+        return self.calcular_creditos_por_tributo(dados, ano)["total"]
+
+    def calcular_creditos_por_tributo(self, dados, ano):
+        """Calcula os créditos do período, separados entre CBS e IBS."""
         # Separar custos por origem
         custos_normais = dados.get("custos_tributaveis", 0)
         custos_simples = dados.get("custos_simples", 0)
@@ -513,7 +938,8 @@ class CalculadoraIVADual:
         self.memoria_calculo["creditos"].append(f"Total: {formatar_br(aliquotas['total'] * 100)}%")
 
         # Calcular créditos por tipo de origem
-        creditos = 0
+        creditos_cbs = 0
+        creditos_ibs = 0
 
         # Créditos de fornecedores do regime normal
         if custos_normais > 0:
@@ -522,7 +948,8 @@ class CalculadoraIVADual:
             self.memoria_calculo["creditos"].append(f"Custos: R$ {formatar_br(custos_normais)}")
             self.memoria_calculo["creditos"].append(
                 f"Crédito: R$ {formatar_br(custos_normais)} × ({formatar_br(aliquotas['CBS'] * 100)}% + {formatar_br(aliquotas['IBS'] * 100)}%) = R$ {formatar_br(credito_normal)}")
-            creditos += credito_normal
+            creditos_cbs += custos_normais * aliquotas["CBS"]
+            creditos_ibs += custos_normais * aliquotas["IBS"]
 
         # Créditos do Simples Nacional (limitado a 20%)
         if custos_simples > 0:
@@ -547,7 +974,10 @@ class CalculadoraIVADual:
                 f"Limite adicional (40% do imposto devido): R$ {formatar_br(imposto_devido)} × 40% = R$ {formatar_br(limite_imposto)}")
             self.memoria_calculo["creditos"].append(f"Crédito final (menor valor): R$ {formatar_br(credito_final)}")
 
-            creditos += credito_final
+            # Repartir o crédito final entre CBS e IBS na proporção das alíquotas
+            if aliquotas["total"] > 0:
+                creditos_cbs += credito_final * aliquotas["CBS"] / aliquotas["total"]
+                creditos_ibs += credito_final * aliquotas["IBS"] / aliquotas["total"]
 
         # Créditos de produtores rurais (60% sobre CBS)
         if custos_rurais > 0:
@@ -561,7 +991,8 @@ class CalculadoraIVADual:
             self.memoria_calculo["creditos"].append(
                 f"Crédito: R$ {formatar_br(custos_rurais)} × ({formatar_br(aliquotas['IBS'] * 100)}% + ({formatar_br(aliquotas['CBS'] * 100)}% × {formatar_br(self.config.regras_credito['rural'] * 100)}%)) = R$ {formatar_br(credito_rural)}")
 
-            creditos += credito_rural
+            creditos_cbs += custos_rurais * aliquotas["CBS"] * self.config.regras_credito["rural"]
+            creditos_ibs += custos_rurais * aliquotas["IBS"]
 
         # Créditos de importações
         if custos_importacoes > 0:
@@ -579,22 +1010,38 @@ class CalculadoraIVADual:
             self.memoria_calculo["creditos"].append(
                 f"Crédito: R$ {formatar_br(custos_importacoes)} × ({formatar_br(aliquotas['IBS'] * 100)}% × {formatar_br(self.config.regras_credito['importacoes']['IBS'] * 100)}% + {formatar_br(aliquotas['CBS'] * 100)}% × {formatar_br(self.config.regras_credito['importacoes']['CBS'] * 100)}%) = R$ {formatar_br(credito_importacao)}")
 
-            creditos += credito_importacao
-
-        # Adicionar créditos anteriores
-        creditos_anteriores = dados.get("creditos_anteriores", 0)
-        if creditos_anteriores > 0:
-            self.memoria_calculo["creditos"].append(f"\nCréditos Anteriores:")
-            self.memoria_calculo["creditos"].append(f"Valor: R$ {formatar_br(creditos_anteriores)}")
-            creditos += creditos_anteriores
+            creditos_cbs += custos_importacoes * aliquotas["CBS"] * self.config.regras_credito["importacoes"]["CBS"]
+            creditos_ibs += custos_importacoes * aliquotas["IBS"] * self.config.regras_credito["importacoes"]["IBS"]
 
-        # Total de créditos
+        # Total de créditos do período (saldos anteriores são tratados no livro de apuração)
+        creditos = creditos_cbs + creditos_ibs
+        self.memoria_calculo["creditos"].append(f"\nCréditos do período - CBS: R$ {formatar_br(creditos_cbs)}")
+        self.memoria_calculo["creditos"].append(f"Créditos do período - IBS: R$ {formatar_br(creditos_ibs)}")
         self.memoria_calculo["creditos"].append(f"\nTotal de Créditos: R$ {formatar_br(creditos)}")
 
-        return creditos
+        return {"CBS": creditos_cbs, "IBS": creditos_ibs, "total": creditos}
 
-    def calcular_imposto_devido(self, dados, ano):
-        """Calcula o imposto devido aplicando o IVA Dual, considerando a transição."""
+    def obter_saldos_iniciais(self, dados, ano):
+        """Define os saldos credores iniciais (CBS, IBS, ICMS) a partir dos dados da empresa.
+
+        `creditos_anteriores` é repartido entre CBS e IBS pela proporção das alíquotas do setor;
+        saldos específicos podem ser informados em `saldo_inicial_cbs`, `saldo_inicial_ibs` e `saldo_inicial_icms`.
+        """
+        aliquotas = self.config.obter_aliquotas_efetivas(dados["setor"], ano)
+        saldo_cbs, saldo_ibs = dividir_saldo_inicial(dados.get("creditos_anteriores", 0), aliquotas["CBS"],
+                                                     aliquotas["IBS"])
+        return {
+            "CBS": float(dados.get("saldo_inicial_cbs", saldo_cbs)),
+            "IBS": float(dados.get("saldo_inicial_ibs", saldo_ibs)),
+            "ICMS": float(dados.get("saldo_inicial_icms", 0))
+        }
+
+    def calcular_imposto_devido(self, dados, ano, saldos_iniciais=None):
+        """Calcula o imposto devido aplicando o IVA Dual, considerando a transição.
+
+        `saldos_iniciais` (CBS, IBS, ICMS) recebe os saldos credores transportados do ano anterior;
+        quando omitido, os saldos são obtidos de `creditos_anteriores`.
+        """
         # Limpar memória de cálculo anterior
         self.memoria_calculo = {
             "validacao": [],
@@ -653,25 +1100,64 @@ class CalculadoraIVADual:
         # 1. Primeiro calculamos os créditos que não dependem do imposto devido
         dados_iniciais = dados.copy()
         dados_iniciais["imposto_devido"] = imposto_bruto  # Estimativa inicial
-        creditos = self.calcular_creditos(dados_iniciais, ano)
+        creditos_periodo = self.calcular_creditos_por_tributo(dados_iniciais, ano)
+        creditos = creditos_periodo["total"]
 
-        # 2. Calcular o imposto devido final
-        imposto_devido = max(0, imposto_bruto - creditos)
+        # 2. Compensar débitos com os créditos do período e os saldos credores transportados
+        if saldos_iniciais is None:
+            saldos_iniciais = self.obter_saldos_iniciais(dados, ano)
 
+        saldos_finais = {}
+        creditos_utilizados = {}
+        devidos = {}
         self.memoria_calculo["imposto_devido"].append(f"Cálculo do Imposto Devido:")
-        self.memoria_calculo["imposto_devido"].append(f"Imposto Devido = Imposto Bruto - Créditos")
         self.memoria_calculo["imposto_devido"].append(
-            f"Imposto Devido = R$ {formatar_br(imposto_bruto)} - R$ {formatar_br(creditos)} = R$ {formatar_br(imposto_devido)}")
+            f"Imposto Devido = Débito - (Saldo Credor Anterior + Créditos do Período)")
+
+        for tributo, debito in (("CBS", cbs), ("IBS", ibs)):
+            devido, utilizado, saldo_final = compensar_creditos(debito, creditos_periodo[tributo],
+                                                                saldos_iniciais[tributo])
+            devidos[tributo] = float(devido)
+            creditos_utilizados[tributo] = float(utilizado)
+            saldos_finais[tributo] = float(saldo_final)
+
+            self.memoria_calculo["imposto_devido"].append(
+                f"{tributo}: R$ {formatar_br(debito)} - (R$ {formatar_br(saldos_iniciais[tributo])} + R$ {formatar_br(creditos_periodo[tributo])}) → devido R$ {formatar_br(devidos[tributo])}, saldo credor a transportar R$ {formatar_br(saldos_finais[tributo])}")
+
+        imposto_devido = devidos["CBS"] + devidos["IBS"]
+
+        self.memoria_calculo["imposto_devido"].append(
+            f"Imposto Devido = R$ {formatar_br(devidos['CBS'])} + R$ {formatar_br(devidos['IBS'])} = R$ {formatar_br(imposto_devido)}")
 
         # Calcular impostos do sistema atual
         if not self.calculadora_atual:
-            self.calculadora_atual = CalculadoraTributosAtuais(self.config)
+            self.calculadora_atual = CalculadoraTributosAtuais(self.config, self.tabela_iss)
 
         impostos_atuais = self.calculadora_atual.calcular_todos_impostos(dados, ano)
 
         # Registrar memória de cálculo dos impostos atuais
         self.memoria_calculo["impostos_atuais"] = self.calculadora_atual.memoria_calculo
 
+        # Saldo credor de ICMS transportado de anos anteriores
+        icms_antes_saldo = impostos_atuais.get("ICMS", 0)
+        icms_devido, utilizado, saldo_final = compensar_creditos(icms_antes_saldo,
+                                                                 impostos_atuais.get("saldo_credor_icms", 0),
+                                                                 saldos_iniciais["ICMS"])
+        creditos_utilizados["ICMS"] = float(utilizado)
+        saldos_finais["ICMS"] = float(saldo_final)
+
+        if saldos_iniciais["ICMS"] > 0 or saldos_finais["ICMS"] > 0:
+            self.memoria_calculo["impostos_atuais"]["ICMS"].append(f"\n== Saldo credor de ICMS ==")
+            self.memoria_calculo["impostos_atuais"]["ICMS"].append(
+                f"Saldo credor anterior: R$ {formatar_br(saldos_iniciais['ICMS'])}")
+            self.memoria_calculo["impostos_atuais"]["ICMS"].append(
+                f"ICMS devido após saldo credor: R$ {formatar_br(icms_antes_saldo)} - R$ {formatar_br(utilizado)} = R$ {formatar_br(icms_devido)}")
+            self.memoria_calculo["impostos_atuais"]["ICMS"].append(
+                f"Saldo credor a transportar: R$ {formatar_br(saldos_finais['ICMS'])}")
+
+            impostos_atuais["ICMS"] = float(icms_devido)
+            impostos_atuais["total"] = sum(impostos_atuais.get(tributo, 0) for tributo in TRIBUTOS_ATUAIS)
+
         # Aplicar créditos cruzados se aplicável
         if ano in self.config.creditos_cruzados:
             self.memoria_calculo["creditos_cruzados"].append(f"Aplicação de Créditos Cruzados (ano {ano}):")
@@ -702,7 +1188,7 @@ class CalculadoraIVADual:
                 f"ICMS final após crédito cruzado: R$ {formatar_br(icms_original)} - R$ {formatar_br(credito_ibs_para_icms)} = R$ {formatar_br(icms_final)}")
 
             impostos_atuais["ICMS"] = icms_final
-            impostos_atuais["total"] = sum(value for key, value in impostos_atuais.items() if key != "total")
+            impostos_atuais["total"] = sum(impostos_atuais.get(tributo, 0) for tributo in TRIBUTOS_ATUAIS)
 
             self.memoria_calculo["creditos_cruzados"].append(
                 f"Total de impostos atuais após crédito cruzado: R$ {formatar_br(impostos_atuais['total'])}")
@@ -732,6 +1218,11 @@ class CalculadoraIVADual:
             "ibs": ibs,
             "imposto_bruto": imposto_bruto,
             "creditos": creditos,
+            "creditos_cbs": creditos_periodo["CBS"],
+            "creditos_ibs": creditos_periodo["IBS"],
+            "saldos_iniciais": dict(saldos_iniciais),
+            "creditos_utilizados": creditos_utilizados,
+            "saldos_finais": saldos_finais,
             "imposto_devido": imposto_devido,
             "impostos_atuais": impostos_atuais,
             "total_devido": total_devido,
@@ -745,17 +1236,306 @@ class CalculadoraIVADual:
         """Retorna a memória de cálculo dos tributos."""
         return self.memoria_calculo
 
-    def calcular_comparativo(self, dados, anos=None):
-        """Compara o imposto devido em diferentes anos da transição."""
+    def liberar_memoria(self):
+        """Descarta a memória de cálculo e o índice da última execução, depois de guardados fora da calculadora."""
+        self.memoria_calculo = {}
+        self.indice_memoria = IndiceMemoria()
+        if self.calculadora_atual:
+            self.calculadora_atual.memoria_calculo = {}
+
+    def calcular_comparativo(self, dados, anos=None, projecoes=None, indice=None, empresa=None):
+        """Compara o imposto devido em diferentes anos da transição.
+
+        Sem `projecoes`, os mesmos `dados` valem para todos os anos. Com `projecoes` (ver `projetar_lote`),
+        a matriz ano × empresa é montada uma vez e todos os anos são avaliados por `calcular_lote`.
+        A memória de cada ano é indexada em `self.indice_memoria`; em carteiras, passe o mesmo `indice`
+        e o identificador da `empresa` a cada chamada para acumular a memória de todas as empresas.
+        """
         if anos is None:
             anos = list(self.config.fase_transicao.keys())
+        anos = sorted(anos)
+        self.indice_memoria = indice if indice is not None else IndiceMemoria()
 
+        if projecoes:
+            return self.calcular_comparativo_projetado(dados, anos, projecoes, empresa)
+
+        # Os anos são apurados em sequência para transportar os saldos credores
         resultados = {}
+        saldos = None
         for ano in anos:
-            resultados[ano] = self.calcular_imposto_devido(dados, ano)
+            resultados[ano] = self.calcular_imposto_devido(dados, ano, saldos)
+            saldos = resultados[ano]["saldos_finais"]
+            self.indice_memoria.adicionar(self.memoria_calculo, ano, empresa)
+
+        return resultados
+
+    def calcular_comparativo_projetado(self, dados, anos, projecoes, empresa=None):
+        """Avalia todos os anos de uma vez com os dados projetados; retorna o formato de `calcular_comparativo`."""
+        self.validar_dados(dados)
+        if not self.calculadora_atual:
+            self.calculadora_atual = CalculadoraTributosAtuais(self.config, self.tabela_iss)
+
+        # Incidência informada (ex: pela CNAE) e alíquota de ISS própria, como no cálculo anual
+        entrada = dict(dados, **(dados.get("incidencia") or {}))
+        entrada["aliquota_iss"] = self.calculadora_atual.obter_aliquota_iss(dados)[0]
+        lote = projetar_lote(preparar_lote([entrada], self.config), anos, projecoes)
+        resultado = self.calcular_lote(lote, anos)
+        resultados = self.resultados_por_ano(resultado)
+
+        def taxas_por_ano(taxas, unidade="%"):
+            serie = serie_anual(taxas, anos)[1:, 0]
+            return " | ".join(f"{ano}: {formatar_br(taxa * 100)}{unidade}" for ano, taxa in zip(anos[1:], serie)) or "-"
+
+        memoria_lote = self.memoria_calculo
+        self.memoria_calculo = {
+            "validacao": ["Dados validados com sucesso."],
+            "projecao": [
+                f"Crescimento da receita: {taxas_por_ano(projecoes.get('crescimento_receita', 0.0))}",
+                f"Inflação dos custos: {taxas_por_ano(projecoes.get('inflacao_custos', 0.0))}"
+            ] + [
+                f"Deriva do mix de custos para {campo}: {taxas_por_ano(taxas, ' p.p.')}"
+                for campo, taxas in projecoes.get("deriva_custos", {}).items()
+            ] + [
+                f"Valores explícitos nos anos: {', '.join(map(str, sorted(projecoes.get('valores', {})))) or '-'}"
+            ],
+            "base_tributavel": [],
+            "aliquotas": [],
+            "cbs": [],
+            "ibs": [],
+            "creditos": [],
+            "imposto_devido": [],
+            "impostos_atuais": memoria_lote["impostos_atuais"],
+            "creditos_cruzados": [],
+            "total_devido": []
+        }
+        indice_icms = TRIBUTOS_ATUAIS.index("ICMS")
+        for i, (ano, item) in enumerate(resultados.items()):
+            self.memoria_calculo["base_tributavel"].append(
+                f"{ano}: Faturamento projetado R$ {formatar_br(float(lote['faturamento'][anos.index(ano), 0]))} | "
+                f"Base tributável R$ {formatar_br(item['base_tributavel'])}")
+            self.memoria_calculo["aliquotas"].append(
+                f"{ano}: CBS {formatar_br(item['aliquotas_utilizadas']['CBS'] * 100)}% | "
+                f"IBS {formatar_br(item['aliquotas_utilizadas']['IBS'] * 100)}%")
+            self.memoria_calculo["cbs"].append(f"{ano}: CBS = R$ {formatar_br(item['cbs'])}")
+            self.memoria_calculo["ibs"].append(f"{ano}: IBS = R$ {formatar_br(item['ibs'])}")
+            self.memoria_calculo["creditos"].append(
+                f"{ano}: Créditos do período - CBS R$ {formatar_br(item['creditos_cbs'])} | "
+                f"IBS R$ {formatar_br(item['creditos_ibs'])} | Total R$ {formatar_br(item['creditos'])}")
+            saldo_anterior = item["saldos_iniciais"]["CBS"] + item["saldos_iniciais"]["IBS"]
+            saldo_final = item["saldos_finais"]["CBS"] + item["saldos_finais"]["IBS"]
+            self.memoria_calculo["creditos"].append(
+                f"{ano}: Saldo credor anterior R$ {formatar_br(saldo_anterior)} | "
+                f"Saldo a transportar R$ {formatar_br(saldo_final)}")
+            percentual_cruzado = self.config.creditos_cruzados.get(ano, {}).get("IBS_para_ICMS", 0)
+            if percentual_cruzado:
+                credito_cruzado = float(resultado["credito_cruzado"][i, 0])
+                icms_final = float(resultado["impostos_atuais"][i, 0, indice_icms])
+                self.memoria_calculo["creditos_cruzados"].append(
+                    f"{ano}: Crédito IBS para ICMS = min(R$ {formatar_br(item['ibs'])} × "
+                    f"{formatar_br(percentual_cruzado * 100)}%, R$ {formatar_br(icms_final + credito_cruzado)}) = "
+                    f"R$ {formatar_br(credito_cruzado)} | ICMS final R$ {formatar_br(icms_final)}")
+            self.memoria_calculo["imposto_devido"].append(
+                f"{ano}: Imposto Bruto R$ {formatar_br(item['imposto_bruto'])} - Créditos utilizados "
+                f"R$ {formatar_br(item['creditos_utilizados']['CBS'] + item['creditos_utilizados']['IBS'])} = "
+                f"R$ {formatar_br(item['imposto_devido'])}")
+            self.memoria_calculo["total_devido"].append(
+                f"{ano}: Total Devido R$ {formatar_br(item['total_devido'])} | "
+                f"Alíquota Efetiva {formatar_br(item['aliquota_efetiva'] * 100)}%")
+
+        # As linhas anuais ("2030: ...") são indexadas no seu ano; as demais, sem ano
+        prefixos = {f"{ano}:": ano for ano in anos}
+        memoria_por_ano = {}
+        for secao, linhas in self.memoria_calculo.items():
+            if not isinstance(linhas, list):
+                continue
+            for linha in linhas:
+                ano = prefixos.get(linha.split(" ", 1)[0])
+                memoria_por_ano.setdefault(ano, {}).setdefault(secao, []).append(linha)
+        for ano, memoria in memoria_por_ano.items():
+            self.indice_memoria.adicionar(memoria, ano, empresa)
+        self.indice_memoria.adicionar(memoria_lote["impostos_atuais"], None, empresa, ("impostos_atuais",))
 
         return resultados
 
+    def dados_projetados(self, dados, anos, projecoes):
+        """Dados da empresa em cada ano, com o faturamento e os custos projetados (ver `projetar_lote`)."""
+        anos = sorted(anos)
+        lote = projetar_lote(preparar_lote([dados], self.config), anos, projecoes)
+        return {ano: dict(dados, **{campo: float(lote[campo][i, 0]) for campo in ("faturamento",) + CAMPOS_CUSTO})
+                for i, ano in enumerate(anos)}
+
+    def resultados_por_ano(self, resultado, empresa=0):
+        """Converte o resultado de `calcular_lote` de uma empresa para o formato de `calcular_imposto_devido`."""
+        resultados = {}
+        for i, ano in enumerate(resultado["anos"]):
+            impostos_atuais = {tributo: float(resultado["impostos_atuais"][i, empresa, j])
+                               for j, tributo in enumerate(TRIBUTOS_ATUAIS)}
+            impostos_atuais["total"] = float(resultado["total_impostos_atuais"][i, empresa])
+            impostos_atuais["economia_icms"] = float(resultado["economia_icms"][i, empresa])
+            impostos_atuais["saldo_credor_icms"] = float(resultado["saldo_credor_icms"][i, empresa])
+
+            aliquota_cbs = float(resultado["aliquota_cbs"][i, empresa])
+            aliquota_ibs = float(resultado["aliquota_ibs"][i, empresa])
+            resultados[ano] = {
+                "ano": ano,
+                "base_tributavel": float(resultado["base_tributavel"][i, empresa]),
+                "cbs": float(resultado["cbs"][i, empresa]),
+                "ibs": float(resultado["ibs"][i, empresa]),
+                "imposto_bruto": float(resultado["imposto_bruto"][i, empresa]),
+                "creditos": float(resultado["creditos"][i, empresa]),
+                "creditos_cbs": float(resultado["creditos_cbs"][i, empresa]),
+                "creditos_ibs": float(resultado["creditos_ibs"][i, empresa]),
+                "saldos_iniciais": {tributo: float(resultado["saldos_iniciais"][i, empresa, j])
+                                    for j, tributo in enumerate(TRIBUTOS_SALDO)},
+                "creditos_utilizados": {tributo: float(resultado["creditos_utilizados"][i, empresa, j])
+                                        for j, tributo in enumerate(TRIBUTOS_SALDO)},
+                "saldos_finais": {tributo: float(resultado["saldos_finais"][i, empresa, j])
+                                  for j, tributo in enumerate(TRIBUTOS_SALDO)},
+                "imposto_devido": float(resultado["imposto_devido"][i, empresa]),
+                "impostos_atuais": impostos_atuais,
+                "total_devido": float(resultado["total_devido"][i, empresa]),
+                "aliquota_efetiva": float(resultado["aliquota_efetiva"][i, empresa]),
+                "aliquotas_utilizadas": {"CBS": aliquota_cbs, "IBS": aliquota_ibs, "total": aliquota_cbs + aliquota_ibs}
+            }
+        return resultados
+
+    def obter_regras_lote(self, setor, fator_transicao):
+        """Retorna as alíquotas efetivas de CBS e IBS e o fator de base para arrays de setores.
+
+        `fator_transicao` é combinado por broadcasting (ex: ano × 1 ou período × 1) com os setores (empresa).
+        """
+        nomes_setores = list(self.config.setores_especiais.keys())
+        ibs_setor = np.array([self.config.setores_especiais[nome]["IBS"] for nome in nomes_setores])[setor]
+        reducao_cbs = np.array([self.config.setores_especiais[nome]["reducao_CBS"] for nome in nomes_setores])[setor]
+
+        return {
+            "CBS": self.config.aliquotas_base["CBS"] * (1 - reducao_cbs) * fator_transicao,
+            "IBS": ibs_setor * fator_transicao,
+            # Redução adicional de 50% na base dos setores especiais (ver calcular_base_tributavel)
+            "fator_base": np.where((setor != nomes_setores.index("padrao")) & (reducao_cbs > 0), 0.5, 1.0)
+        }
+
+    def calcular_creditos_lote(self, custos, aliquota_cbs, aliquota_ibs, imposto_bruto):
+        """Versão vetorizada de `calcular_creditos_por_tributo`: retorna os créditos de CBS e de IBS.
+
+        `custos` contém os arrays custos_tributaveis, custos_simples, custos_rurais e custos_importacoes.
+        """
+        regras_credito = self.config.regras_credito
+        aliquota_total = aliquota_cbs + aliquota_ibs
+
+        # Simples Nacional: limitado a 20% da compra e a 40% do imposto devido
+        credito_simples = custos["custos_simples"] * regras_credito["simples"] * aliquota_total
+        credito_simples = np.minimum(credito_simples, imposto_bruto * 0.40)
+        participacao_cbs = np.divide(aliquota_cbs, aliquota_total, out=np.zeros_like(aliquota_total),
+                                     where=aliquota_total > 0)
+
+        creditos_cbs = (custos["custos_tributaveis"] * aliquota_cbs
+                        + credito_simples * participacao_cbs
+                        + custos["custos_rurais"] * aliquota_cbs * regras_credito["rural"]
+                        + custos["custos_importacoes"] * aliquota_cbs * regras_credito["importacoes"]["CBS"])
+        creditos_ibs = (custos["custos_tributaveis"] * aliquota_ibs
+                        + credito_simples * (1 - participacao_cbs)
+                        + custos["custos_rurais"] * aliquota_ibs
+                        + custos["custos_importacoes"] * aliquota_ibs * regras_credito["importacoes"]["IBS"])
+        return creditos_cbs, creditos_ibs
+
+    def calcular_lote(self, lote, anos=None):
+        """Calcula o IVA Dual e os tributos atuais para um lote de empresas (ver `preparar_lote`).
+
+        Todas as grandezas são arrays ano × empresa. Os saldos credores de CBS, IBS e ICMS são
+        transportados entre os anos pelo `LivroCreditos`, vetorizado sobre as empresas.
+        """
+        if anos is None:
+            anos = list(self.config.fase_transicao.keys())
+        anos = sorted(anos)
+
+        if not self.calculadora_atual:
+            self.calculadora_atual = CalculadoraTributosAtuais(self.config, self.tabela_iss)
+
+        faturamento = lote["faturamento"]
+        fator_transicao = np.array([self.config.fase_transicao.get(ano, 1.0) for ano in anos])[:, np.newaxis]
+
+        # Base tributável e alíquotas efetivas (ano × empresa)
+        regras = self.obter_regras_lote(lote["setor"], fator_transicao)
+        base = faturamento * regras["fator_base"] * fator_transicao
+        aliquota_cbs = regras["CBS"]
+        aliquota_ibs = regras["IBS"]
+
+        cbs = base * aliquota_cbs
+        ibs = base * aliquota_ibs
+        imposto_bruto = cbs + ibs
+
+        # Créditos do período por origem
+        creditos_cbs, creditos_ibs = self.calcular_creditos_lote(lote, aliquota_cbs, aliquota_ibs, imposto_bruto)
+
+        # Tributos atuais com a extinção progressiva
+        atuais = self.calculadora_atual.calcular_lote(lote, anos)
+        indice_icms = TRIBUTOS_ATUAIS.index("ICMS")
+
+        # Saldos iniciais: creditos_anteriores repartido entre CBS e IBS pelas alíquotas do primeiro ano
+        saldo_cbs, saldo_ibs = dividir_saldo_inicial(lote["creditos_anteriores"], aliquota_cbs[0], aliquota_ibs[0])
+        saldos_iniciais = np.stack([saldo_cbs, saldo_ibs, np.zeros_like(saldo_cbs)], axis=1)
+        # Saldos informados por empresa (saldo_inicial_cbs/ibs/icms) substituem os calculados
+        for i, campo in enumerate(CAMPOS_SALDO_INICIAL):
+            if campo in lote:
+                informado = lote[campo]
+                saldos_iniciais[:, i] = np.where(np.isnan(informado), saldos_iniciais[:, i], informado)
+
+        # Livro de apuração: débitos e créditos no formato ano × empresa × tributo (CBS, IBS, ICMS)
+        debitos = np.stack([cbs, ibs, atuais["valores"][:, :, indice_icms]], axis=2)
+        creditos = np.stack([creditos_cbs, creditos_ibs, atuais["saldo_credor_icms"]], axis=2)
+        apuracao = LivroCreditos(saldos_iniciais).executar(debitos, creditos)
+
+        imposto_devido = apuracao["devido"][:, :, 0] + apuracao["devido"][:, :, 1]
+
+        # Créditos cruzados IBS → ICMS
+        valores_atuais = atuais["valores"].copy()
+        icms = apuracao["devido"][:, :, 2]
+        percentual_cruzado = np.array([self.config.creditos_cruzados.get(ano, {}).get("IBS_para_ICMS", 0)
+                                       for ano in anos])[:, np.newaxis]
+        credito_cruzado = np.minimum(ibs * percentual_cruzado, icms)
+        valores_atuais[:, :, indice_icms] = icms - credito_cruzado
+
+        total_atuais = valores_atuais.sum(axis=2)
+        total_devido = imposto_devido + total_atuais
+        aliquota_efetiva = np.divide(total_devido, faturamento, out=np.zeros_like(total_devido),
+                                     where=faturamento > 0)
+
+        self.memoria_calculo = {
+            "lote": [
+                f"Empresas: {faturamento.shape[-1]}",
+                f"Anos: {anos[0]} a {anos[-1]}",
+                f"Saldos credores transportados: {', '.join(TRIBUTOS_SALDO)}"
+            ],
+            "impostos_atuais": self.calculadora_atual.memoria_calculo
+        }
+
+        return {
+            "anos": anos,
+            "base_tributavel": base,
+            "cbs": cbs,
+            "ibs": ibs,
+            "imposto_bruto": imposto_bruto,
+            "aliquota_cbs": aliquota_cbs,
+            "aliquota_ibs": aliquota_ibs,
+            "creditos_cbs": creditos_cbs,
+            "creditos_ibs": creditos_ibs,
+            "creditos": creditos_cbs + creditos_ibs,
+            "saldos_iniciais": apuracao["saldo_inicial"],
+            "creditos_utilizados": apuracao["utilizado"],
+            "saldos_finais": apuracao["saldo_final"],
+            "imposto_devido": imposto_devido,
+            "cbs_devido": apuracao["devido"][:, :, 0],
+            "ibs_devido": apuracao["devido"][:, :, 1],
+            "credito_cruzado": credito_cruzado,
+            "impostos_atuais": valores_atuais,
+            "economia_icms": atuais["economia_icms"],
+            "saldo_credor_icms": atuais["saldo_credor_icms"],
+            "total_impostos_atuais": total_atuais,
+            "total_devido": total_devido,
+            "aliquota_efetiva": aliquota_efetiva
+        }
+
     def calcular_aliquotas_equivalentes(self, dados, carga_atual, ano):
         """Calcula as alíquotas de CBS e IBS que resultariam em carga tributária equivalente à atual."""
         # Fator de transição para o ano
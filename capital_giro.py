@@ -0,0 +1,176 @@
+import numpy as np
+
+from apuracao import LivroCreditos
+from calculadoras import CAMPOS_CUSTO, CalculadoraIVADual, CalculadoraTributosAtuais
+
+
+def somar_deslocado(destino, valores, prazos):
+    """Soma `valores` (dia × empresa) em `destino` deslocados `prazos` dias (escalar ou por empresa).
+
+    Retorna, por empresa, o valor que ultrapassa o horizonte da simulação.
+    """
+    n_dias = valores.shape[0]
+    prazos = np.broadcast_to(np.asarray(prazos, dtype=int), valores.shape[1:])
+    excedente = np.zeros(valores.shape[1:])
+
+    # Poucos prazos distintos: um deslocamento por fatia de colunas
+    for prazo in np.unique(prazos):
+        colunas = prazos == prazo
+        if prazo <= 0:
+            destino[:, colunas] += valores[:, colunas]
+        elif prazo < n_dias:
+            destino[prazo:, colunas] += valores[:n_dias - prazo, colunas]
+            excedente[colunas] += valores[n_dias - prazo:, colunas].sum(axis=0)
+        else:
+            excedente[colunas] += valores[:, colunas].sum(axis=0)
+    return excedente
+
+
+class SimuladorCapitalGiro:
+    """Simulação diária do capital de giro com split payment da CBS/IBS (2026-2033).
+
+    Os fluxos de recebimento, pagamento e recolhimento são mantidos em arrays dia × empresa
+    pré-alocados. Com split payment a CBS/IBS destacada é retida na liquidação do recebimento e os
+    créditos do mês são devolvidos na apuração; sem split payment o IVA Dual é recolhido
+    mensalmente pelo valor líquido, como os tributos atuais.
+    """
+
+    def __init__(self, configuracao, ano_inicial=2026, ano_final=2033):
+        self.config = configuracao
+        self.calculadora_iva = CalculadoraIVADual(configuracao)
+        self.calculadora_atual = CalculadoraTributosAtuais(configuracao)
+
+        self.anos = list(range(ano_inicial, ano_final + 1))
+        self.dias = np.arange(np.datetime64(f"{ano_inicial}-01-01"), np.datetime64(f"{ano_final + 1}-01-01"))
+        meses = self.dias.astype("datetime64[M]")
+        self.meses = np.unique(meses)
+        self.indice_mes = (meses - self.meses[0]).astype(int)
+        self.indice_ano = self.dias.astype("datetime64[Y]").astype(int) + 1970 - ano_inicial
+        # 1970-01-01 foi uma quinta-feira: 0 = segunda-feira
+        self.dia_semana = (self.dias.astype(int) + 3) % 7
+
+    def perfil_diario(self, dias_uteis=True):
+        """Pesos diários das vendas e compras, normalizados para somar 1 em cada ano."""
+        pesos = (self.dia_semana < 5).astype(float) if dias_uteis else np.ones(len(self.dias))
+        total_ano = np.bincount(self.indice_ano, weights=pesos)
+        return pesos / total_ano[self.indice_ano]
+
+    def dias_recolhimento(self, dia_recolhimento):
+        """Índice do dia de recolhimento (no mês seguinte à competência) de cada mês; -1 fora do horizonte."""
+        vencimentos = (self.meses + 1).astype("datetime64[D]") + (dia_recolhimento - 1)
+        indices = (vencimentos - self.dias[0]).astype(int)
+        return np.where(indices < len(self.dias), indices, -1)
+
+    def obter_aliquotas(self, setor):
+        """Alíquotas efetivas de CBS e IBS no formato ano × empresa, a partir de `obter_aliquotas_efetivas`."""
+        nomes_setores = list(self.config.setores_especiais.keys())
+        tabela = np.array([[[self.config.obter_aliquotas_efetivas(nome, ano)[tributo] for tributo in ("CBS", "IBS")]
+                            for nome in nomes_setores] for ano in self.anos])
+        return tabela[:, setor, 0], tabela[:, setor, 1]
+
+    def simular(self, lote, prazo_recebimento=30, prazo_pagamento=30, split_payment=True, dia_recolhimento=20,
+                taxa_financiamento=0.12, saldo_inicial=0.0, dias_uteis=True):
+        """Executa a simulação diária para um lote de empresas (ver `preparar_lote`).
+
+        Os prazos podem ser escalares ou arrays por empresa (em dias). `taxa_financiamento` é a taxa
+        anual aplicada, sem capitalização, sobre o saldo de caixa negativo de cada dia.
+        """
+        n_empresas = np.asarray(lote["faturamento"]).size
+        n_dias = len(self.dias)
+        peso_dia = self.perfil_diario(dias_uteis)
+        peso_mes = np.bincount(self.indice_mes, weights=peso_dia)[:, np.newaxis]
+        ano_mes = self.indice_ano[np.searchsorted(self.indice_mes, np.arange(len(self.meses)))]
+
+        # Valores anuais (ano × empresa): IVA Dual destacado, créditos e tributos atuais
+        aliquota_cbs, aliquota_ibs = self.obter_aliquotas(lote["setor"])
+        fator_base = self.calculadora_iva.obter_regras_lote(lote["setor"], 1.0)["fator_base"]
+        faturamento = np.broadcast_to(lote["faturamento"], (len(self.anos), n_empresas))
+        debito_anual = faturamento * fator_base * (aliquota_cbs + aliquota_ibs)
+        creditos_cbs, creditos_ibs = self.calculadora_iva.calcular_creditos_lote(
+            lote, aliquota_cbs, aliquota_ibs, debito_anual)
+        credito_anual = creditos_cbs + creditos_ibs
+        atuais_anual = self.calculadora_atual.calcular_lote(lote, self.anos)["total"]
+
+        entradas = np.zeros((n_dias, n_empresas))
+        saidas = np.zeros((n_dias, n_empresas))
+        pendente = np.zeros(n_empresas)
+
+        # Recebimentos: com split payment o IVA destacado é retido na liquidação
+        receita_dia = peso_dia[:, np.newaxis] * faturamento[self.indice_ano]
+        debito_dia = peso_dia[:, np.newaxis] * debito_anual[self.indice_ano]
+        if split_payment:
+            retencao = np.zeros((n_dias, n_empresas))
+            somar_deslocado(retencao, debito_dia, prazo_recebimento)
+        else:
+            receita_dia += debito_dia
+        pendente += somar_deslocado(entradas, receita_dia, prazo_recebimento)
+        del receita_dia, debito_dia
+
+        # Pagamentos a fornecedores: todos os grupos de custo (normal, Simples, rural e importações)
+        # acrescidos do IVA que gera crédito
+        custos = sum(lote[campo] for campo in CAMPOS_CUSTO)
+        compras_dia = peso_dia[:, np.newaxis] * (custos + credito_anual[self.indice_ano])
+        pendente -= somar_deslocado(saidas, compras_dia, prazo_pagamento)
+        del compras_dia
+
+        # Apuração mensal: tributos atuais e IVA Dual (débitos, créditos e saldo credor)
+        vencimento = self.dias_recolhimento(dia_recolhimento)
+        no_horizonte = vencimento >= 0
+        atuais_mes = atuais_anual[ano_mes] * peso_mes
+        debito_mes = debito_anual[ano_mes] * peso_mes
+        credito_mes = credito_anual[ano_mes] * peso_mes
+        apuracao = LivroCreditos(lote["creditos_anteriores"]).executar(debito_mes, credito_mes)
+
+        saidas[vencimento[no_horizonte]] += atuais_mes[no_horizonte]
+        pendente -= atuais_mes[~no_horizonte].sum(axis=0)
+        if split_payment:
+            # Créditos utilizados na apuração são devolvidos, limitados ao valor já retido até o vencimento
+            retido = retencao.sum(axis=0)
+            np.cumsum(retencao, axis=0, out=retencao)
+            devolvido = np.minimum(np.cumsum(apuracao["utilizado"][no_horizonte], axis=0),
+                                   retencao[vencimento[no_horizonte]])
+            del retencao
+            devolvido = np.diff(devolvido, axis=0, prepend=0)
+            entradas[vencimento[no_horizonte]] += devolvido
+            pendente += apuracao["utilizado"].sum(axis=0) - devolvido.sum(axis=0)
+        else:
+            retido = devolvido = np.zeros(n_empresas)
+            saidas[vencimento[no_horizonte]] += apuracao["devido"][no_horizonte]
+            pendente -= apuracao["devido"][~no_horizonte].sum(axis=0)
+
+        # Saldo de caixa diário e custo de financiamento do saldo negativo
+        saldo = entradas - saidas
+        np.cumsum(saldo, axis=0, out=saldo)
+        saldo += saldo_inicial
+        taxa_diaria = taxa_financiamento / 365
+        negativo = np.maximum(-saldo, 0)
+        inicio_ano = np.searchsorted(self.indice_ano, np.arange(len(self.anos)))
+        custo_anual = np.add.reduceat(negativo, inicio_ano, axis=0) * taxa_diaria
+
+        return {
+            "dias": self.dias,
+            "anos": self.anos,
+            "entradas": entradas,
+            "saidas": saidas,
+            "saldo_caixa": saldo,
+            "retido_split_payment": retido,
+            "creditos_devolvidos": devolvido.sum(axis=0),
+            "saldo_credor_final": apuracao["saldo_final"][-1],
+            "custo_financeiro_anual": custo_anual,
+            "custo_financeiro": custo_anual.sum(axis=0),
+            "necessidade_capital_giro": negativo.max(axis=0),
+            "saldo_medio": saldo.mean(axis=0),
+            "pendente_apos_horizonte": pendente
+        }
+
+    def comparar(self, lote, **parametros):
+        """Compara o capital de giro com split payment e com recolhimento mensal do IVA Dual."""
+        com_split = self.simular(lote, split_payment=True, **parametros)
+        sem_split = self.simular(lote, split_payment=False, **parametros)
+        return {
+            "split_payment": com_split,
+            "recolhimento_mensal": sem_split,
+            "custo_adicional": com_split["custo_financeiro"] - sem_split["custo_financeiro"],
+            "custo_adicional_anual": com_split["custo_financeiro_anual"] - sem_split["custo_financeiro_anual"],
+            "necessidade_adicional": com_split["necessidade_capital_giro"] - sem_split["necessidade_capital_giro"]
+        }
@@ -1,5 +1,32 @@
+import copy
 import json
 import os
+import weakref
+from types import MappingProxyType
+
+import numpy as np
+
+# Ordem dos tributos atuais nas matrizes de transição
+TRIBUTOS_ATUAIS = ("PIS", "COFINS", "IPI", "ICMS", "ISS")
+
+# Valores imutáveis, lidos diretamente da configuração base (as tabelas são lidas por vistas somente leitura)
+TIPOS_IMUTAVEIS = (bool, int, float, complex, str, bytes, type(None))
+
+# Vistas somente leitura das tabelas de cada configuração base, montadas uma vez e compartilhadas pelas sessões
+VISTAS_BASE = weakref.WeakKeyDictionary()
+
+
+def somente_leitura(valor):
+    """Vista somente leitura de uma tabela: dicionários viram `MappingProxyType`, listas viram tuplas."""
+    if isinstance(valor, dict):
+        return MappingProxyType({chave: somente_leitura(item) for chave, item in valor.items()})
+    if isinstance(valor, list):
+        return tuple(somente_leitura(item) for item in valor)
+    if isinstance(valor, np.ndarray):
+        vista = valor.view()
+        vista.flags.writeable = False
+        return vista
+    return valor
 
 
 class ConfiguracaoTributaria:
@@ -12,6 +39,12 @@ class ConfiguracaoTributaria:
             "IBS": 0.177  # 17,7%
         }
 
+        # Repartição da alíquota de referência do IBS entre estados e municípios (aprox. proporção ICMS/ISS)
+        self.divisao_ibs = {
+            "estadual": 0.85,
+            "municipal": 0.15
+        }
+
         # Percentual progressivo (2026-2033) - Anexo III, LC 214/2025
         self.fase_transicao = dict()
         self.fase_transicao[2026] = 0.10  # 10% de implementação
@@ -29,7 +62,22 @@ class ConfiguracaoTributaria:
             "educacao": {"IBS": 0.125, "reducao_CBS": 0.40},  # Educação básica
             "saude": {"IBS": 0.145, "reducao_CBS": 0.30},  # Serviços médicos
             "alimentos": {"IBS": 0.120, "reducao_CBS": 0.25},  # Alimentos básicos
-            "transporte": {"IBS": 0.150, "reducao_CBS": 0.20}  # Transporte coletivo
+            "transporte": {"IBS": 0.150, "reducao_CBS": 0.20},  # Transporte coletivo
+            "industria": {"IBS": 0.177, "reducao_CBS": 0.0},  # Indústria de transformação
+            "comercio": {"IBS": 0.177, "reducao_CBS": 0.0},  # Comércio atacadista e varejista
+            "servicos": {"IBS": 0.177, "reducao_CBS": 0.0}  # Serviços em geral (LC 116/2003)
+        }
+
+        # Incidência dos tributos atuais por setor (ICMS, ISS e IPI)
+        self.incidencia_setores = {
+            "padrao": {"ICMS": True, "ISS": False, "IPI": False},
+            "educacao": {"ICMS": False, "ISS": True, "IPI": False},
+            "saude": {"ICMS": False, "ISS": True, "IPI": False},
+            "alimentos": {"ICMS": True, "ISS": False, "IPI": False},
+            "transporte": {"ICMS": True, "ISS": False, "IPI": False},  # Intermunicipal e interestadual
+            "industria": {"ICMS": True, "ISS": False, "IPI": True},
+            "comercio": {"ICMS": True, "ISS": False, "IPI": False},
+            "servicos": {"ICMS": False, "ISS": True, "IPI": False}
         }
 
         # Produtos com alíquota zero (Anexos I e XV)
@@ -40,6 +88,9 @@ class ConfiguracaoTributaria:
         # Limite para enquadramento no Simples Nacional - Art. 34º
         self.limite_simples = 4_800_000
 
+        # Limite de receita bruta anual para opção pelo Lucro Presumido - Lei 9.718/1998, art. 13
+        self.limite_presumido = 78_000_000
+
         # Regras de crédito - Art. 29º
         self.regras_credito = {
             "normal": 1.0,  # Crédito integral
@@ -68,13 +119,40 @@ class ConfiguracaoTributaria:
             }
         }
 
+        # Regras dos tributos atuais por regime de apuração (tabela indexada pelo regime)
+        self.regimes_tributarios = {
+            "real": {"PIS": 0.0165, "COFINS": 0.076, "credito_pis_cofins": 1.0, "das": False},  # Não cumulativo
+            "presumido": {"PIS": 0.0065, "COFINS": 0.03, "credito_pis_cofins": 0.0, "das": False},  # Cumulativo
+            "simples": {"PIS": 0.0, "COFINS": 0.0, "credito_pis_cofins": 0.0, "das": True}  # Recolhidos no DAS
+        }
+
+        # IRPJ e CSLL no Lucro Real (sobre o lucro) e no Presumido (sobre a receita presumida) - Lei 9.249/1995
+        self.tributos_renda = {
+            "IRPJ": 0.15,  # 15%
+            "adicional_IRPJ": 0.10,  # 10% sobre o lucro anual acima do limite
+            "limite_adicional": 240_000,
+            "CSLL": 0.09,  # 9%
+            # Percentuais de presunção do lucro sobre a receita bruta por setor (arts. 15 e 20)
+            "presuncao": {
+                "padrao": {"IRPJ": 0.08, "CSLL": 0.12},
+                "educacao": {"IRPJ": 0.32, "CSLL": 0.32},
+                "saude": {"IRPJ": 0.32, "CSLL": 0.32},  # Serviços hospitalares: 8% e 12%
+                "alimentos": {"IRPJ": 0.08, "CSLL": 0.12},
+                "transporte": {"IRPJ": 0.16, "CSLL": 0.12},  # Passageiros (cargas: 8%)
+                "industria": {"IRPJ": 0.08, "CSLL": 0.12},
+                "comercio": {"IRPJ": 0.08, "CSLL": 0.12},
+                "servicos": {"IRPJ": 0.32, "CSLL": 0.32}
+            }
+        }
+
         # Configurações para ICMS e incentivos fiscais
         self.icms_config = {
             "aliquota_entrada": 0.19,  # 19% padrão
             "aliquota_saida": 0.19,  # 19% padrão
             "incentivos_saida": [],  # Lista de dicionários para incentivos de saída
             "incentivos_entrada": [],  # Lista de dicionários para incentivos de entrada
-            "incentivos_apuracao": []  # Lista de dicionários para incentivos de apuração
+            "incentivos_apuracao": [],  # Lista de dicionários para incentivos de apuração
+            "prazo_diferimento_meses": 12  # Prazo padrão de recolhimento do ICMS diferido (simulação mensal)
         }
 
         # Estrutura de exemplo para incentivos
@@ -124,6 +202,12 @@ class ConfiguracaoTributaria:
                         self.fase_transicao = config["fase_transicao"]
                     if "setores_especiais" in config:
                         self.setores_especiais = config["setores_especiais"]
+                    if "incidencia_setores" in config:
+                        self.editar("incidencia_setores").update(config["incidencia_setores"])
+                    if "regimes_tributarios" in config:
+                        self.editar("regimes_tributarios").update(config["regimes_tributarios"])
+                    if "divisao_ibs" in config:
+                        self.editar("divisao_ibs").update(config["divisao_ibs"])
                 return True
             except Exception as e:
                 print(f"Erro ao carregar configurações: {e}")
@@ -137,16 +221,28 @@ class ConfiguracaoTributaria:
                 "aliquotas_base": self.aliquotas_base,
                 "fase_transicao": self.fase_transicao,
                 "setores_especiais": self.setores_especiais,
+                "incidencia_setores": self.incidencia_setores,
+                "regimes_tributarios": self.regimes_tributarios,
+                "divisao_ibs": self.divisao_ibs,
                 "limite_simples": self.limite_simples,
                 "regras_credito": self.regras_credito
             }
             with open(arquivo, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
+                # Tabelas lidas da configuração base de uma sessão chegam como vistas somente leitura
+                json.dump(config, f, indent=4, ensure_ascii=False, default=dict)
             return True
         except Exception as e:
             print(f"Erro ao salvar configurações: {e}")
             return False
 
+    def editar(self, nome):
+        """Tabela `nome` para alteração no lugar."""
+        return getattr(self, nome)
+
+    def copiar(self, nome):
+        """Cópia independente da tabela `nome`, que pode ser alterada ou guardada sem afetar a configuração."""
+        return copy.deepcopy(getattr(self, nome))
+
     def obter_aliquotas_efetivas(self, setor, ano):
         """Calcula as alíquotas efetivas considerando o setor e o ano."""
         # Obter fator de implementação para o ano
@@ -163,4 +259,85 @@ class ConfiguracaoTributaria:
             "CBS": cbs_efetivo,
             "IBS": ibs_efetivo,
             "total": cbs_efetivo + ibs_efetivo
-        }
\ No newline at end of file
+        }
+
+    def obter_incidencia_atual(self, setor):
+        """Retorna quais tributos atuais (ICMS, ISS, IPI) incidem sobre o setor."""
+        return self.incidencia_setores.get(setor, self.incidencia_setores["padrao"])
+
+    def obter_parametros_regime(self, regime):
+        """Retorna as regras dos tributos atuais para o regime (real, presumido ou simples)."""
+        return self.regimes_tributarios.get(regime, self.regimes_tributarios["real"])
+
+    def tabela_parametros_regimes(self, regimes):
+        """Retorna cada parâmetro de `regimes_tributarios` como array por empresa, indexado pelo regime."""
+        nomes, indice = np.unique(np.asarray(regimes).astype(str), return_inverse=True)
+        parametros = [self.obter_parametros_regime(nome) for nome in nomes]
+        return {chave: np.array([p[chave] for p in parametros], dtype=type(valor))[indice]
+                for chave, valor in self.regimes_tributarios["real"].items()}
+
+    def obter_reducao_transicao(self, ano):
+        """Retorna o percentual de redução de cada tributo atual no ano (extinção progressiva)."""
+        if ano in self.reducao_impostos_transicao:
+            return self.reducao_impostos_transicao[ano]
+
+        anos = sorted(self.reducao_impostos_transicao.keys())
+        if ano > anos[-1]:
+            # Após o fim da transição vale o último cronograma (tributos extintos)
+            return self.reducao_impostos_transicao[anos[-1]]
+        return {tributo: 0.0 for tributo in TRIBUTOS_ATUAIS}
+
+    def matriz_fatores_transicao(self, anos):
+        """Monta a matriz ano × tributo com o fator remanescente (1 - redução) dos tributos atuais."""
+        fatores = np.ones((len(anos), len(TRIBUTOS_ATUAIS)))
+        for i, ano in enumerate(anos):
+            reducao = self.obter_reducao_transicao(ano)
+            for j, tributo in enumerate(TRIBUTOS_ATUAIS):
+                fatores[i, j] = 1.0 - reducao.get(tributo, 0.0)
+        return fatores
+
+
+class ConfiguracaoSessao(ConfiguracaoTributaria):
+    """Configuração de uma sessão sobreposta a uma configuração base compartilhada entre sessões.
+
+    Só a sobreposição fica na instância. As tabelas da base são lidas por vistas somente leitura,
+    compartilhadas entre as sessões; uma tabela só é copiada para a sessão quando alterada por
+    `editar` (cópia sob demanda), de modo que alterações nunca chegam à base compartilhada.
+    """
+
+    def __init__(self, base):
+        self.base = base
+
+    def __getattr__(self, nome):
+        # Chamado só para atributos ausentes da instância, isto é, ainda não editados na sessão
+        if nome == "base" or nome.startswith("__"):
+            raise AttributeError(nome)
+        valor = getattr(self.base, nome)
+        if isinstance(valor, TIPOS_IMUTAVEIS):
+            return valor
+        vistas = VISTAS_BASE.setdefault(self.base, {})
+        if nome not in vistas:
+            vistas[nome] = somente_leitura(valor)
+        return vistas[nome]
+
+    def editar(self, nome):
+        """Tabela `nome` da sessão para alteração no lugar, copiada da base na primeira edição."""
+        if nome not in vars(self):
+            setattr(self, nome, self.base.copiar(nome))
+        return vars(self)[nome]
+
+    def copiar(self, nome):
+        """Cópia independente da tabela `nome` (da sessão, se já editada, ou da base)."""
+        return copy.deepcopy(vars(self)[nome]) if nome in vars(self) else self.base.copiar(nome)
+
+    def sobreposicao(self):
+        """Atributos próprios da sessão (os demais vêm da configuração base)."""
+        return {nome: valor for nome, valor in vars(self).items() if nome != "base"}
+
+    def __getstate__(self):
+        # Serializa apenas a sobreposição; ao ser restaurada, usa uma configuração padrão como base
+        return self.sobreposicao()
+
+    def __setstate__(self, estado):
+        self.base = ConfiguracaoTributaria()
+        self.__dict__.update(estado)
@@ -0,0 +1,200 @@
+import csv
+import os
+
+import numpy as np
+
+from cadeia import MatrizEsparsa
+from icms_interestadual import UFS
+from utils import formatar_br
+
+# Código IBGE da UF (dois primeiros dígitos do código do município) → sigla
+CODIGOS_UF = {
+    11: "RO", 12: "AC", 13: "AM", 14: "RR", 15: "PA", 16: "AP", 17: "TO", 21: "MA", 22: "PI", 23: "CE",
+    24: "RN", 25: "PB", 26: "PE", 27: "AL", 28: "SE", 29: "BA", 31: "MG", 32: "ES", 33: "RJ", 35: "SP",
+    41: "PR", 42: "SC", 43: "RS", 50: "MS", 51: "MT", 52: "GO", 53: "DF"
+}
+
+# Índice em UFS por código IBGE da UF (-1 para códigos inexistentes)
+INDICE_UF_IBGE = np.full(100, -1, dtype=np.int64)
+INDICE_UF_IBGE[list(CODIGOS_UF.keys())] = [UFS.index(uf) for uf in CODIGOS_UF.values()]
+
+
+class TabelaMunicipios:
+    """Cadastro de municípios indexado pelo código IBGE (7 dígitos) para consultas vetorizadas.
+
+    Guarda, em arrays ordenados pelo código, a UF e as alíquotas estadual e municipal do IBS de cada
+    município; a consulta é um `np.searchsorted`. Municípios sem alíquota própria usam a alíquota de
+    referência repartida por `divisao_ibs`.
+    """
+
+    def __init__(self, configuracao, arquivo=None):
+        self.config = configuracao
+        self.codigos = np.empty(0, dtype=np.int64)
+        self.uf = np.empty(0, dtype=np.int64)
+        self.aliquota_estadual = np.empty(0)
+        self.aliquota_municipal = np.empty(0)
+        self.nomes = np.empty(0, dtype=object)
+        if arquivo:
+            self.carregar(arquivo)
+
+    def aliquotas_padrao(self):
+        """Alíquotas estadual e municipal de referência pela divisão configurada."""
+        aliquota = self.config.aliquotas_base["IBS"]
+        return aliquota * self.config.divisao_ibs["estadual"], aliquota * self.config.divisao_ibs["municipal"]
+
+    def construir(self, codigos, nomes=None, aliquota_estadual=None, aliquota_municipal=None):
+        """Monta o índice a partir de arrays; alíquotas ausentes (NaN) recebem as de referência."""
+        codigos = np.asarray(codigos, dtype=np.int64)
+        uf = INDICE_UF_IBGE[np.clip(codigos // 100_000, 0, 99)]
+        if codigos.size and (uf < 0).any():
+            raise ValueError(f"Código IBGE inválido: {codigos[uf < 0][0]}")
+
+        padrao_estadual, padrao_municipal = self.aliquotas_padrao()
+        estadual = np.full(codigos.size, np.nan) if aliquota_estadual is None else np.asarray(aliquota_estadual, dtype=float)
+        municipal = np.full(codigos.size, np.nan) if aliquota_municipal is None else np.asarray(aliquota_municipal, dtype=float)
+
+        ordem = np.argsort(codigos, kind="stable")
+        self.codigos = codigos[ordem]
+        self.uf = uf[ordem]
+        self.aliquota_estadual = np.where(np.isnan(estadual), padrao_estadual, estadual)[ordem]
+        self.aliquota_municipal = np.where(np.isnan(municipal), padrao_municipal, municipal)[ordem]
+        self.nomes = (np.full(codigos.size, "", dtype=object) if nomes is None else np.asarray(nomes, dtype=object))[ordem]
+        return self
+
+    def carregar(self, arquivo):
+        """Carrega o cadastro de um CSV local (codigo_ibge;nome;aliquota_estadual;aliquota_municipal)."""
+        if not os.path.exists(arquivo):
+            return False
+
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                linhas = list(csv.DictReader(f, delimiter=";"))
+
+            def aliquota(linha, campo):
+                valor = (linha.get(campo) or "").strip().replace(",", ".")
+                return float(valor) if valor else np.nan
+
+            self.construir([int(linha["codigo_ibge"]) for linha in linhas],
+                           [linha.get("nome", "") for linha in linhas],
+                           [aliquota(linha, "aliquota_estadual") for linha in linhas],
+                           [aliquota(linha, "aliquota_municipal") for linha in linhas])
+        except Exception as e:
+            print(f"Erro ao carregar tabela de municípios: {e}")
+            return False
+        return True
+
+    def consultar(self, codigos):
+        """UF e alíquotas estadual e municipal de cada código IBGE, sem alterar a tabela.
+
+        Códigos ausentes da tabela recebem a UF do próprio código e as alíquotas de referência; códigos
+        de UF inexistente levantam ValueError.
+        """
+        codigos = np.asarray(codigos, dtype=np.int64)
+        uf = INDICE_UF_IBGE[np.clip(codigos // 100_000, 0, 99)]
+        if codigos.size and (uf < 0).any():
+            raise ValueError(f"Código IBGE inválido: {codigos[uf < 0][0]}")
+
+        posicoes = np.searchsorted(self.codigos, codigos)
+        encontrados = posicoes < self.codigos.size
+        encontrados[encontrados] = self.codigos[posicoes[encontrados]] == codigos[encontrados]
+
+        padrao_estadual, padrao_municipal = self.aliquotas_padrao()
+        estadual = np.full(codigos.size, padrao_estadual)
+        municipal = np.full(codigos.size, padrao_municipal)
+        estadual[encontrados] = self.aliquota_estadual[posicoes[encontrados]]
+        municipal[encontrados] = self.aliquota_municipal[posicoes[encontrados]]
+        return {"uf": uf, "aliquota_estadual": estadual, "aliquota_municipal": municipal}
+
+
+class DistribuicaoIBS:
+    """Repartição do IBS pelo princípio do destino entre estados e municípios.
+
+    As vendas por destino são informadas como triplas esparsas (empresa, município, valor). Cada empresa
+    tem seu IBS repartido na proporção das vendas ponderadas pela alíquota total do destino; em cada
+    destino, a parcela estadual e a municipal seguem suas alíquotas. A agregação por município e por UF
+    é feita com `MatrizEsparsa`, e o resultado são arrays (ano × município, ano × UF), não dicionários.
+    """
+
+    def __init__(self, configuracao, tabela=None):
+        self.config = configuracao
+        self.tabela = tabela if tabela is not None else TabelaMunicipios(configuracao)
+        self.memoria_calculo = {}
+
+    def distribuir(self, ibs, empresas, municipios, valores):
+        """Distribui o IBS de cada empresa (array N ou ano × N) pelas vendas por município de destino.
+
+        `empresas` são índices 0..N-1 alinhados ao eixo de empresas de `ibs`; `municipios`, códigos IBGE.
+        O IBS de empresas sem vendas informadas fica em `nao_distribuido`.
+        """
+        ibs = np.asarray(ibs, dtype=float)
+        por_ano = ibs.ndim == 2
+        ibs_anos = ibs if por_ano else ibs[np.newaxis, :]
+        n = ibs_anos.shape[1]
+
+        empresas = np.asarray(empresas, dtype=np.int64)
+        valores = np.asarray(valores, dtype=float)
+        if empresas.size and (empresas.min() < 0 or empresas.max() >= n):
+            raise ValueError(f"Índices de empresa devem estar entre 0 e {n - 1}")
+
+        # Municípios de destino (com vendas) e suas alíquotas, consultados na tabela compartilhada
+        destinos, indice = np.unique(np.asarray(municipios, dtype=np.int64), return_inverse=True)
+        dados_destinos = self.tabela.consultar(destinos)
+        uf_destinos = dados_destinos["uf"]
+        estadual = dados_destinos["aliquota_estadual"][indice]
+        municipal = dados_destinos["aliquota_municipal"][indice]
+        aliquota_total = estadual + municipal
+
+        # Participação de cada destino no IBS da empresa: vendas × alíquota total do destino
+        peso = valores * aliquota_total
+        total_empresa = np.bincount(empresas, weights=peso, minlength=n)
+        participacao = np.divide(peso, total_empresa[empresas], out=np.zeros_like(peso),
+                                 where=total_empresa[empresas] > 0)
+        parcela_estadual = np.divide(estadual, aliquota_total, out=np.zeros_like(estadual), where=aliquota_total > 0)
+
+        # Agregação esparsa: município × empresa e UF × empresa, aplicadas ao IBS de todos os anos de uma vez
+        m = destinos.size
+        uf = uf_destinos[indice]
+        por_municipio = MatrizEsparsa(indice, empresas, participacao * (1 - parcela_estadual), (m, n))
+        por_uf = MatrizEsparsa(uf, empresas, participacao * parcela_estadual, (len(UFS), n))
+        ibs_municipal = por_municipio.multiplicar(ibs_anos.T).T
+        ibs_estadual = por_uf.multiplicar(ibs_anos.T).T
+
+        # Participação de cada UF (estado + municípios) no IBS de cada empresa
+        participacao_uf = np.bincount(empresas * len(UFS) + uf, weights=participacao,
+                                      minlength=n * len(UFS)).reshape(n, len(UFS))
+
+        municipal_por_uf = np.zeros_like(ibs_estadual)
+        np.add.at(municipal_por_uf, (slice(None), uf_destinos), ibs_municipal)
+        nao_distribuido = ibs_anos[:, total_empresa <= 0].sum(axis=1)
+
+        self.memoria_calculo = {
+            "distribuicao_ibs": [
+                f"Empresas: {n} | Linhas de vendas: {valores.size} | Municípios de destino: {destinos.size}",
+                f"Divisão de referência: estadual {formatar_br(self.config.divisao_ibs['estadual'] * 100)}% | "
+                f"municipal {formatar_br(self.config.divisao_ibs['municipal'] * 100)}%",
+                f"IBS distribuído: R$ {formatar_br(float(ibs_anos.sum() - nao_distribuido.sum()))}",
+                f"IBS sem vendas por destino informadas: R$ {formatar_br(float(nao_distribuido.sum()))}"
+            ]
+        }
+
+        def formatar(valores_ano):
+            return valores_ano if por_ano else valores_ano[0]
+
+        return {
+            "ufs": UFS,
+            "municipios": destinos,
+            "uf_municipio": uf_destinos,
+            "ibs_municipal": formatar(ibs_municipal),
+            "ibs_estadual": formatar(ibs_estadual),
+            "ibs_municipal_por_uf": formatar(municipal_por_uf),
+            "ibs_por_uf": formatar(ibs_estadual + municipal_por_uf),
+            "participacao_empresa_uf": participacao_uf,
+            "nao_distribuido": formatar(nao_distribuido)
+        }
+
+    def distribuir_resultado(self, resultado, municipios, valores):
+        """Distribui o IBS devido de um resultado de `calcular_imposto_devido` pelas vendas de uma empresa."""
+        ibs_devido = resultado["ibs"] - resultado["creditos_utilizados"]["IBS"]
+        municipios = np.asarray(municipios)
+        return self.distribuir(np.array([ibs_devido]), np.zeros(municipios.size, dtype=np.int64),
+                               municipios, valores)
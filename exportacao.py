@@ -0,0 +1,1011 @@
+import asyncio
+import hashlib
+import io
+import itertools
+import json
+import math
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, LineChart, Reference
+from openpyxl.chart.label import DataLabelList
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import Font, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+
+from indice_memoria import IndiceMemoria
+from utils import formatar_br, consultar_cache, SECOES_MEMORIA
+
+# Arquivos gerados mantidos em cache (por formato e impressão digital da simulação), limitados em número
+# e no total de bytes; tarefas na fila ou em execução nunca são descartadas
+LIMITE_CACHE_EXPORTACOES = 16
+LIMITE_BYTES_EXPORTACOES = 256 * 1024 * 1024
+TRABALHADORES_EXPORTACAO = 2
+
+# Parâmetros da simulação (chaves do estado da sessão) exibidos nos arquivos, com o valor padrão
+PARAMETROS_EXPORTACAO = {
+    "faturamento": 0,
+    "custos_tributaveis": 0,
+    "custos_simples": 0,
+    "creditos_anteriores": 0,
+    "setor": "padrao",
+    "regime": "real",
+    "carga_atual": 25,
+    "aliquota_entrada": 19,
+    "aliquota_saida": 19
+}
+
+# Limite de linhas de uma planilha do Excel e linhas gravadas por bloco no arquivo
+LIMITE_LINHAS_PLANILHA = 1048576
+LINHAS_POR_BLOCO_XML = 5000
+
+# Caracteres de controle não aceitos em XML 1.0
+CARACTERES_INVALIDOS_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Elemento vazio <sheetData> gravado pelo openpyxl (testado com 3.1.x) nas abas write-only sem linhas
+SHEETDATA_VAZIO = re.compile(r"<sheetData\s*/>|<sheetData>\s*</sheetData>")
+
+# Estilos nomeados do arquivo Excel, registrados uma vez por workbook e compartilhados pelas células
+ESTILOS_EXCEL = {
+    "titulo": {"font": Font(bold=True, size=14)},
+    "subtitulo": {"font": Font(bold=True)},
+    "cabecalho": {"font": Font(bold=True),
+                  "fill": PatternFill(start_color='DDDDDD', end_color='DDDDDD', fill_type='solid')},
+    "moeda": {"number_format": '#,##0.00'},
+    "percentual": {"number_format": '0.00%'},
+    "rodape": {"font": Font(italic=True, size=9)}
+}
+
+# Colunas exibidas em percentual (valores em fração) nas abas do Excel
+COLUNAS_PERCENTUAIS = ("Alíquota Efetiva (%)", "Percentual", "% Operações", "IBS (%)", "Redução CBS (%)")
+
+# Colunas da aba de resultados de uma carteira: cabeçalho e chave do resultado de `calcular_lote`
+CAMPOS_CARTEIRA_EXCEL = (
+    ("CBS (R$)", "cbs"),
+    ("IBS (R$)", "ibs"),
+    ("Imposto Bruto (R$)", "imposto_bruto"),
+    ("Créditos (R$)", "creditos"),
+    ("Imposto Devido (R$)", "imposto_devido"),
+    ("Impostos Atuais (R$)", "total_impostos_atuais"),
+    ("Total Devido (R$)", "total_devido"),
+    ("Alíquota Efetiva (%)", "aliquota_efetiva")
+)
+
+
+def sem_progresso(fracao, etapa):
+    """Callback de progresso padrão (não faz nada)."""
+
+
+def serializar_impressao(valor):
+    """Representação de valores não JSON na impressão digital (arrays pelo hash do conteúdo)."""
+    if isinstance(valor, np.ndarray):
+        return f"array:{valor.shape}:{hashlib.sha1(np.ascontiguousarray(valor).tobytes()).hexdigest()}"
+    if isinstance(valor, IndiceMemoria):
+        return f"indice:{len(valor)}"
+    return float(valor)
+
+
+def impressao_instantaneo(instantaneo):
+    """Hash do instantâneo da simulação, incluindo arrays de carteiras e o índice da memória."""
+    conteudo = json.dumps(instantaneo, sort_keys=True, default=serializar_impressao)
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+
+
+def escapar_xml(texto):
+    """Escapa um texto para uma célula XML, removendo caracteres de controle inválidos."""
+    return escape(CARACTERES_INVALIDOS_XML.sub("", texto))
+
+
+class PlanilhaFluxo:
+    """Planilha write-only cujas linhas são gravadas em fluxo direto no XML do arquivo.
+
+    A planilha é criada vazia no workbook do openpyxl (larguras, gráficos e formatação condicional
+    continuam com o openpyxl); as linhas são registradas como blocos de colunas e só são percorridas
+    ao gravar o arquivo (`salvar_workbook`), com strings inline e os estilos nomeados do workbook.
+    """
+
+    def __init__(self, wb, titulo, larguras=None):
+        self.ws = wb.create_sheet(title=titulo)
+        for letra, largura in (larguras or {}).items():
+            self.ws.column_dimensions[letra].width = largura
+        self.blocos = []
+        self.total_linhas = 0
+
+    def estilo(self, nome):
+        """Índice do estilo nomeado (registrado no workbook) usado no atributo `s` das células."""
+        if nome is None:
+            return None
+        celula = WriteOnlyCell(self.ws)
+        celula.style = nome
+        return celula.style_id
+
+    def adicionar_linhas(self, linhas, n, estilos):
+        """Registra `n` linhas de um iterador de tuplas, com um estilo nomeado (ou None) por coluna."""
+        self.blocos.append((linhas, n, [self.estilo(nome) for nome in estilos]))
+        self.total_linhas += n
+        return self.total_linhas
+
+    def adicionar_colunas(self, colunas, estilos=None):
+        """Registra linhas a partir de colunas (sequências do mesmo tamanho), escritas coluna a coluna."""
+        return self.adicionar_linhas(zip(*colunas), len(colunas[0]), estilos or [None] * len(colunas))
+
+    def adicionar_linha(self, valores=(), estilo=None):
+        """Registra uma linha com o mesmo estilo nomeado em todas as células; retorna o número da linha."""
+        return self.adicionar_linhas(iter([tuple(valores)]), 1, [estilo] * len(valores))
+
+    def linhas_xml(self, progresso=None):
+        """Gera o XML das linhas em blocos de texto, na ordem em que foram registradas."""
+        linha_atual = 0
+        for linhas, n, estilos in self.blocos:
+            # Início de cada célula por coluna (referência da coluna e estilo), montado uma vez por bloco
+            inicios = [f'<c r="{get_column_letter(i)}' for i in range(1, len(estilos) + 1)]
+            atributos = ["" if s is None else f' s="{s}"' for s in estilos]
+            colunas = list(zip(inicios, atributos))
+            partes = []
+            for valores in linhas:
+                linha_atual += 1
+                partes.append(f'<row r="{linha_atual}">')
+                for (inicio, atributo), valor in zip(colunas, valores):
+                    tipo = valor.__class__
+                    if tipo is float or tipo is int:
+                        if math.isfinite(valor):
+                            partes.append(f'{inicio}{linha_atual}"{atributo} t="n"><v>{valor!r}</v></c>')
+                    elif tipo is str:
+                        partes.append(f'{inicio}{linha_atual}"{atributo} t="inlineStr"><is>'
+                                      f'<t xml:space="preserve">{escapar_xml(valor)}</t></is></c>')
+                    elif valor is None:
+                        if atributo:
+                            partes.append(f'{inicio}{linha_atual}"{atributo}/>')
+                    elif isinstance(valor, (bool, np.bool_)):
+                        partes.append(f'{inicio}{linha_atual}"{atributo} t="b"><v>{int(valor)}</v></c>')
+                    elif isinstance(valor, str):
+                        partes.append(f'{inicio}{linha_atual}"{atributo} t="inlineStr"><is>'
+                                      f'<t xml:space="preserve">{escapar_xml(valor)}</t></is></c>')
+                    elif math.isfinite(valor):
+                        partes.append(f'{inicio}{linha_atual}"{atributo} t="n"><v>{float(valor)!r}</v></c>')
+                partes.append("</row>")
+                if linha_atual % LINHAS_POR_BLOCO_XML == 0:
+                    yield "".join(partes)
+                    partes = []
+                    if progresso:
+                        progresso(LINHAS_POR_BLOCO_XML)
+            yield "".join(partes)
+
+
+def salvar_workbook(wb, planilhas, progresso=sem_progresso):
+    """Grava o workbook write-only e insere em fluxo as linhas das `planilhas`; retorna os bytes do arquivo."""
+    modelo = io.BytesIO()
+    wb.save(modelo)
+    caminhos = {planilha.ws.path.lstrip("/"): planilha for planilha in planilhas}
+    total = max(sum(planilha.total_linhas for planilha in planilhas), 1)
+    gravadas = [0]
+
+    def avancar(linhas):
+        gravadas[0] += linhas
+        progresso(0.5 + 0.45 * min(gravadas[0] / total, 1.0), f"Gravando linhas ({gravadas[0]:,} de {total:,})")
+
+    saida = io.BytesIO()
+    with zipfile.ZipFile(modelo) as origem, zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as destino:
+        for item in origem.infolist():
+            conteudo = origem.read(item.filename)
+            if item.filename not in caminhos:
+                destino.writestr(item, conteudo)
+                continue
+
+            partes = SHEETDATA_VAZIO.split(conteudo.decode("utf-8"))
+            if len(partes) != 2:
+                raise ValueError(f"Formato inesperado da aba {item.filename}: <sheetData> vazio não encontrado "
+                                 "(verifique a versão do openpyxl)")
+            inicio, fim = partes
+            with destino.open(item.filename, "w", force_zip64=True) as arquivo:
+                arquivo.write((inicio + "<sheetData>").encode("utf-8"))
+                for bloco in caminhos[item.filename].linhas_xml(avancar):
+                    arquivo.write(bloco.encode("utf-8"))
+                arquivo.write(("</sheetData>" + fim).encode("utf-8"))
+    return saida.getvalue()
+
+
+def registrar_estilos(wb):
+    """Registra no workbook os estilos nomeados compartilhados por todas as células."""
+    for nome, atributos in ESTILOS_EXCEL.items():
+        wb.add_named_style(NamedStyle(name=nome, **atributos))
+
+
+def tabela_resultados_excel(instantaneo):
+    """Colunas e número de linhas da aba de resultados: uma linha por ano ou, em carteiras, por ano × empresa.
+
+    Em carteiras as colunas são iteradores sobre os arrays do resultado, percorridos só na gravação.
+    """
+    carteira = instantaneo.get("carteira")
+    if carteira:
+        resultado = carteira["resultado"]
+        n_anos, n_empresas = resultado["cbs"].shape
+        empresas = carteira.get("empresas") or [f"Empresa {i + 1}" for i in range(n_empresas)]
+        colunas = {
+            "Ano": itertools.chain.from_iterable(itertools.repeat(int(ano), n_empresas) for ano in carteira["anos"]),
+            "Empresa": itertools.cycle(empresas)
+        }
+        for cabecalho, chave in CAMPOS_CARTEIRA_EXCEL:
+            colunas[cabecalho] = map(float, resultado[chave].flat)
+        return colunas, n_anos * n_empresas
+
+    resultados = instantaneo["resultados"]
+    aliquotas_equivalentes = instantaneo["aliquotas_equivalentes"]
+    anos = sorted(resultados.keys())
+    valor_atual = [aliquotas_equivalentes[ano]["valor_atual"] for ano in anos]
+    imposto_devido = [resultados[ano]["imposto_devido"] for ano in anos]
+    return {
+        "Ano": anos,
+        "CBS (R$)": [resultados[ano]["cbs"] for ano in anos],
+        "IBS (R$)": [resultados[ano]["ibs"] for ano in anos],
+        "Imposto Bruto (R$)": [resultados[ano]["imposto_bruto"] for ano in anos],
+        "Créditos (R$)": [resultados[ano]["creditos"] for ano in anos],
+        "Imposto Devido (R$)": imposto_devido,
+        "Carga Atual (R$)": valor_atual,
+        "Diferença (R$)": [devido - atual for devido, atual in zip(imposto_devido, valor_atual)],
+        "Alíquota Efetiva (%)": [resultados[ano]["aliquota_efetiva"] for ano in anos]
+    }, len(anos)
+
+
+def resumo_anual_carteira(carteira):
+    """Soma por ano das colunas monetárias da carteira (base dos gráficos)."""
+    resultado = carteira["resultado"]
+    resumo = {"Ano": [int(ano) for ano in carteira["anos"]]}
+    for cabecalho, chave in CAMPOS_CARTEIRA_EXCEL:
+        if cabecalho.endswith("(R$)"):
+            resumo[cabecalho] = resultado[chave].sum(axis=1).tolist()
+    return resumo
+
+
+def estilo_coluna(cabecalho):
+    """Estilo nomeado das células de uma coluna, a partir do cabeçalho."""
+    if cabecalho in COLUNAS_PERCENTUAIS:
+        return "percentual"
+    return "moeda" if cabecalho.endswith("(R$)") else None
+
+
+def escrever_tabela(planilha, titulo, colunas):
+    """Título (se houver), cabeçalho e colunas de uma tabela; retorna a linha do cabeçalho."""
+    if titulo:
+        planilha.adicionar_linha([titulo], "titulo")
+        planilha.adicionar_linha()
+    cabecalho = planilha.adicionar_linha(list(colunas), "cabecalho")
+    estilos = [estilo_coluna(nome) for nome in colunas]
+    planilha.adicionar_colunas(list(colunas.values()), estilos)
+    return cabecalho
+
+
+def abas_em_fluxo(wb, titulo_aba, titulo, cabecalhos, linhas, n, larguras=None):
+    """Abas com uma tabela longa (iterador de `n` linhas); retorna as abas criadas.
+
+    Acima do limite de linhas do Excel a tabela continua em "Aba (2)", "Aba (3)"..., repetindo o título
+    e o cabeçalho (sempre na linha 3 de cada aba).
+    """
+    estilos = [estilo_coluna(nome) for nome in cabecalhos]
+    por_aba = LIMITE_LINHAS_PLANILHA - 5
+    abas = []
+    for parte in range(max(-(-n // por_aba), 1)):
+        aba = PlanilhaFluxo(wb, titulo_aba + (f" ({parte + 1})" if parte else ""), larguras)
+        aba.adicionar_linha([titulo], "titulo")
+        aba.adicionar_linha()
+        aba.adicionar_linha(cabecalhos, "cabecalho")
+        linhas_aba = min(por_aba, n - parte * por_aba)
+        aba.adicionar_linhas(itertools.islice(linhas, linhas_aba), linhas_aba, estilos)
+        abas.append(aba)
+    return abas
+
+
+def adicionar_graficos(ws, planilha_dados, linha_cabecalho, n_linhas, series):
+    """Gráficos de barras/linha sobre as colunas de uma tabela (`series`: título, tipo, colunas, âncora)."""
+    categorias = Reference(planilha_dados.ws, min_col=1, min_row=linha_cabecalho + 1,
+                           max_row=linha_cabecalho + n_linhas)
+    for i, (titulo, tipo, (coluna_inicial, coluna_final), ancora) in enumerate(series):
+        grafico = LineChart() if tipo == "linha" else BarChart()
+        grafico.title = titulo
+        grafico.style = 10 + i
+        grafico.x_axis.title = "Ano"
+        if tipo == "linha":
+            grafico.y_axis.title = "Alíquota (%)"
+            grafico.dataLabels = DataLabelList()
+            grafico.dataLabels.showVal = True
+        else:
+            grafico.type = "col"
+            grafico.grouping = "clustered"
+            grafico.y_axis.title = "Valor (R$)"
+        dados = Reference(planilha_dados.ws, min_col=coluna_inicial, max_col=coluna_final, min_row=linha_cabecalho,
+                          max_row=linha_cabecalho + n_linhas)
+        grafico.add_data(dados, titles_from_data=True)
+        grafico.set_categories(categorias)
+        grafico.height = 15
+        grafico.width = 20
+        ws.add_chart(grafico, ancora)
+
+
+def colunas_memoria(instantaneo):
+    """Colunas (ano, empresa, seção, linha) da memória de cálculo de todos os anos e empresas."""
+    titulos = {"/".join(caminho): titulo for titulo, caminho in SECOES_MEMORIA}
+    indice = instantaneo.get("indice_memoria")
+    if indice is None or not len(indice):
+        indice = IndiceMemoria().adicionar(instantaneo.get("memoria_calculo") or {})
+
+    colunas = [indice.anos, map(lambda secao: titulos.get(secao, secao), indice.secoes), indice.linhas]
+    cabecalhos = ["Ano", "Seção", "Linha"]
+    if any(empresa is not None for empresa in indice.empresas):
+        colunas.insert(1, indice.empresas)
+        cabecalhos.insert(1, "Empresa")
+    return cabecalhos, colunas, len(indice)
+
+
+def gerar_excel(instantaneo, progresso=sem_progresso):
+    """Gera o arquivo Excel com todos os anos (e empresas, em carteiras); retorna os bytes do arquivo.
+
+    O workbook é write-only: as abas são declaradas no openpyxl e as linhas são gravadas em fluxo
+    (`PlanilhaFluxo`) com estilos nomeados compartilhados, de modo que a memória usada não cresce com
+    o número de linhas. A memória de cálculo continua em novas abas acima do limite de linhas do Excel.
+    """
+    parametros = instantaneo["parametros"]
+    icms_config = instantaneo["icms_config"]
+    setores_especiais = instantaneo["setores_especiais"]
+    carteira = instantaneo.get("carteira")
+    progresso(0.0, "Parâmetros")
+
+    wb = Workbook(write_only=True)
+    registrar_estilos(wb)
+    planilhas = []
+
+    # Aba de Parâmetros
+    ws_parametros = PlanilhaFluxo(wb, "Parâmetros", {"A": 25, "B": 25})
+    planilhas.append(ws_parametros)
+    ws_parametros.adicionar_linha(["Simulador da Reforma Tributária - IVA Dual (CBS/IBS)"], "titulo")
+    ws_parametros.adicionar_linha(["Data do relatório:", datetime.now().strftime("%d/%m/%Y %H:%M:%S")])
+    ws_parametros.adicionar_linha()
+    escrever_tabela(ws_parametros, None, {
+        "Parâmetro": ["Faturamento Anual", "Custos Tributáveis", "Fornecedores do Simples", "Créditos Anteriores",
+                      "Setor de Atividade", "Regime Tributário", "Carga Tributária Atual"],
+        "Valor": [f"R$ {formatar_br(parametros.get('faturamento', 0))}",
+                  f"R$ {formatar_br(parametros.get('custos_tributaveis', 0))}",
+                  f"R$ {formatar_br(parametros.get('custos_simples', 0))}",
+                  f"R$ {formatar_br(parametros.get('creditos_anteriores', 0))}",
+                  parametros.get('setor', 'padrao'), parametros.get('regime', 'real'),
+                  f"{formatar_br(parametros.get('carga_atual', 25))}%"]
+    })
+    progresso(0.1, "Resultados")
+
+    # Aba de Resultados (uma linha por ano, ou por ano × empresa em carteiras)
+    colunas, n_linhas = tabela_resultados_excel(instantaneo)
+    larguras = {get_column_letter(i): 18 for i in range(1, len(colunas) + 1)}
+    abas_resultados = abas_em_fluxo(wb, "Resultados", "Resultados da Simulação", list(colunas),
+                                    zip(*colunas.values()), n_linhas, larguras)
+    planilhas.extend(abas_resultados)
+    ws_resultados = abas_resultados[0]
+    cabecalho_resultados = 3
+
+    # Diferenças destacadas por formatação condicional (vermelho se aumentar, verde se diminuir)
+    if "Diferença (R$)" in colunas and n_linhas:
+        letra = get_column_letter(list(colunas).index("Diferença (R$)") + 1)
+        intervalo = f"{letra}{cabecalho_resultados + 1}:{letra}{cabecalho_resultados + n_linhas}"
+        ws_resultados.ws.conditional_formatting.add(
+            intervalo, CellIsRule(operator="greaterThan", formula=["0"], font=Font(color="FF0000")))
+        ws_resultados.ws.conditional_formatting.add(
+            intervalo, CellIsRule(operator="lessThan", formula=["0"], font=Font(color="008000")))
+    progresso(0.2, "Gráficos")
+
+    # Aba com Gráficos (em carteiras, sobre o resumo anual da carteira)
+    ws_graficos = PlanilhaFluxo(wb, "Gráficos")
+    planilhas.append(ws_graficos)
+    ws_graficos.adicionar_linha(["Análise Gráfica dos Resultados"], "titulo")
+    if carteira:
+        resumo = resumo_anual_carteira(carteira)
+        ws_resumo = PlanilhaFluxo(wb, "Resumo Anual", {get_column_letter(i): 18 for i in range(1, len(resumo) + 1)})
+        planilhas.append(ws_resumo)
+        cabecalho_resumo = escrever_tabela(ws_resumo, "Resumo Anual da Carteira", resumo)
+        adicionar_graficos(ws_graficos.ws, ws_resumo, cabecalho_resumo, len(resumo["Ano"]), [
+            ("Comparativo: CBS vs IBS", "barras", (2, 3), "A3"),
+            ("Comparativo: Imposto Devido vs. Impostos Atuais", "barras", (6, 7), "A20"),
+            ("Total Devido", "barras", (8, 8), "H3")
+        ])
+    elif n_linhas:
+        adicionar_graficos(ws_graficos.ws, ws_resultados, cabecalho_resultados, n_linhas, [
+            ("Comparativo: CBS vs IBS", "barras", (2, 3), "A3"),
+            ("Comparativo: Imposto Devido vs. Carga Atual", "barras", (6, 7), "A20"),
+            ("Evolução da Alíquota Efetiva", "linha", (9, 9), "H3")
+        ])
+    progresso(0.3, "Incentivos fiscais")
+
+    # Aba de Incentivos Fiscais
+    ws_incentivos = PlanilhaFluxo(wb, "Incentivos Fiscais", {"A": 30, "B": 25, "C": 15, "D": 15})
+    planilhas.append(ws_incentivos)
+    ws_incentivos.adicionar_linha(["Incentivos Fiscais Configurados"], "titulo")
+    for tipo, titulo in (("saida", "Incentivos de Saída"), ("entrada", "Incentivos de Entrada"),
+                         ("apuracao", "Incentivos de Apuração")):
+        incentivos = icms_config[f"incentivos_{tipo}"]
+        ws_incentivos.adicionar_linha()
+        ws_incentivos.adicionar_linha([titulo], "subtitulo")
+        escrever_tabela(ws_incentivos, None, {
+            "Descrição": [incentivo["descricao"] for incentivo in incentivos],
+            "Tipo": [incentivo["tipo"] for incentivo in incentivos],
+            "Percentual": [incentivo["percentual"] for incentivo in incentivos],
+            "% Operações": [incentivo["percentual_operacoes"] for incentivo in incentivos]
+        })
+    progresso(0.35, "Memória de cálculo")
+
+    # Abas da Memória de Cálculo: todos os anos (e empresas)
+    cabecalhos, colunas_memoria_calculo, total = colunas_memoria(instantaneo)
+    larguras = {"A": 8, "B": 25, "C": 30, "D": 100} if len(cabecalhos) == 4 else {"A": 8, "B": 30, "C": 100}
+    planilhas.extend(abas_em_fluxo(wb, "Memória de Cálculo", "Memória de Cálculo Detalhada", cabecalhos,
+                                   zip(*colunas_memoria_calculo), total, larguras))
+    progresso(0.45, "Alíquotas setoriais")
+
+    # Aba com Alíquotas Setoriais
+    ws_setores = PlanilhaFluxo(wb, "Alíquotas Setoriais", {"A": 20, "B": 15, "C": 20})
+    planilhas.append(ws_setores)
+    escrever_tabela(ws_setores, "Alíquotas por Setor - LC 214/2025", {
+        "Setor": list(setores_especiais),
+        "IBS (%)": [valores["IBS"] for valores in setores_especiais.values()],
+        "Redução CBS (%)": [valores["reducao_CBS"] for valores in setores_especiais.values()]
+    })
+
+    # Rodapé em todas as abas
+    for planilha in planilhas:
+        planilha.adicionar_linha()
+        planilha.adicionar_linha(["© 2025 Expertzy Inteligência Tributária"], "rodape")
+
+    return salvar_workbook(wb, planilhas, progresso)
+
+
+def gerar_pdf(instantaneo, progresso=sem_progresso):
+    """Gera o relatório PDF a partir do instantâneo da simulação; retorna os bytes do arquivo."""
+    parametros = instantaneo["parametros"]
+    resultados = instantaneo["resultados"]
+    aliquotas_equivalentes = instantaneo["aliquotas_equivalentes"]
+    icms_config = instantaneo["icms_config"]
+    progresso(0.0, "Parâmetros")
+
+    buffer = io.BytesIO()
+
+    # Configuração do documento
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=letter,
+        rightMargin=72,
+        leftMargin=72,
+        topMargin=72,
+        bottomMargin=72
+    )
+
+    # Lista de elementos para o PDF
+    elementos = []
+
+    # Estilos
+    estilos = getSampleStyleSheet()
+    titulo_estilo = estilos['Heading1']
+    subtitulo_estilo = estilos['Heading2']
+    subsecao_estilo = estilos['Heading3']
+    normal_estilo = estilos['Normal']
+
+    # Criar estilo para código/memória de cálculo
+    codigo_estilo = ParagraphStyle(
+        'CodigoEstilo',
+        parent=estilos['Normal'],
+        fontName='Courier',
+        fontSize=8,
+        leading=10,
+        leftIndent=36,
+    )
+
+    # Adicionar título
+    elementos.append(Paragraph("Relatório de Simulação - IVA Dual (CBS/IBS)", titulo_estilo))
+    elementos.append(Spacer(1, 0.25 * inch))
+
+    # Data do relatório
+    data_hora = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    elementos.append(Paragraph(f"Data do relatório: {data_hora}", normal_estilo))
+    elementos.append(Spacer(1, 0.1 * inch))
+
+    # Parâmetros da simulação
+    elementos.append(Paragraph("Parâmetros da Simulação", subtitulo_estilo))
+    elementos.append(Spacer(1, 0.1 * inch))
+
+    # Parâmetros informados na simulação
+    faturamento = parametros.get('faturamento', 0)
+    custos = parametros.get('custos_tributaveis', 0)
+    custos_simples = parametros.get('custos_simples', 0)
+    creditos_anteriores = parametros.get('creditos_anteriores', 0)
+    setor = parametros.get('setor', 'padrao')
+    regime = parametros.get('regime', 'real')
+    carga_atual = parametros.get('carga_atual', 25)
+    aliquota_entrada = parametros.get('aliquota_entrada', 19)
+    aliquota_saida = parametros.get('aliquota_saida', 19)
+
+    # Tabela com parâmetros
+    dados_parametros = [
+        ["Parâmetro", "Valor"],
+        ["Faturamento Anual", f"R$ {formatar_br(faturamento)}"],
+        ["Custos Tributáveis", f"R$ {formatar_br(custos)}"],
+        ["Fornecedores do Simples", f"R$ {formatar_br(custos_simples)}"],
+        ["Créditos Anteriores", f"R$ {formatar_br(creditos_anteriores)}"],
+        ["Setor de Atividade", setor],
+        ["Regime Tributário", regime],
+        ["Carga Tributária Atual", f"{formatar_br(carga_atual)}%"],
+        ["Alíquota ICMS Entrada", f"{formatar_br(aliquota_entrada)}%"],
+        ["Alíquota ICMS Saída", f"{formatar_br(aliquota_saida)}%"]
+    ]
+
+    tabela_parametros = Table(dados_parametros, colWidths=[2.5 * inch, 2.5 * inch])
+    tabela_parametros.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (1, 0), 12),
+        ('BACKGROUND', (0, 1), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ]))
+
+    elementos.append(tabela_parametros)
+    elementos.append(Spacer(1, 0.2 * inch))
+
+    progresso(0.15, "Incentivos fiscais")
+
+    # Incentivos Fiscais
+    elementos.append(Paragraph("Incentivos Fiscais Configurados", subtitulo_estilo))
+    elementos.append(Spacer(1, 0.1 * inch))
+
+    # Incentivos de Saída
+    incentivos_saida = icms_config["incentivos_saida"]
+    if incentivos_saida:
+        elementos.append(Paragraph("Incentivos de Saída", subsecao_estilo))
+
+        dados_saida = [["Descrição", "Tipo", "Percentual", "% Operações"]]
+        for inc in incentivos_saida:
+            dados_saida.append([
+                inc["descricao"],
+                inc["tipo"],
+                f"{formatar_br(inc['percentual'] * 100)}%",
+                f"{formatar_br(inc['percentual_operacoes'] * 100)}%"
+            ])
+
+        tabela_saida = Table(dados_saida, colWidths=[2 * inch, 2 * inch, 1 * inch, 1 * inch])
+        tabela_saida.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+
+        elementos.append(tabela_saida)
+        elementos.append(Spacer(1, 0.2 * inch))
+    else:
+        elementos.append(Paragraph("Nenhum incentivo de saída configurado.", normal_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+    # Incentivos de Entrada
+    incentivos_entrada = icms_config["incentivos_entrada"]
+    if incentivos_entrada:
+        elementos.append(Paragraph("Incentivos de Entrada", subsecao_estilo))
+
+        dados_entrada = [["Descrição", "Tipo", "Percentual", "% Operações"]]
+        for inc in incentivos_entrada:
+            dados_entrada.append([
+                inc["descricao"],
+                inc["tipo"],
+                f"{formatar_br(inc['percentual'] * 100)}%",
+                f"{formatar_br(inc['percentual_operacoes'] * 100)}%"
+            ])
+
+        tabela_entrada = Table(dados_entrada, colWidths=[2 * inch, 2 * inch, 1 * inch, 1 * inch])
+        tabela_entrada.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+
+        elementos.append(tabela_entrada)
+        elementos.append(Spacer(1, 0.2 * inch))
+    else:
+        elementos.append(Paragraph("Nenhum incentivo de entrada configurado.", normal_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+    # Incentivos de Apuração
+    incentivos_apuracao = icms_config["incentivos_apuracao"]
+    if incentivos_apuracao:
+        elementos.append(Paragraph("Incentivos de Apuração", subsecao_estilo))
+
+        dados_apuracao = [["Descrição", "Tipo", "Percentual", "% do Saldo"]]
+        for inc in incentivos_apuracao:
+            dados_apuracao.append([
+                inc["descricao"],
+                inc["tipo"],
+                f"{formatar_br(inc['percentual'] * 100)}%",
+                f"{formatar_br(inc['percentual_operacoes'] * 100)}%"
+            ])
+
+        tabela_apuracao = Table(dados_apuracao, colWidths=[2 * inch, 2 * inch, 1 * inch, 1 * inch])
+        tabela_apuracao.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ]))
+
+        elementos.append(tabela_apuracao)
+        elementos.append(Spacer(1, 0.2 * inch))
+    else:
+        elementos.append(Paragraph("Nenhum incentivo de apuração configurado.", normal_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+    progresso(0.3, "Resultados")
+
+    # Resultados da simulação
+    elementos.append(Paragraph("Resultados da Simulação", subtitulo_estilo))
+    elementos.append(Spacer(1, 0.1 * inch))
+
+    # Preparar dados da tabela de resultados
+    dados_tabela = [
+        ["Ano", "CBS (R$)", "IBS (R$)", "Imposto Bruto (R$)", "Créditos (R$)",
+         "Imposto Devido (R$)", "Carga Atual (R$)", "Diferença (R$)", "Alíquota (%)"]
+    ]
+
+    # Ordenar resultados por ano
+    anos_ordenados = sorted(resultados.keys())
+
+    for ano in anos_ordenados:
+        resultado = resultados[ano]
+        valor_atual = aliquotas_equivalentes[ano]["valor_atual"]
+        diferenca = resultado["imposto_devido"] - valor_atual
+
+        dados_tabela.append([
+            str(ano),
+            f"R$ {formatar_br(resultado['cbs'])}",
+            f"R$ {formatar_br(resultado['ibs'])}",
+            f"R$ {formatar_br(resultado['imposto_bruto'])}",
+            f"R$ {formatar_br(resultado['creditos'])}",
+            f"R$ {formatar_br(resultado['imposto_devido'])}",
+            f"R$ {formatar_br(valor_atual)}",
+            f"R$ {formatar_br(diferenca)}",
+            f"{formatar_br(resultado['aliquota_efetiva'] * 100)}%"
+        ])
+
+    # Criar a tabela de resultados
+    tabela_resultados = Table(dados_tabela, colWidths=[0.5 * inch, 0.85 * inch, 0.85 * inch,
+                                                       0.9 * inch, 0.85 * inch, 0.9 * inch,
+                                                       0.85 * inch, 0.85 * inch, 0.7 * inch])
+
+    tabela_resultados.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+    ]))
+
+    elementos.append(tabela_resultados)
+    elementos.append(Spacer(1, 0.2 * inch))
+
+    # Análise dos resultados
+    elementos.append(Paragraph("Análise dos Resultados", subtitulo_estilo))
+    elementos.append(Spacer(1, 0.1 * inch))
+
+    # Adicionar texto de análise
+    if len(anos_ordenados) >= 2:
+        ano_inicial = min(anos_ordenados)
+        ano_final = max(anos_ordenados)
+
+        resultado_inicial = resultados[ano_inicial]
+        resultado_final = resultados[ano_final]
+
+        # Variação do imposto devido
+        variacao_imposto = resultado_final["imposto_devido"] - resultado_inicial["imposto_devido"]
+        percentual_var = (variacao_imposto / resultado_inicial["imposto_devido"]) * 100 if \
+        resultado_inicial["imposto_devido"] > 0 else 0
+
+        # Variação da alíquota efetiva
+        variacao_aliquota = resultado_final["aliquota_efetiva"] - resultado_inicial["aliquota_efetiva"]
+        percentual_var_aliq = variacao_aliquota * 100
+
+        texto_analise = f"""
+        Durante o período de transição do IVA Dual (de {ano_inicial} a {ano_final}), observa-se uma 
+        variação significativa na carga tributária da empresa. O imposto devido no IVA Dual passa 
+        de R$ {formatar_br(resultado_inicial["imposto_devido"])} para R$ {formatar_br(resultado_final["imposto_devido"])}, 
+        representando uma variação de {formatar_br(percentual_var)}%.
+
+        A alíquota efetiva evolui de {formatar_br(resultado_inicial["aliquota_efetiva"] * 100)}% para 
+        {formatar_br(resultado_final["aliquota_efetiva"] * 100)}%, uma variação de {formatar_br(percentual_var_aliq)} pontos percentuais.
+
+        Esta evolução reflete a implementação progressiva do novo sistema tributário, conforme 
+        estabelecido pela Lei Complementar 214/2025. Vale destacar que o impacto da reforma varia de 
+        acordo com o setor de atividade, o regime tributário e a estrutura de custos da empresa.
+        """
+
+        elementos.append(Paragraph(texto_analise.strip(), normal_estilo))
+        elementos.append(Spacer(1, 0.2 * inch))
+
+    # Adicionar comentário sobre ICMS e incentivos fiscais
+    if icms_config["incentivos_saida"] or icms_config[
+        "incentivos_entrada"] or icms_config["incentivos_apuracao"]:
+        resultado = resultados[anos_ordenados[0]]
+        icms_devido = resultado["impostos_atuais"].get("ICMS", 0)
+        economia_icms = resultado["impostos_atuais"].get("economia_icms", 0)
+        total_incentivos = len(icms_config["incentivos_saida"]) + len(
+            icms_config["incentivos_entrada"]) + len(
+            icms_config["incentivos_apuracao"])
+
+        texto_incentivos = f"""
+        A simulação considera {total_incentivos} incentivos fiscais configurados, resultando em uma 
+        economia fiscal de R$ {formatar_br(economia_icms)} no ICMS. Sem estes incentivos, o ICMS devido 
+        seria de R$ {formatar_br(icms_devido + economia_icms)}, em vez dos atuais R$ {formatar_br(icms_devido)}.
+
+        Durante a transição para o IVA Dual, é importante considerar como estes incentivos serão tratados, 
+        pois a reforma tributária pode afetar significativamente os benefícios fiscais existentes.
+        """
+
+        elementos.append(Paragraph("Impacto dos Incentivos Fiscais", subsecao_estilo))
+        elementos.append(Paragraph(texto_incentivos.strip(), normal_estilo))
+        elementos.append(Spacer(1, 0.2 * inch))
+
+    progresso(0.45, "Memória de cálculo")
+
+    # Memória de Cálculo
+    elementos.append(PageBreak())
+    elementos.append(Paragraph("Memória de Cálculo", titulo_estilo))
+    elementos.append(Spacer(1, 0.25 * inch))
+
+    # Memória de cálculo da simulação
+    if resultados:
+        memoria = instantaneo["memoria_calculo"]
+
+        # Validação de dados
+        elementos.append(Paragraph("Validação de Dados", subtitulo_estilo))
+        if "validacao" in memoria and memoria["validacao"]:
+            for linha in memoria["validacao"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        else:
+            elementos.append(Paragraph("Dados validados com sucesso.", codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+        # Base tributável
+        elementos.append(Paragraph("Base Tributável", subtitulo_estilo))
+        if "base_tributavel" in memoria and memoria["base_tributavel"]:
+            for linha in memoria["base_tributavel"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+        # Alíquotas
+        elementos.append(Paragraph("Alíquotas", subtitulo_estilo))
+        if "aliquotas" in memoria and memoria["aliquotas"]:
+            for linha in memoria["aliquotas"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+        # Cálculo da CBS
+        elementos.append(Paragraph("Cálculo da CBS", subtitulo_estilo))
+        if "cbs" in memoria and memoria["cbs"]:
+            for linha in memoria["cbs"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+        # Cálculo do IBS
+        elementos.append(Paragraph("Cálculo do IBS", subtitulo_estilo))
+        if "ibs" in memoria and memoria["ibs"]:
+            for linha in memoria["ibs"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+        # Nova página para o resto da memória
+        elementos.append(PageBreak())
+
+        # Cálculo dos Créditos
+        elementos.append(Paragraph("Cálculo dos Créditos", subtitulo_estilo))
+        if "creditos" in memoria and memoria["creditos"]:
+            for linha in memoria["creditos"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+        # Cálculo do Imposto Devido
+        elementos.append(Paragraph("Cálculo do Imposto Devido", subtitulo_estilo))
+        if "imposto_devido" in memoria and memoria["imposto_devido"]:
+            for linha in memoria["imposto_devido"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+        # Cálculo dos Impostos Atuais
+        elementos.append(PageBreak())
+        elementos.append(Paragraph("Cálculo dos Impostos Atuais", titulo_estilo))
+        elementos.append(Spacer(1, 0.25 * inch))
+
+        if "impostos_atuais" in memoria:
+            # PIS
+            elementos.append(Paragraph("PIS", subtitulo_estilo))
+            if "PIS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["PIS"]:
+                for linha in memoria["impostos_atuais"]["PIS"]:
+                    elementos.append(Paragraph(linha, codigo_estilo))
+            elementos.append(Spacer(1, 0.1 * inch))
+
+            # COFINS
+            elementos.append(Paragraph("COFINS", subtitulo_estilo))
+            if "COFINS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["COFINS"]:
+                for linha in memoria["impostos_atuais"]["COFINS"]:
+                    elementos.append(Paragraph(linha, codigo_estilo))
+            elementos.append(Spacer(1, 0.1 * inch))
+
+            # ICMS (mais detalhado)
+            elementos.append(Paragraph("ICMS", subtitulo_estilo))
+            if "ICMS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["ICMS"]:
+                for linha in memoria["impostos_atuais"]["ICMS"]:
+                    elementos.append(Paragraph(linha, codigo_estilo))
+            elementos.append(Spacer(1, 0.1 * inch))
+
+            elementos.append(PageBreak())
+
+            # ISS
+            elementos.append(Paragraph("ISS", subtitulo_estilo))
+            if "ISS" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["ISS"]:
+                for linha in memoria["impostos_atuais"]["ISS"]:
+                    elementos.append(Paragraph(linha, codigo_estilo))
+            elementos.append(Spacer(1, 0.1 * inch))
+
+            # IPI
+            elementos.append(Paragraph("IPI", subtitulo_estilo))
+            if "IPI" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["IPI"]:
+                for linha in memoria["impostos_atuais"]["IPI"]:
+                    elementos.append(Paragraph(linha, codigo_estilo))
+            elementos.append(Spacer(1, 0.1 * inch))
+
+            # Total Impostos Atuais
+            elementos.append(Paragraph("Total Impostos Atuais", subtitulo_estilo))
+            if "total" in memoria["impostos_atuais"] and memoria["impostos_atuais"]["total"]:
+                for linha in memoria["impostos_atuais"]["total"]:
+                    elementos.append(Paragraph(linha, codigo_estilo))
+            elementos.append(Spacer(1, 0.1 * inch))
+
+        # Créditos Cruzados
+        if "creditos_cruzados" in memoria and memoria["creditos_cruzados"]:
+            elementos.append(Paragraph("Créditos Cruzados", subtitulo_estilo))
+            for linha in memoria["creditos_cruzados"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+            elementos.append(Spacer(1, 0.1 * inch))
+
+        # Total Devido
+        elementos.append(Paragraph("Total Devido", subtitulo_estilo))
+        if "total_devido" in memoria and memoria["total_devido"]:
+            for linha in memoria["total_devido"]:
+                elementos.append(Paragraph(linha, codigo_estilo))
+        elementos.append(Spacer(1, 0.1 * inch))
+
+    # Rodapé
+    elementos.append(Spacer(1, 0.5 * inch))
+    elementos.append(Paragraph("© 2025 Expertzy Inteligência Tributária",
+                               ParagraphStyle('rodape',
+                                              parent=normal_estilo,
+                                              alignment=1,  # centralizado
+                                              fontSize=8,
+                                              textColor=colors.darkgrey)))
+
+    progresso(0.6, "Montando o PDF")
+
+    # Construir o PDF
+    doc.build(elementos)
+    return buffer.getvalue()
+
+
+# Geradores por formato de exportação
+GERADORES = {"excel": gerar_excel, "pdf": gerar_pdf}
+
+
+class ServicoExportacao:
+    """Gera os arquivos de exportação em segundo plano, fora da thread do script do Streamlit.
+
+    Um laço asyncio roda numa thread própria e recebe as tarefas; a geração (openpyxl/reportlab) roda
+    num pool de threads, informando o progresso em cada etapa. Pedidos com o mesmo formato e a mesma
+    impressão digital do instantâneo reaproveitam o arquivo já gerado ou a geração em andamento.
+    """
+
+    def __init__(self, trabalhadores=TRABALHADORES_EXPORTACAO, limite_cache=LIMITE_CACHE_EXPORTACOES,
+                 limite_bytes=LIMITE_BYTES_EXPORTACOES):
+        self.executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="exportacao")
+        self.laco = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.laco.run_forever, name="laco_exportacao", daemon=True)
+        self.thread.start()
+        self.limite_cache = limite_cache
+        self.limite_bytes = limite_bytes
+        self.tarefas = OrderedDict()
+        self.trava = threading.Lock()
+
+    def solicitar(self, formato, instantaneo):
+        """Agenda a geração do arquivo (se ainda não existir) e retorna a chave da tarefa."""
+        if formato not in GERADORES:
+            raise ValueError(f"Formato de exportação inválido: {formato}")
+
+        chave = f"{formato}:{impressao_instantaneo(instantaneo)}"
+        with self.trava:
+            tarefa = consultar_cache(self.tarefas, chave)
+            if tarefa is not None and tarefa["estado"] != "erro":
+                return chave
+            tarefa = {"formato": formato, "estado": "na_fila", "progresso": 0.0, "etapa": "Na fila",
+                      "arquivo": None, "erro": None, "inicio": time.time(), "duracao": None}
+            self.tarefas[chave] = tarefa
+            self.tarefas.move_to_end(chave)
+            self.liberar_cache()
+
+        asyncio.run_coroutine_threadsafe(self.executar(tarefa, instantaneo), self.laco)
+        return chave
+
+    async def executar(self, tarefa, instantaneo):
+        """Executa o gerador do formato no pool de threads, atualizando o estado da tarefa."""
+        def progresso(fracao, etapa):
+            tarefa.update(progresso=fracao, etapa=etapa)
+
+        tarefa["estado"] = "executando"
+        try:
+            arquivo = await self.laco.run_in_executor(self.executor, GERADORES[tarefa["formato"]], instantaneo,
+                                                      progresso)
+            tarefa.update(arquivo=arquivo, estado="concluida", progresso=1.0, etapa="Concluído")
+        except Exception as e:
+            print(f"Erro ao gerar exportação {tarefa['formato']}: {e}")
+            tarefa.update(estado="erro", erro=str(e), etapa="Erro")
+        tarefa["duracao"] = time.time() - tarefa["inicio"]
+        with self.trava:
+            self.liberar_cache()
+
+    def liberar_cache(self):
+        """Descarta as tarefas finalizadas menos usadas até respeitar os limites de número e de bytes.
+
+        Deve ser chamado com a trava adquirida. Tarefas na fila ou em execução não entram na conta de
+        descarte: o cache pode exceder os limites enquanto elas não terminarem. A tarefa mais recente é
+        sempre mantida, para que um arquivo maior que o limite ainda possa ser baixado.
+        """
+        total_bytes = sum(len(tarefa["arquivo"] or b"") for tarefa in self.tarefas.values())
+        excedente = len(self.tarefas) - self.limite_cache
+        for chave in list(self.tarefas)[:-1]:
+            if excedente <= 0 and total_bytes <= self.limite_bytes:
+                break
+            tarefa = self.tarefas[chave]
+            if tarefa["estado"] in ("na_fila", "executando"):
+                continue
+            total_bytes -= len(tarefa["arquivo"] or b"")
+            excedente -= 1
+            del self.tarefas[chave]
+
+    def consultar(self, chave):
+        """Estado atual da tarefa (cópia), ou None se a chave não estiver mais no cache."""
+        with self.trava:
+            tarefa = self.tarefas.get(chave)
+            return dict(tarefa) if tarefa is not None else None
+
+    def arquivo(self, chave):
+        """Bytes do arquivo de uma tarefa concluída (vazio se a tarefa saiu do cache)."""
+        with self.trava:
+            tarefa = self.tarefas.get(chave)
+            return tarefa["arquivo"] if tarefa is not None and tarefa["arquivo"] is not None else b""
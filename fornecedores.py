@@ -0,0 +1,213 @@
+import csv
+import os
+
+import numpy as np
+
+from calculadoras import CalculadoraIVADual
+
+# Códigos de regime do cadastro de fornecedores (0 = não cadastrado)
+REGIMES_FORNECEDOR = {"real": 1, "presumido": 2, "simples": 3, "rural": 4}
+
+# Grupo de custos (ver CAMPOS_LOTE) de cada código de regime; importações são indicadas no razão
+GRUPOS_CUSTO = ("custos_tributaveis", "custos_simples", "custos_rurais", "custos_importacoes")
+GRUPO_POR_REGIME = np.array([0, 0, 0, 1, 2], dtype=np.int8)
+
+# Constante de Fibonacci (2^64 / φ) para o hash multiplicativo
+MULTIPLICADOR_HASH = np.uint64(11400714819323198485)
+
+
+def normalizar_cnpjs(cnpjs):
+    """Converte CNPJs (ex: "12.345.678/0001-95" ou inteiros) para a raiz de 8 dígitos (int64).
+
+    O regime tributário é da empresa, por isso o índice usa a raiz e vale para todos os estabelecimentos.
+    Inteiros são sempre CNPJs completos (14 dígitos, sem os zeros à esquerda); raízes avulsas devem ser
+    informadas como texto.
+    """
+    cnpjs = np.asarray(cnpjs)
+    if cnpjs.dtype.kind in "iu":
+        # Inteiros não guardam os zeros à esquerda: o número de dígitos não distingue raiz de CNPJ completo
+        return cnpjs.astype(np.int64) // 10 ** 6
+
+    texto = cnpjs.astype(str)
+    for separador in (".", "/", "-", " "):
+        texto = np.char.replace(texto, separador, "")
+    completo = np.char.str_len(texto) > 8
+    valores = np.where(texto == "", "0", texto).astype(np.int64)
+    # Texto: o número de dígitos distingue o CNPJ completo (14 dígitos, com zeros à esquerda) da raiz
+    return np.where(completo, valores // 10 ** 6, valores)
+
+
+class RegistroFornecedores:
+    """Cadastro CNPJ → regime tributário com índice hash (endereçamento aberto) em NumPy.
+
+    A tabela é persistida em um arquivo `.npy` e aberta por `np.memmap` (`mmap_mode="r"`), de modo que
+    cadastros com milhões de fornecedores são consultados sem carregar o arquivo inteiro em memória.
+    As consultas são vetorizadas: cada rodada de sondagem linear resolve todas as linhas pendentes.
+    """
+
+    def __init__(self, arquivo=None):
+        self.tabela = None
+        self.bits = 0
+        if arquivo and os.path.exists(arquivo):
+            self.abrir(arquivo)
+
+    def calcular_hash(self, chaves):
+        """Hash multiplicativo das chaves para a posição inicial na tabela."""
+        return ((chaves.astype(np.uint64) * MULTIPLICADOR_HASH) >> np.uint64(64 - self.bits)).astype(np.int64)
+
+    def construir(self, cnpjs, regimes):
+        """Constrói o índice a partir de arrays de CNPJs e regimes (nomes ou códigos)."""
+        regimes = np.asarray(regimes)
+        if regimes.dtype.kind not in "iu":
+            codigos = np.array([REGIMES_FORNECEDOR.get(str(r).strip().lower(), 0) for r in regimes], dtype=np.uint8)
+        else:
+            codigos = regimes.astype(np.uint8)
+
+        # Chave = raiz + 1 (0 indica posição vazia); em duplicidade vale o último registro
+        chaves = normalizar_cnpjs(cnpjs).astype(np.uint64) + np.uint64(1)
+        chaves, posicao = np.unique(chaves[::-1], return_index=True)
+        codigos = codigos[::-1][posicao]
+
+        self.bits = max(4, int(np.ceil(np.log2(max(2 * chaves.size, 1)))))
+        mascara = (1 << self.bits) - 1
+        tabela = np.zeros(1 << self.bits, dtype=[("chave", np.uint64), ("regime", np.uint8)])
+
+        pendentes = np.arange(chaves.size)
+        posicoes = self.calcular_hash(chaves)
+        while pendentes.size:
+            livres = tabela["chave"][posicoes[pendentes]] == 0
+            candidatos = pendentes[livres]
+            # Entre candidatos à mesma posição livre, o primeiro ocupa e os demais seguem sondando
+            _, primeiros = np.unique(posicoes[candidatos], return_index=True)
+            inseridos = candidatos[primeiros]
+            tabela["chave"][posicoes[inseridos]] = chaves[inseridos]
+            tabela["regime"][posicoes[inseridos]] = codigos[inseridos]
+
+            pendentes = np.setdiff1d(pendentes, inseridos, assume_unique=True)
+            posicoes[pendentes] = (posicoes[pendentes] + 1) & mascara
+
+        self.tabela = tabela
+        return self
+
+    def carregar_csv(self, arquivo):
+        """Constrói o índice a partir de um CSV local (cnpj;regime)."""
+        if not os.path.exists(arquivo):
+            return False
+
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                linhas = list(csv.DictReader(f, delimiter=";"))
+            self.construir([linha["cnpj"] for linha in linhas], [linha["regime"] for linha in linhas])
+        except Exception as e:
+            print(f"Erro ao carregar cadastro de fornecedores: {e}")
+            return False
+        return True
+
+    def salvar(self, arquivo):
+        """Grava o índice em um arquivo `.npy` para abertura posterior por memória mapeada."""
+        try:
+            np.save(arquivo, self.tabela)
+            return True
+        except Exception as e:
+            print(f"Erro ao salvar cadastro de fornecedores: {e}")
+            return False
+
+    def abrir(self, arquivo):
+        """Abre um índice gravado por `salvar` sem carregá-lo em memória."""
+        self.tabela = np.load(arquivo, mmap_mode="r")
+        self.bits = int(np.log2(self.tabela.size))
+        return self
+
+    def consultar(self, cnpjs):
+        """Retorna o código de regime de cada CNPJ (0 quando não cadastrado)."""
+        chaves = normalizar_cnpjs(cnpjs).astype(np.uint64) + np.uint64(1)
+        regimes = np.zeros(chaves.size, dtype=np.uint8)
+        if self.tabela is None:
+            return regimes
+
+        chaves_tabela = self.tabela["chave"]
+        regimes_tabela = self.tabela["regime"]
+        mascara = (1 << self.bits) - 1
+        posicoes = self.calcular_hash(chaves)
+        pendentes = np.arange(chaves.size)
+        while pendentes.size:
+            encontradas = chaves_tabela[posicoes[pendentes]]
+            achou = encontradas == chaves[pendentes]
+            regimes[pendentes[achou]] = regimes_tabela[posicoes[pendentes[achou]]]
+            # Continua sondando apenas quem não achou a chave nem uma posição vazia
+            pendentes = pendentes[~achou & (encontradas != 0)]
+            posicoes[pendentes] = (posicoes[pendentes] + 1) & mascara
+        return regimes
+
+
+class RazaoCompras:
+    """Apuração dos créditos de CBS/IBS a partir do razão de compras por fornecedor.
+
+    Cada compra recebe o regime do fornecedor pelo `RegistroFornecedores` e, com ele, a regra de
+    `regras_credito`; os valores são agregados por ano e grupo de custo em um único `bincount`.
+    """
+
+    def __init__(self, configuracao, registro, regime_nao_cadastrado="real"):
+        self.config = configuracao
+        self.registro = registro
+        self.regime_nao_cadastrado = REGIMES_FORNECEDOR[regime_nao_cadastrado]
+        self.calculadora_iva = CalculadoraIVADual(configuracao)
+
+    def classificar(self, cnpjs, importacao=None):
+        """Retorna o grupo de custo (índice em GRUPOS_CUSTO) de cada linha do razão e os não cadastrados."""
+        regimes = self.registro.consultar(cnpjs)
+        nao_cadastrados = regimes == 0
+        regimes[nao_cadastrados] = self.regime_nao_cadastrado
+
+        grupos = GRUPO_POR_REGIME[regimes]
+        if importacao is not None:
+            grupos = np.where(np.asarray(importacao, dtype=bool), GRUPOS_CUSTO.index("custos_importacoes"), grupos)
+        return grupos, nao_cadastrados
+
+    def agregar(self, cnpjs, anos, valores, importacao=None):
+        """Agrega o razão por ano e grupo de custo; retorna os anos e um dicionário grupo → array por ano."""
+        grupos, nao_cadastrados = self.classificar(cnpjs, importacao)
+        anos_unicos, indice_ano = np.unique(np.asarray(anos), return_inverse=True)
+
+        totais = np.bincount(indice_ano * len(GRUPOS_CUSTO) + grupos, weights=np.asarray(valores, dtype=float),
+                             minlength=anos_unicos.size * len(GRUPOS_CUSTO)).reshape(-1, len(GRUPOS_CUSTO))
+        custos = {grupo: totais[:, i] for i, grupo in enumerate(GRUPOS_CUSTO)}
+        return [int(ano) for ano in anos_unicos], custos, int(nao_cadastrados.sum())
+
+    def apurar(self, cnpjs, anos, valores, setor="padrao", faturamento=None, importacao=None):
+        """Calcula os créditos de CBS e IBS por ano a partir do razão de compras.
+
+        `faturamento` (escalar ou por ano) é usado no limite de 40% do imposto devido para os créditos
+        do Simples Nacional; sem ele o limite não é aplicado.
+        """
+        anos, custos, nao_cadastrados = self.agregar(cnpjs, anos, valores, importacao)
+
+        setores = list(self.config.setores_especiais.keys())
+        indice_setor = np.array([setores.index(setor) if setor in setores else setores.index("padrao")])
+        fator_transicao = np.array([self.config.fase_transicao.get(ano, 1.0) for ano in anos])[:, np.newaxis]
+        regras = self.calculadora_iva.obter_regras_lote(indice_setor, fator_transicao)
+
+        if faturamento is None:
+            imposto_bruto = np.full((len(anos), 1), np.inf)
+        else:
+            base = np.reshape(np.asarray(faturamento, dtype=float), (-1, 1)) * regras["fator_base"] * fator_transicao
+            imposto_bruto = base * (regras["CBS"] + regras["IBS"])
+
+        creditos_cbs, creditos_ibs = self.calculadora_iva.calcular_creditos_lote(
+            {grupo: valores_ano[:, np.newaxis] for grupo, valores_ano in custos.items()},
+            regras["CBS"], regras["IBS"], imposto_bruto)
+
+        return {
+            "anos": anos,
+            "custos": custos,
+            "creditos_cbs": creditos_cbs[:, 0],
+            "creditos_ibs": creditos_ibs[:, 0],
+            "creditos": creditos_cbs[:, 0] + creditos_ibs[:, 0],
+            "linhas": int(np.size(valores)),
+            "fornecedores_nao_cadastrados": nao_cadastrados
+        }
+
+    def custos_por_ano(self, cnpjs, anos, valores, importacao=None):
+        """Retorna os custos agregados por ano no formato de `dados` (custos_tributaveis, custos_simples...)."""
+        anos, custos, _ = self.agregar(cnpjs, anos, valores, importacao)
+        return {ano: {grupo: float(custos[grupo][i]) for grupo in GRUPOS_CUSTO} for i, ano in enumerate(anos)}
@@ -0,0 +1,156 @@
+import numpy as np
+
+from utils import formatar_br
+
+# Unidades federativas (ordem dos eixos de origem e destino)
+UFS = ("AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG", "PA", "PB", "PR", "PE", "PI",
+       "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO")
+
+# Alíquotas internas modais (referência 2025; variam por produto e devem ser ajustadas ao caso)
+ALIQUOTAS_INTERNAS = {
+    "AC": 0.19, "AL": 0.19, "AP": 0.18, "AM": 0.20, "BA": 0.205, "CE": 0.20, "DF": 0.20, "ES": 0.17, "GO": 0.19,
+    "MA": 0.23, "MT": 0.17, "MS": 0.17, "MG": 0.18, "PA": 0.19, "PB": 0.20, "PR": 0.195, "PE": 0.205, "PI": 0.225,
+    "RJ": 0.20, "RN": 0.18, "RS": 0.17, "RO": 0.195, "RR": 0.20, "SC": 0.17, "SP": 0.18, "SE": 0.19, "TO": 0.20
+}
+
+# Fundo de Combate à Pobreza (adicional sobre a alíquota interna; padrão apenas onde é geral)
+FCP_PADRAO = {"RJ": 0.02}
+
+# Resolução do Senado 22/1989: 7% das regiões Sul e Sudeste (exceto ES) para N, NE, CO e ES; 12% nos demais
+UFS_SUL_SUDESTE = ("MG", "PR", "RJ", "RS", "SC", "SP")
+ALIQUOTA_INTERESTADUAL = 0.12
+ALIQUOTA_INTERESTADUAL_REDUZIDA = 0.07
+
+# Resolução do Senado 13/2012: mercadorias importadas (conteúdo de importação acima de 40%)
+ALIQUOTA_IMPORTADOS = 0.04
+
+
+def montar_matriz_aliquotas(aliquotas_internas=None):
+    """Monta a matriz 27 × 27 origem × destino: alíquota interna na diagonal e interestadual fora dela."""
+    internas = dict(ALIQUOTAS_INTERNAS)
+    internas.update(aliquotas_internas or {})
+
+    sul_sudeste = np.array([uf in UFS_SUL_SUDESTE for uf in UFS])
+    matriz = np.where(sul_sudeste[:, np.newaxis] & ~sul_sudeste[np.newaxis, :],
+                      ALIQUOTA_INTERESTADUAL_REDUZIDA, ALIQUOTA_INTERESTADUAL)
+    np.fill_diagonal(matriz, [internas[uf] for uf in UFS])
+    return matriz
+
+
+class CalculadoraICMSInterestadual:
+    """ICMS por UF e DIFAL para operações entre as 27 unidades federativas.
+
+    Receitas e custos são arrays empresa × origem × destino (27 × 27 por empresa): nas vendas, a origem
+    é o estabelecimento vendedor; nas compras, o destino é o estabelecimento adquirente. Débitos,
+    créditos e DIFAL são contrações dessas matrizes com a matriz de alíquotas (`np.einsum`), sem laços
+    por empresa ou por UF. Para carteiras grandes, arrays `float32` reduzem o uso de memória à metade.
+    """
+
+    def __init__(self, configuracao, aliquotas_internas=None, fcp=None):
+        self.config = configuracao
+        self.matriz = montar_matriz_aliquotas(aliquotas_internas)
+        self.internas = np.diag(self.matriz).copy()
+        fcp_uf = dict(FCP_PADRAO)
+        fcp_uf.update(fcp or {})
+        self.fcp = np.array([fcp_uf.get(uf, 0.0) for uf in UFS])
+        self.memoria_calculo = {}
+
+    @staticmethod
+    def indice_uf(uf):
+        """Índice da UF nos eixos de origem e destino."""
+        if uf not in UFS:
+            raise ValueError(f"UF inválida: {uf}")
+        return UFS.index(uf)
+
+    def matriz_efetiva(self, parcela_importados):
+        """Alíquotas origem × destino com a parcela de importados a 4% nas operações interestaduais."""
+        if parcela_importados is None:
+            return self.matriz
+        interestadual = ~np.eye(len(UFS), dtype=bool)
+        parcela = np.asarray(parcela_importados) * interestadual
+        return self.matriz * (1 - parcela) + ALIQUOTA_IMPORTADOS * parcela
+
+    def calcular_lote(self, receitas, custos, parcela_consumidor_final=0.0, parcela_importados=None,
+                      custos_uso_consumo=None):
+        """Calcula o ICMS próprio por UF, o FCP e o DIFAL de uma carteira de empresas.
+
+        `receitas` e `custos` têm formato empresa × origem × destino. `parcela_consumidor_final` é a
+        fração das vendas interestaduais destinadas a não contribuintes (DIFAL a cargo do vendedor) e
+        `custos_uso_consumo` as compras interestaduais de uso e consumo (DIFAL a cargo do adquirente,
+        sem crédito). As parcelas podem ser escalares ou arrays no mesmo formato.
+        """
+        receitas = np.asarray(receitas)
+        custos = np.asarray(custos)
+        if receitas.shape[1:] != (len(UFS), len(UFS)) or custos.shape != receitas.shape:
+            raise ValueError(f"Receitas e custos devem ter formato empresa × {len(UFS)} × {len(UFS)}")
+
+        # As alíquotas seguem o tipo das receitas (ex: float32) para não promover os arrays 3-D
+        tipo = receitas.dtype if receitas.dtype.kind == "f" else np.float64
+        matriz = self.matriz_efetiva(parcela_importados).astype(tipo, copy=False)
+        if matriz.ndim == 2:
+            matriz = matriz[np.newaxis, :, :]
+
+        # Débitos no estabelecimento de origem e créditos no estabelecimento adquirente (empresa × UF)
+        debito = np.einsum("eod,eod->eo", receitas, np.broadcast_to(matriz, receitas.shape))
+        credito = np.einsum("eod,eod->ed", custos, np.broadcast_to(matriz, custos.shape))
+
+        # Apuração por UF: o saldo credor de uma UF não compensa o débito de outra
+        saldo = debito - credito
+        icms_devido = np.maximum(saldo, 0)
+        saldo_credor = np.maximum(-saldo, 0)
+
+        # FCP nas operações internas (cobrado com o ICMS na UF de origem)
+        vendas_internas = np.einsum("eoo->eo", receitas)
+        fcp_interno = vendas_internas * self.fcp.astype(tipo)
+
+        # DIFAL das vendas a não contribuintes: diferença entre a alíquota interna do destino e a interestadual
+        diferencial = np.maximum(self.internas[np.newaxis, np.newaxis, :].astype(tipo) - matriz, 0)
+        diferencial = diferencial * ~np.eye(len(UFS), dtype=bool)
+        vendas_consumidor = receitas * parcela_consumidor_final
+        difal = np.einsum("eod,eod->ed", vendas_consumidor, np.broadcast_to(diferencial, receitas.shape))
+        fcp_difal = np.einsum("eod,d->ed", vendas_consumidor * ~np.eye(len(UFS), dtype=bool), self.fcp.astype(tipo))
+
+        # DIFAL das compras de uso e consumo, recolhido pelo adquirente na UF de destino
+        difal_entradas = np.zeros_like(difal)
+        if custos_uso_consumo is not None:
+            difal_entradas = np.einsum("eod,eod->ed", np.asarray(custos_uso_consumo),
+                                       np.broadcast_to(diferencial, receitas.shape))
+
+        total_por_uf = icms_devido + fcp_interno + difal + fcp_difal + difal_entradas
+        self.memoria_calculo = {
+            "icms_interestadual": [
+                f"Empresas: {receitas.shape[0]} | UFs: {len(UFS)}",
+                f"Alíquotas interestaduais: {formatar_br(ALIQUOTA_INTERESTADUAL * 100)}% e "
+                f"{formatar_br(ALIQUOTA_INTERESTADUAL_REDUZIDA * 100)}% (Sul/Sudeste para N, NE, CO e ES); "
+                f"importados {formatar_br(ALIQUOTA_IMPORTADOS * 100)}%",
+                "Apuração do ICMS próprio por UF, sem compensação de saldos entre UFs"
+            ]
+        }
+
+        return {
+            "ufs": UFS,
+            "debito": debito,
+            "credito": credito,
+            "icms_devido": icms_devido,
+            "saldo_credor": saldo_credor,
+            "fcp": fcp_interno + fcp_difal,
+            "difal": difal,
+            "difal_entradas": difal_entradas,
+            "total_por_uf": total_por_uf,
+            "total": total_por_uf.sum(axis=1),
+            "arrecadacao_por_uf": total_por_uf.sum(axis=0)
+        }
+
+    def aliquotas_medias(self, receitas, custos, parcela_importados=None):
+        """Alíquotas médias ponderadas de saída e de entrada por empresa (para `icms_config`)."""
+        receitas = np.asarray(receitas, dtype=float)
+        custos = np.asarray(custos, dtype=float)
+        matriz = np.broadcast_to(self.matriz_efetiva(parcela_importados), receitas.shape)
+
+        total_receitas = receitas.sum(axis=(1, 2))
+        total_custos = custos.sum(axis=(1, 2))
+        saida = np.divide(np.einsum("eod,eod->e", receitas, matriz), total_receitas,
+                          out=np.zeros_like(total_receitas), where=total_receitas > 0)
+        entrada = np.divide(np.einsum("eod,eod->e", custos, matriz), total_custos,
+                            out=np.zeros_like(total_custos), where=total_custos > 0)
+        return {"aliquota_saida": saida, "aliquota_entrada": entrada}
@@ -0,0 +1,172 @@
+import bisect
+import re
+import unicodedata
+
+import numpy as np
+
+# Palavras (sem acentos, minúsculas) e números no formato brasileiro (1.234,56 ou 40,00)
+PADRAO_PALAVRA = re.compile(r"[a-z][a-z0-9_]*")
+PADRAO_NUMERO = re.compile(r"-?\d{1,3}(?:\.\d{3})+(?:,\d+)?|-?\d+(?:,\d+)?")
+
+# Filtros da consulta textual: "ano:2028..2032", "1.000..5.000" (faixa numérica) ou "40%" (valor exato)
+PADRAO_FILTRO_ANO = re.compile(r"^ano:(\d{4})(?:\.\.(\d{4}))?$")
+PADRAO_FAIXA = re.compile(r"^([-\d.,]*)\.\.([-\d.,]*)$")
+
+
+def normalizar_texto(texto):
+    """Minúsculas e sem acentos, para que "credito" encontre "Crédito"."""
+    return unicodedata.normalize("NFKD", str(texto).lower()).encode("ascii", "ignore").decode("ascii")
+
+
+def converter_numero(texto):
+    """Converte um número no formato brasileiro (ex: "1.234,56") para float."""
+    return float(texto.replace(".", "").replace(",", "."))
+
+
+class IndiceMemoria:
+    """Índice invertido das linhas da memória de cálculo por ano, empresa e seção.
+
+    Cada linha recebe um identificador sequencial; o índice de termos guarda, por palavra, a lista
+    crescente de identificadores, e o índice numérico, os valores citados em cada linha (arrays
+    ordenados, consultados por `np.searchsorted`). As linhas são indexadas à medida que cada ano (e
+    cada empresa, em carteiras) é calculado, sem reprocessar o que já foi indexado.
+    """
+
+    def __init__(self):
+        self.linhas = []
+        self.anos = []
+        self.empresas = []
+        self.secoes = []
+        self.termos = {}
+        self.vocabulario = None
+        self.valores_pendentes = []
+        self.ids_pendentes = []
+        self.valores = np.empty(0)
+        self.ids_valores = np.empty(0, dtype=np.int64)
+
+    def adicionar(self, memoria, ano=None, empresa=None, secao=()):
+        """Indexa as linhas de uma memória de cálculo (dicionário de seções com listas de linhas)."""
+        if isinstance(memoria, dict):
+            for chave, valor in memoria.items():
+                self.adicionar(valor, ano, empresa, secao + (chave,))
+            return self
+
+        if not isinstance(memoria, list):
+            return self
+
+        caminho = "/".join(secao)
+        for linha in memoria:
+            linha = str(linha)
+            identificador = len(self.linhas)
+            self.linhas.append(linha)
+            self.anos.append(ano)
+            self.empresas.append(empresa)
+            self.secoes.append(caminho)
+
+            texto = normalizar_texto(linha)
+            for termo in set(PADRAO_PALAVRA.findall(texto)):
+                if termo not in self.termos:
+                    self.termos[termo] = []
+                    self.vocabulario = None
+                self.termos[termo].append(identificador)
+            for numero in PADRAO_NUMERO.findall(linha):
+                self.valores_pendentes.append(converter_numero(numero))
+                self.ids_pendentes.append(identificador)
+        return self
+
+    def consolidar_valores(self):
+        """Incorpora os valores indexados desde a última consulta numérica aos arrays ordenados."""
+        if not self.valores_pendentes:
+            return
+        valores = np.concatenate([self.valores, self.valores_pendentes])
+        ids = np.concatenate([self.ids_valores, np.asarray(self.ids_pendentes, dtype=np.int64)])
+        ordem = np.argsort(valores, kind="stable")
+        self.valores, self.ids_valores = valores[ordem], ids[ordem]
+        self.valores_pendentes, self.ids_pendentes = [], []
+
+    def ids_termo(self, termo):
+        """Identificadores das linhas com o termo; "termo*" busca por prefixo no vocabulário ordenado."""
+        termo = normalizar_texto(termo)
+        if not termo.endswith("*"):
+            return set(self.termos.get(termo, ()))
+
+        prefixo = termo[:-1]
+        if self.vocabulario is None:
+            self.vocabulario = sorted(self.termos)
+        inicio = bisect.bisect_left(self.vocabulario, prefixo)
+        ids = set()
+        for palavra in self.vocabulario[inicio:]:
+            if not palavra.startswith(prefixo):
+                break
+            ids.update(self.termos[palavra])
+        return ids
+
+    def ids_faixa(self, minimo=None, maximo=None):
+        """Identificadores das linhas que citam algum valor entre `minimo` e `maximo` (inclusive)."""
+        self.consolidar_valores()
+        inicio = 0 if minimo is None else np.searchsorted(self.valores, minimo, side="left")
+        fim = self.valores.size if maximo is None else np.searchsorted(self.valores, maximo, side="right")
+        return set(self.ids_valores[inicio:fim].tolist())
+
+    def buscar(self, termos=(), faixa=None, anos=None, empresas=None, secao=None, limite=None):
+        """Linhas que contêm todos os termos e (opcionalmente) um valor na faixa (mínimo, máximo).
+
+        `anos` é um par (inicial, final); `empresas`, uma coleção de identificadores; `secao`, um
+        prefixo do caminho da seção (ex: "impostos_atuais/ICMS").
+        """
+        conjuntos = [self.ids_termo(termo) for termo in termos]
+        if faixa is not None:
+            conjuntos.append(self.ids_faixa(*faixa))
+        if not conjuntos:
+            return []
+
+        # Interseção a partir do menor conjunto
+        conjuntos.sort(key=len)
+        ids = conjuntos[0]
+        for conjunto in conjuntos[1:]:
+            ids = ids & conjunto
+            if not ids:
+                return []
+
+        resultado = []
+        for identificador in sorted(ids):
+            ano = self.anos[identificador]
+            if anos is not None and (ano is None or not anos[0] <= ano <= anos[1]):
+                continue
+            if empresas is not None and self.empresas[identificador] not in empresas:
+                continue
+            if secao is not None and not self.secoes[identificador].startswith(secao):
+                continue
+            resultado.append({
+                "ano": ano,
+                "empresa": self.empresas[identificador],
+                "secao": self.secoes[identificador],
+                "linha": self.linhas[identificador]
+            })
+            if limite and len(resultado) >= limite:
+                break
+        return resultado
+
+    def consultar(self, consulta, limite=None):
+        """Busca a partir de texto livre: palavras, "ano:2028..2032", faixas "1.000..5.000" e valores "40%"."""
+        termos = []
+        faixa = None
+        anos = None
+        for token in consulta.split():
+            filtro_ano = PADRAO_FILTRO_ANO.match(token)
+            faixa_numerica = PADRAO_FAIXA.match(token)
+            valor = token.rstrip("%")
+            if filtro_ano:
+                anos = (int(filtro_ano.group(1)), int(filtro_ano.group(2) or filtro_ano.group(1)))
+            elif faixa_numerica:
+                minimo, maximo = faixa_numerica.groups()
+                faixa = (converter_numero(minimo) if minimo else None, converter_numero(maximo) if maximo else None)
+            elif PADRAO_NUMERO.fullmatch(valor):
+                faixa = (converter_numero(valor), converter_numero(valor))
+            else:
+                termos.extend(PADRAO_PALAVRA.findall(normalizar_texto(token)) if not token.endswith("*")
+                              else [token])
+        return self.buscar(termos, faixa, anos, limite=limite)
+
+    def __len__(self):
+        return len(self.linhas)
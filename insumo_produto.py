@@ -0,0 +1,151 @@
+import csv
+import os
+import re
+
+import numpy as np
+
+from config import TRIBUTOS_ATUAIS
+from taxonomia import TaxonomiaCNAE
+
+# Parcela de cada tributo atual que não é recuperada como crédito pelo adquirente (resíduo cumulativo)
+PARCELA_NAO_RECUPERADA = {
+    "PIS": 0.30,  # Regime cumulativo (Lucro Presumido) e vedações de crédito
+    "COFINS": 0.30,
+    "IPI": 0.20,  # Aquisições de não contribuintes do IPI
+    "ICMS": 0.25,  # Uso e consumo, ativo imobilizado (1/48) e energia fora da produção
+    "ISS": 1.00  # Não gera crédito
+}
+
+
+def carregar_matriz_coeficientes(arquivo):
+    """Carrega uma matriz de coeficientes técnicos de um CSV local (ex: Matriz Insumo-Produto do IBGE).
+
+    Formato: primeira linha com os rótulos dos setores (a primeira célula é ignorada) e uma linha por
+    setor fornecedor com o rótulo seguido dos coeficientes. Aceita vírgula como separador decimal.
+    Retorna a lista de setores e a matriz (fornecedor × comprador).
+    """
+    if not os.path.exists(arquivo):
+        raise ValueError(f"Arquivo de coeficientes não encontrado: {arquivo}")
+
+    with open(arquivo, "r", encoding="utf-8") as f:
+        linhas = [linha for linha in csv.reader(f, delimiter=";") if linha]
+
+    setores = [rotulo.strip() for rotulo in linhas[0][1:]]
+    coeficientes = np.array([[float(valor.replace(",", ".")) for valor in linha[1:]] for linha in linhas[1:]])
+    return setores, coeficientes
+
+
+class ModeloInsumoProduto:
+    """Modelo de Leontief para a carga tributária embutida por unidade de demanda final de cada setor.
+
+    Nos tributos atuais, o imposto cobrado na venda final soma-se aos resíduos não recuperados em todas
+    as etapas anteriores da cadeia: e = L + ((I - A)⁻ᵀ - I)·r, com L as alíquotas nominais e r a parcela
+    não recuperada. No IVA Dual, com crédito integral, a carga embutida é a alíquota da etapa final.
+    A matriz (I - A)ᵀ é fatorada uma única vez para os cinco tributos; os anos da transição são
+    combinações lineares dessas soluções.
+    """
+
+    def __init__(self, configuracao, coeficientes, setores_io, mapa_setores=None, parcela_nao_recuperada=None):
+        self.config = configuracao
+        self.coeficientes = np.asarray(coeficientes, dtype=float)
+        self.setores_io = list(setores_io)
+        self.parcela_nao_recuperada = dict(PARCELA_NAO_RECUPERADA)
+        self.parcela_nao_recuperada.update(parcela_nao_recuperada or {})
+
+        n = len(self.setores_io)
+        if self.coeficientes.shape != (n, n):
+            raise ValueError(f"Matriz de coeficientes deve ser {n} × {n}, recebida {self.coeficientes.shape}")
+        if np.any(self.coeficientes < 0) or np.any(self.coeficientes.sum(axis=0) >= 1):
+            raise ValueError("Matriz de coeficientes não produtiva: colunas devem ser não negativas e somar menos de 1")
+
+        self.setores = self.mapear_setores(mapa_setores or {})
+        self.residuos_acumulados = None
+
+    @classmethod
+    def carregar(cls, configuracao, arquivo, mapa_setores=None, parcela_nao_recuperada=None):
+        """Cria o modelo a partir de um CSV de coeficientes técnicos."""
+        setores_io, coeficientes = carregar_matriz_coeficientes(arquivo)
+        return cls(configuracao, coeficientes, setores_io, mapa_setores, parcela_nao_recuperada)
+
+    def mapear_setores(self, mapa_setores):
+        """Associa cada setor da matriz a um setor de `setores_especiais`.
+
+        Usa `mapa_setores` quando informado; senão, rótulos iniciados pelo código da atividade do IBGE
+        (ex: "1091 Abate e produtos de carne") são classificados pela divisão CNAE (dois primeiros dígitos).
+        """
+        taxonomia = TaxonomiaCNAE(self.config)
+        setores = []
+        for rotulo in self.setores_io:
+            setor = mapa_setores.get(rotulo)
+            codigo = re.match(r"\s*(\d{4})", rotulo)
+            if setor is None and codigo:
+                indice = taxonomia.mapear([int(codigo.group(1)[:2]) * 100000])["setor"][0]
+                setor = taxonomia.setores[indice]
+            setores.append(setor if setor in self.config.setores_especiais else "padrao")
+        return setores
+
+    def aliquotas_atuais(self):
+        """Alíquotas nominais dos tributos atuais por setor da matriz (setor × tributo)."""
+        aliquotas = np.zeros((len(self.setores), len(TRIBUTOS_ATUAIS)))
+        nominais = {
+            "PIS": self.config.impostos_atuais["PIS"],
+            "COFINS": self.config.impostos_atuais["COFINS"],
+            "IPI": self.config.impostos_atuais["IPI"]["industria"],
+            "ICMS": self.config.icms_config.get("aliquota_saida", 0.19),
+            "ISS": self.config.impostos_atuais["ISS"]["padrao"]
+        }
+        for i, setor in enumerate(self.setores):
+            incidencia = self.config.obter_incidencia_atual(setor)
+            for j, tributo in enumerate(TRIBUTOS_ATUAIS):
+                if incidencia.get(tributo, True):
+                    aliquotas[i, j] = nominais[tributo]
+        return aliquotas
+
+    def aliquotas_iva(self, anos):
+        """Alíquotas efetivas do IVA Dual (CBS + IBS) por ano e setor da matriz (ano × setor)."""
+        aliquotas = np.array([[self.config.obter_aliquotas_efetivas(setor, ano)["total"] for setor in self.setores]
+                              for ano in anos])
+        # Redução adicional de 50% na base dos setores especiais (ver calcular_base_tributavel)
+        fator_base = np.array([0.5 if setor != "padrao" and self.config.setores_especiais[setor]["reducao_CBS"] > 0
+                               else 1.0 for setor in self.setores])
+        return aliquotas * fator_base
+
+    def calcular_residuos_acumulados(self):
+        """Resolve (I - A)ᵀ·X = R para os cinco tributos de uma vez (uma única fatoração LU)."""
+        if self.residuos_acumulados is None:
+            residuos = self.aliquotas_atuais() * np.array([self.parcela_nao_recuperada[t] for t in TRIBUTOS_ATUAIS])
+            identidade = np.eye(len(self.setores))
+            acumulados = np.linalg.solve((identidade - self.coeficientes).T, residuos)
+            self.residuos_acumulados = {"residuos": residuos, "acumulados": acumulados}
+        return self.residuos_acumulados
+
+    def calcular_carga_embutida(self, anos=None):
+        """Calcula a carga tributária embutida por unidade de demanda final, por ano e setor.
+
+        Retorna arrays ano × setor para os tributos atuais (total e parcela cumulativa), para o IVA Dual
+        e para a soma, além da decomposição setor × tributo sem a extinção progressiva.
+        """
+        if anos is None:
+            anos = list(self.config.fase_transicao.keys())
+        anos = sorted(anos)
+
+        solucao = self.calcular_residuos_acumulados()
+        nominais = self.aliquotas_atuais()
+        cumulativo = solucao["acumulados"] - solucao["residuos"]
+
+        # Extinção progressiva: cada ano é uma combinação dos tributos (setor × tributo) · (tributo × ano)
+        fatores = self.config.matriz_fatores_transicao(anos).T
+        carga_atual = ((nominais + cumulativo) @ fatores).T
+        residuo_cumulativo = (cumulativo @ fatores).T
+        carga_iva = self.aliquotas_iva(anos)
+
+        return {
+            "anos": anos,
+            "setores": self.setores_io,
+            "setores_simulador": self.setores,
+            "por_tributo": nominais + cumulativo,
+            "carga_atual": carga_atual,
+            "residuo_cumulativo": residuo_cumulativo,
+            "carga_iva": carga_iva,
+            "carga_total": carga_atual + carga_iva
+        }
@@ -0,0 +1,118 @@
+import csv
+import os
+
+import numpy as np
+
+# Limites de alíquota do ISS - LC 116/2003, arts. 8º, II, e 8º-A (LC 157/2016)
+ALIQUOTA_ISS_MINIMA = 0.02
+ALIQUOTA_ISS_MAXIMA = 0.05
+
+# Itens da lista de serviços fora da alíquota mínima (construção civil e transporte municipal de passageiros)
+ITENS_SEM_MINIMO = (702, 705, 1601)
+
+# Item 0: alíquota geral do município, usada para os itens sem alíquota específica
+ITEM_GERAL = 0
+
+
+def normalizar_itens(itens):
+    """Converte itens da lista da LC 116/2003 (ex: "17.01", "1701" ou 17.01) para inteiros (1701)."""
+    itens = np.asarray(itens)
+    if itens.dtype.kind in "iu":
+        return itens.astype(np.int64)
+    if itens.dtype.kind == "f":
+        return np.round(itens * 100).astype(np.int64)
+
+    # Texto: normaliza os valores distintos e expande pelo índice inverso
+    unicos, inverso = np.unique(itens.astype(str), return_inverse=True)
+    codigos = []
+    for item in unicos:
+        item = item.strip()
+        if not item:
+            codigos.append(ITEM_GERAL)
+        elif "." in item:
+            grupo, subitem = item.split(".", 1)
+            codigos.append(int(grupo) * 100 + int(subitem))
+        else:
+            codigos.append(int(item))
+    return np.array(codigos, dtype=np.int64)[inverso]
+
+
+def montar_chaves(municipios, itens):
+    """Chave composta (código IBGE × 10.000 + item) para o índice da tabela."""
+    return np.asarray(municipios, dtype=np.int64) * 10_000 + normalizar_itens(itens)
+
+
+class TabelaISS:
+    """Alíquotas de ISS por município (código IBGE) e item da lista de serviços da LC 116/2003.
+
+    O índice é um array ordenado de chaves compostas (`montar_chaves`) consultado por `np.searchsorted`,
+    o que resolve milhões de pares município × item sem laços. Na falta do item, vale a alíquota geral
+    do município (item 0); na falta do município, a alíquota padrão informada na consulta.
+    """
+
+    def __init__(self, arquivo=None):
+        self.chaves = np.empty(0, dtype=np.int64)
+        self.aliquotas = np.empty(0)
+        if arquivo:
+            self.carregar_csv(arquivo)
+
+    def construir(self, municipios, itens, aliquotas):
+        """Monta o índice; alíquotas fora dos limites da LC 116/2003 são ajustadas a eles."""
+        chaves = montar_chaves(municipios, itens)
+        aliquotas = np.asarray(aliquotas, dtype=float)
+
+        minima = np.where(np.isin(chaves % 10_000, ITENS_SEM_MINIMO), 0, ALIQUOTA_ISS_MINIMA)
+        aliquotas = np.clip(aliquotas, minima, ALIQUOTA_ISS_MAXIMA)
+
+        # Em duplicidade vale o último registro
+        self.chaves, posicao = np.unique(chaves[::-1], return_index=True)
+        self.aliquotas = aliquotas[::-1][posicao]
+        return self
+
+    def carregar_csv(self, arquivo):
+        """Constrói o índice a partir de um CSV local (codigo_ibge;item_lc116;aliquota)."""
+        if not os.path.exists(arquivo):
+            return False
+
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                linhas = list(csv.DictReader(f, delimiter=";"))
+            self.construir([int(linha["codigo_ibge"]) for linha in linhas],
+                           [linha.get("item_lc116") or "" for linha in linhas],
+                           [float(linha["aliquota"].replace(",", ".")) for linha in linhas])
+        except Exception as e:
+            print(f"Erro ao carregar tabela de ISS: {e}")
+            return False
+        return True
+
+    def buscar(self, chaves):
+        """Posição de cada chave no índice e máscara das encontradas."""
+        posicoes = np.searchsorted(self.chaves, chaves)
+        encontradas = posicoes < self.chaves.size
+        encontradas[encontradas] = self.chaves[posicoes[encontradas]] == chaves[encontradas]
+        return posicoes, encontradas
+
+    def consultar(self, municipios, itens, padrao):
+        """Retorna a alíquota de cada par município × item (específica, geral do município ou padrão)."""
+        chaves = montar_chaves(municipios, itens)
+        aliquotas = np.full(chaves.shape, padrao, dtype=float)
+
+        # Alíquota geral do município primeiro; a específica do item a substitui quando existir
+        for consulta in (chaves - chaves % 10_000 + ITEM_GERAL, chaves):
+            posicoes, encontradas = self.buscar(consulta)
+            aliquotas[encontradas] = self.aliquotas[posicoes[encontradas]]
+        return aliquotas
+
+    def aliquotas_medias(self, empresas, municipios, itens, receitas, n, padrao):
+        """Alíquota média de cada empresa, ponderada pelas receitas de serviço por município e item.
+
+        As receitas são triplas esparsas (empresa, município, item, valor); empresas sem receitas
+        informadas recebem a alíquota padrão.
+        """
+        empresas = np.asarray(empresas, dtype=np.int64)
+        receitas = np.asarray(receitas, dtype=float)
+        aliquotas = self.consultar(municipios, itens, padrao)
+
+        total = np.bincount(empresas, weights=receitas, minlength=n)
+        iss = np.bincount(empresas, weights=receitas * aliquotas, minlength=n)
+        return np.divide(iss, total, out=np.full(n, padrao, dtype=float), where=total > 0)
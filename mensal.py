@@ -0,0 +1,176 @@
+import numpy as np
+
+from apuracao import LivroCreditos, dividir_saldo_inicial
+from calculadoras import CalculadoraIVADual, CalculadoraTributosAtuais
+from config import TRIBUTOS_ATUAIS
+
+MESES_POR_ANO = 12
+
+
+def distribuir_anual(valores_anuais, sazonalidade=None, anos=8):
+    """Distribui valores anuais em meses segundo um perfil de sazonalidade.
+
+    `valores_anuais` pode ser um array por empresa (repetido em todos os anos) ou ano × empresa.
+    `sazonalidade` tem 12 pesos (ou 12 × empresa); sem perfil, a distribuição é uniforme.
+    Retorna um array período × empresa com `anos × 12` períodos.
+    """
+    valores_anuais = np.asarray(valores_anuais, dtype=float)
+    if valores_anuais.ndim == 1:
+        valores_anuais = np.broadcast_to(valores_anuais, (anos, valores_anuais.size))
+
+    if sazonalidade is None:
+        pesos = np.full((MESES_POR_ANO, 1), 1 / MESES_POR_ANO)
+    else:
+        pesos = np.asarray(sazonalidade, dtype=float)
+        if pesos.ndim == 1:
+            pesos = pesos[:, np.newaxis]
+        pesos = pesos / pesos.sum(axis=0, keepdims=True)
+
+    # (ano × 1 × empresa) · (1 × mês × empresa) → (ano·mês) × empresa
+    mensal = valores_anuais[:, np.newaxis, :] * pesos[np.newaxis, :, :]
+    return mensal.reshape(-1, valores_anuais.shape[1])
+
+
+def deslocar(valores, meses):
+    """Desloca um array período × empresa `meses` períodos à frente; retorna o deslocado e o que excede o horizonte."""
+    if meses <= 0:
+        return valores, np.zeros(valores.shape[1:])
+    deslocado = np.zeros_like(valores)
+    deslocado[meses:] = valores[:-meses]
+    return deslocado, valores[-meses:].sum(axis=0)
+
+
+class SimuladorMensal:
+    """Simulação mensal (competência e caixa) da transição para o IVA Dual.
+
+    Trabalha com arrays período × empresa (96 períodos para 2026-2033). O fator de `fase_transicao`
+    e a extinção dos tributos atuais são aplicados pelo ano de cada período, os saldos credores são
+    transportados mês a mês e o Diferimento de ICMS é tratado como deslocamento do recolhimento.
+    """
+
+    def __init__(self, configuracao, ano_inicial=2026, ano_final=2033):
+        self.config = configuracao
+        self.calculadora_iva = CalculadoraIVADual(configuracao)
+        self.calculadora_atual = CalculadoraTributosAtuais(configuracao)
+
+        anos = np.arange(ano_inicial, ano_final + 1)
+        self.anos = list(anos)
+        self.ano_periodo = np.repeat(anos, MESES_POR_ANO)
+        self.mes_periodo = np.tile(np.arange(1, MESES_POR_ANO + 1), len(anos))
+        self.periodos = self.ano_periodo * 100 + self.mes_periodo
+
+    def simular(self, lote, faturamento, custos, outros_custos=None, defasagem_recolhimento=1, defasagem_iva=1):
+        """Executa a simulação mensal.
+
+        `lote` traz os atributos fixos das empresas (ver `preparar_lote`); `faturamento` e `custos`
+        são arrays período × empresa (ver `distribuir_anual`). `outros_custos` pode conter
+        custos_simples, custos_rurais e custos_importacoes no mesmo formato. As defasagens indicam em
+        quantos meses após a competência os tributos atuais e o IVA Dual são recolhidos.
+        """
+        faturamento = np.asarray(faturamento, dtype=float)
+        custos = np.asarray(custos, dtype=float)
+        n_periodos, n_empresas = faturamento.shape
+        if n_periodos != len(self.periodos):
+            raise ValueError(f"Esperados {len(self.periodos)} períodos, recebidos {n_periodos}")
+
+        # Fator de transição e extinção dos tributos atuais por período
+        fator_transicao = np.array([self.config.fase_transicao.get(int(ano), 1.0)
+                                    for ano in self.ano_periodo])[:, np.newaxis]
+        fatores_atuais = np.repeat(self.config.matriz_fatores_transicao(self.anos), MESES_POR_ANO, axis=0)
+        percentual_cruzado = np.array([self.config.creditos_cruzados.get(int(ano), {}).get("IBS_para_ICMS", 0)
+                                       for ano in self.ano_periodo])[:, np.newaxis]
+
+        # IVA Dual: débitos e créditos do mês
+        regras = self.calculadora_iva.obter_regras_lote(lote["setor"], fator_transicao)
+        base = faturamento * regras["fator_base"] * fator_transicao
+        debito_cbs = base * regras["CBS"]
+        debito_ibs = base * regras["IBS"]
+
+        custos_credito = {"custos_tributaveis": custos, "custos_simples": 0, "custos_rurais": 0,
+                          "custos_importacoes": 0}
+        custos_credito.update(outros_custos or {})
+        credito_cbs, credito_ibs = self.calculadora_iva.calcular_creditos_lote(
+            custos_credito, regras["CBS"], regras["IBS"], debito_cbs + debito_ibs)
+
+        # Tributos atuais: cada par (período, empresa) é apurado como uma linha do lote
+        lote_mensal = {
+            "faturamento": faturamento.ravel(),
+            "custos_tributaveis": custos.ravel(),
+            "ICMS": np.tile(lote["ICMS"], n_periodos),
+            "ISS": np.tile(lote["ISS"], n_periodos),
+            "IPI": np.tile(lote["IPI"], n_periodos),
+            "setor": np.tile(lote["setor"], n_periodos),
+            "regime": np.tile(lote.get("regime", np.full(n_empresas, "real")), n_periodos)
+        }
+        if "regime" in lote:
+            # RBT12 do Simples Nacional: receita anual, e não a do mês
+            lote_mensal["rbt12"] = np.tile(lote["faturamento"], n_periodos)
+        if "aliquota_iss" in lote:
+            lote_mensal["aliquota_iss"] = np.tile(lote["aliquota_iss"], n_periodos)
+        integrais = self.calculadora_atual.calcular_valores_integrais(lote_mensal, diferimento_como_prazo=True)
+        impostos_atuais = integrais["valores"].reshape(n_periodos, n_empresas, len(TRIBUTOS_ATUAIS))
+        impostos_atuais *= fatores_atuais[:, np.newaxis, :]
+
+        indice_icms = TRIBUTOS_ATUAIS.index("ICMS")
+        fator_icms = fatores_atuais[:, indice_icms][:, np.newaxis]
+        saldo_credor_icms = integrais["saldo_credor_icms"].reshape(n_periodos, n_empresas) * fator_icms
+
+        # Livro de apuração mensal (CBS, IBS, ICMS), vetorizado sobre as empresas
+        saldo_cbs, saldo_ibs = dividir_saldo_inicial(lote["creditos_anteriores"], regras["CBS"][0], regras["IBS"][0])
+        livro = LivroCreditos(np.stack([saldo_cbs, saldo_ibs, np.zeros(n_empresas)], axis=1))
+        apuracao = livro.executar(
+            np.stack([debito_cbs, debito_ibs, impostos_atuais[:, :, indice_icms]], axis=2),
+            np.stack([credito_cbs, credito_ibs, saldo_credor_icms], axis=2))
+
+        cbs_devido = apuracao["devido"][:, :, 0]
+        ibs_devido = apuracao["devido"][:, :, 1]
+
+        # Créditos cruzados IBS → ICMS pelo percentual do ano
+        icms = apuracao["devido"][:, :, 2]
+        icms = icms - np.minimum(debito_ibs * percentual_cruzado, icms)
+        impostos_atuais[:, :, indice_icms] = icms
+
+        # Diferimento: o valor diferido sai do mês de competência e é recolhido após o prazo
+        icms_diferido = np.zeros_like(icms)
+        icms_recolhido = icms.copy()
+        pendente = np.zeros(n_empresas)
+        disponivel = icms.copy()
+        for prazo, valor in integrais["diferimentos"]:
+            diferido = np.minimum(valor.reshape(n_periodos, n_empresas) * fator_icms, disponivel)
+            disponivel -= diferido
+            icms_diferido += diferido
+            deslocado, excedente = deslocar(diferido, int(prazo))
+            icms_recolhido += deslocado - diferido
+            pendente += excedente
+
+        # Caixa: recolhimento após a defasagem de cada sistema
+        atuais_competencia = impostos_atuais.sum(axis=2) - icms + icms_recolhido
+        iva_competencia = cbs_devido + ibs_devido
+        desembolso_atuais, excedente_atuais = deslocar(atuais_competencia, defasagem_recolhimento)
+        desembolso_iva, excedente_iva = deslocar(iva_competencia, defasagem_iva)
+
+        return {
+            "periodos": self.periodos,
+            "anos": self.ano_periodo,
+            "debito_cbs": debito_cbs,
+            "debito_ibs": debito_ibs,
+            "credito_cbs": credito_cbs,
+            "credito_ibs": credito_ibs,
+            "cbs_devido": cbs_devido,
+            "ibs_devido": ibs_devido,
+            "saldo_credor_cbs": apuracao["saldo_final"][:, :, 0],
+            "saldo_credor_ibs": apuracao["saldo_final"][:, :, 1],
+            "saldo_credor_icms": apuracao["saldo_final"][:, :, 2],
+            "impostos_atuais": impostos_atuais,
+            "icms_diferido": icms_diferido,
+            "icms_recolhido": icms_recolhido,
+            "desembolso_atuais": desembolso_atuais,
+            "desembolso_iva": desembolso_iva,
+            "desembolso_total": desembolso_atuais + desembolso_iva,
+            "pendente_apos_horizonte": pendente + excedente_atuais + excedente_iva
+        }
+
+    def totais_anuais(self, valores):
+        """Soma um array período × empresa (ou período × empresa × tributo) por ano."""
+        valores = np.asarray(valores)
+        return valores.reshape(len(self.anos), MESES_POR_ANO, *valores.shape[1:]).sum(axis=1)
@@ -0,0 +1,146 @@
+import numpy as np
+
+from calculadoras import CAMPOS_CUSTO, CalculadoraIVADual, preparar_lote
+from config import TRIBUTOS_ATUAIS
+from simples import CalculadoraSimplesNacional, TRIBUTOS_DAS
+from utils import formatar_br
+
+# Regimes avaliados pelo otimizador (ordem do último eixo das cargas)
+REGIMES_OTIMIZACAO = ("real", "presumido", "simples", "simples_hibrido")
+
+
+def replicar_lote(lote, regimes):
+    """Empilha cópias do lote, uma por regime, para avaliá-las em uma única chamada vetorizada."""
+    n = lote["faturamento"].size
+    replicado = {campo: np.concatenate([valores] * len(regimes)) for campo, valores in lote.items()}
+    replicado["regime"] = np.repeat(np.asarray(regimes), n)
+    return replicado
+
+
+class OtimizadorRegimes:
+    """Escolha do regime que minimiza a carga tributária, por empresa e por ano.
+
+    Avalia Lucro Real, Lucro Presumido, Simples Nacional e Simples com recolhimento de CBS/IBS pelo
+    regime regular (opção híbrida) em um único lote. As cargas consideradas são as dos tributos sobre
+    o consumo (tributos atuais e IVA Dual) e do IRPJ/CSLL, que distinguem o Real do Presumido depois
+    da extinção de PIS/COFINS; no Simples, as parcelas do DAS correspondentes a eles.
+    """
+
+    def __init__(self, configuracao):
+        self.config = configuracao
+        self.calculadora_iva = CalculadoraIVADual(configuracao)
+        self.calculadora_simples = CalculadoraSimplesNacional(configuracao)
+        self.memoria_calculo = {}
+
+    def verificar_restricoes(self, lote, rbt12):
+        """Retorna, por regime, as empresas impedidas de optar (empresa × regime) e os motivos."""
+        acima_simples = rbt12 > self.config.limite_simples
+        acima_presumido = lote["faturamento"] > self.config.limite_presumido
+        violacoes = {
+            "limite_simples": acima_simples,
+            "limite_presumido": acima_presumido
+        }
+        impedido = np.stack([np.zeros_like(acima_simples), acima_presumido, acima_simples, acima_simples], axis=1)
+        return impedido, violacoes
+
+    def calcular_tributos_renda(self, lote, lucro):
+        """IRPJ e CSLL anuais por empresa (empresa × [real, presumido]): sobre o lucro e sobre a receita presumida."""
+        regras = self.config.tributos_renda
+        presuncao = [regras["presuncao"].get(setor, regras["presuncao"]["padrao"])
+                     for setor in self.config.setores_especiais.keys()]
+        base_irpj = lote["faturamento"] * np.array([p["IRPJ"] for p in presuncao])[lote["setor"]]
+        base_csll = lote["faturamento"] * np.array([p["CSLL"] for p in presuncao])[lote["setor"]]
+
+        def irpj(base):
+            return base * regras["IRPJ"] + np.maximum(base - regras["limite_adicional"], 0) * regras["adicional_IRPJ"]
+
+        lucro = np.maximum(lucro, 0)
+        return np.stack([irpj(lucro) + lucro * regras["CSLL"], irpj(base_irpj) + base_csll * regras["CSLL"]], axis=1)
+
+    def otimizar(self, empresas, anos=None, ano_inicial=2027, rbt12=None, anexo=None, fator_r=None, lucro=None):
+        """Avalia todos os regimes e retorna a carga por ano, o ranking, o caminho ótimo e a economia.
+
+        A economia é medida contra o regime atual de cada empresa (campo `regime`). `lucro` é o lucro
+        anual antes do IRPJ/CSLL, base do Lucro Real; sem ele, o faturamento menos os custos.
+        """
+        lote = preparar_lote(empresas, self.config)
+        if anos is None:
+            anos = [ano for ano in self.config.fase_transicao.keys() if ano >= ano_inicial]
+        anos = sorted(anos)
+        n = lote["faturamento"].size
+        rbt12 = lote["faturamento"] if rbt12 is None else np.asarray(rbt12, dtype=float)
+        if lucro is None:
+            lucro = lote["faturamento"] - sum(lote[campo] for campo in CAMPOS_CUSTO)
+        lucro = np.asarray(lucro, dtype=float)
+
+        carga = np.empty((len(anos), n, len(REGIMES_OTIMIZACAO)))
+
+        # Lucro Real e Presumido: tributos atuais + IVA Dual em uma única chamada (lote empilhado) + IRPJ/CSLL
+        regulares = ("real", "presumido")
+        lote_regular = replicar_lote(lote, regulares)
+        iva = self.calculadora_iva.calcular_lote(lote_regular, anos)
+        renda = self.calcular_tributos_renda(lote, lucro)
+        carga[:, :, :2] = iva["total_devido"].reshape(len(anos), len(regulares), n).transpose(0, 2, 1) + renda
+
+        # Simples Nacional: parcelas do DAS dos tributos sobre o consumo e do IRPJ/CSLL (constantes na transição)
+        lote_simples = dict(lote, regime=np.full(n, "simples"), rbt12=rbt12)
+        simples = self.calculadora_simples.calcular_lote(lote_simples, rbt12, anexo, fator_r, anos)
+        colunas = [TRIBUTOS_DAS.index(tributo) for tributo in TRIBUTOS_ATUAIS + ("IRPJ", "CSLL")]
+        das = simples["valores"][:, colunas].sum(axis=1)
+        carga[:, :, 2] = das[np.newaxis, :]
+
+        # Simples híbrido: DAS sem as parcelas de CBS/IBS + CBS/IBS pelo regime regular
+        iva_hibrido = iva["imposto_devido"].reshape(len(anos), len(regulares), n)[:, 0, :]
+        carga[:, :, 3] = das - simples["parcela_cbs"] - simples["parcela_ibs"] + iva_hibrido
+
+        # Restrições: regimes vedados recebem carga infinita e não entram no ranking
+        impedido, violacoes = self.verificar_restricoes(lote, rbt12)
+        carga_valida = np.where(impedido[np.newaxis, :, :], np.inf, carga)
+
+        ranking = np.argsort(carga_valida, axis=2, kind="stable")
+        regimes = np.array(REGIMES_OTIMIZACAO)
+        indice_otimo = ranking[:, :, 0]
+        carga_otima = np.take_along_axis(carga_valida, indice_otimo[:, :, np.newaxis], axis=2)[:, :, 0]
+
+        # Economia frente ao regime atual (regimes fora da tabela são tratados como Lucro Real)
+        indice_atual = np.array([REGIMES_OTIMIZACAO.index(r) if r in REGIMES_OTIMIZACAO else 0
+                                 for r in lote["regime"]], dtype=np.int64)
+        carga_atual = carga_valida[:, np.arange(n), indice_atual]
+        economia = np.where(np.isfinite(carga_atual), carga_atual - carga_otima, 0)
+
+        # Empate com o regime atual: manter o regime (troca sem ganho)
+        indice_otimo = np.where(np.isclose(carga_atual, carga_otima), indice_atual[np.newaxis, :], indice_otimo)
+
+        # Melhor regime único para todo o período (sem trocas anuais)
+        indice_unico = np.argmin(carga_valida.sum(axis=0), axis=1)
+
+        self.memoria_calculo = {
+            "otimizador": [
+                f"Empresas: {n} | Anos: {anos[0]} a {anos[-1]}" if anos else f"Empresas: {n}",
+                f"Regimes avaliados: {', '.join(REGIMES_OTIMIZACAO)}",
+                f"Acima do limite do Simples: {int(violacoes['limite_simples'].sum())}",
+                f"Acima do limite do Lucro Presumido: {int(violacoes['limite_presumido'].sum())}",
+                "Carga considerada: tributos sobre o consumo (atuais e IVA Dual), IRPJ e CSLL; CPP não incluída",
+                f"IRPJ/CSLL no Lucro Real: R$ {formatar_br(float(renda[:, 0].sum()))} | "
+                f"no Lucro Presumido: R$ {formatar_br(float(renda[:, 1].sum()))}"
+            ]
+        }
+
+        return {
+            "anos": anos,
+            "regimes": REGIMES_OTIMIZACAO,
+            "carga": carga,
+            "tributos_renda": renda,
+            "impedido": impedido,
+            "violacoes": violacoes,
+            "ranking": ranking,
+            "caminho_otimo": regimes[indice_otimo],
+            "carga_otima": carga_otima,
+            "carga_regime_atual": carga_atual,
+            "economia_anual": economia,
+            "economia_total": economia.sum(axis=0),
+            "regime_unico_otimo": regimes[indice_unico],
+            "economia_regime_unico": np.where(np.isfinite(carga_atual.sum(axis=0)), carga_atual.sum(axis=0)
+                                              - carga_valida.sum(axis=0)[np.arange(n), indice_unico], 0),
+            "regime_atual_vedado": impedido[np.arange(n), indice_atual]
+        }
@@ -0,0 +1,180 @@
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+
+from streamlit import runtime
+
+# Orçamento de memória por sessão e tempos (em segundos) para descarregar e expirar sessões ociosas
+ORCAMENTO_SESSAO = 64 * 1024 * 1024
+TEMPO_INATIVIDADE = 600
+TEMPO_MINIMO_ORCAMENTO = 120
+TEMPO_EXPIRACAO = 24 * 3600
+
+# Chaves do estado da sessão com artefatos volumosos (resultados, memória, arquivos exportados)
+CHAVES_VOLUMOSAS = ("resultados", "aliquotas_equivalentes", "memoria_calculo", "indice_memoria")
+PREFIXOS_VOLUMOSOS = ("economia_apuracao_", "arquivo_")
+
+
+def chave_volumosa(chave):
+    """Indica se a chave do estado da sessão guarda um artefato que pode ser descarregado em disco."""
+    return chave in CHAVES_VOLUMOSAS or chave.startswith(PREFIXOS_VOLUMOSOS)
+
+
+def sessao_no_runtime(sessao):
+    """Indica se a sessão ainda existe no runtime do Streamlit (conectada ou aguardando reconexão)."""
+    if not runtime.exists():
+        return True
+    return runtime.get_instance()._session_mgr.get_session_info(sessao) is not None
+
+
+def tamanho_valor(valor):
+    """Estimativa do tamanho de um valor em bytes (tamanho serializado, ou `sys.getsizeof` se não serializável)."""
+    try:
+        return len(pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(valor)
+
+
+class ArtefatoEmDisco:
+    """Marcador deixado no estado da sessão no lugar de um valor gravado em disco."""
+
+    def __init__(self, caminho, tamanho):
+        self.caminho = caminho
+        self.tamanho = tamanho
+
+
+class GerenciadorSessoes:
+    """Controla a memória residente das sessões e descarrega em disco os artefatos das sessões ociosas.
+
+    Cada execução da página (ou de um fragmento) registra a atividade da sessão (`iniciar_execucao`)
+    e, ao final da página, o tamanho das suas chaves (`finalizar_execucao`). As sessões sem atividade
+    há `inatividade` segundos, ou acima do `orcamento` e sem atividade há `minimo_orcamento` segundos,
+    têm os artefatos volumosos gravados em disco e substituídos por `ArtefatoEmDisco`; eles voltam à
+    memória na próxima execução da sessão. Sessões com uma execução em andamento (a thread que a
+    iniciou ainda está viva) nunca são descarregadas; as que `sessao_existe` não reconhece mais são
+    esquecidas, sem manter o estado vivo até a expiração. O estado de cada sessão deve aceitar
+    `estado[chave]` e atribuição a partir de outra thread.
+    """
+
+    def __init__(self, diretorio=None, orcamento=ORCAMENTO_SESSAO, inatividade=TEMPO_INATIVIDADE,
+                 minimo_orcamento=TEMPO_MINIMO_ORCAMENTO, expiracao=TEMPO_EXPIRACAO,
+                 sessao_existe=sessao_no_runtime):
+        self.diretorio = diretorio or os.path.join(tempfile.gettempdir(), "simulador_sessoes")
+        self.orcamento = orcamento
+        self.inatividade = inatividade
+        self.minimo_orcamento = minimo_orcamento
+        self.expiracao = expiracao
+        self.sessao_existe = sessao_existe
+        self.sessoes = {}
+        self.trava = threading.Lock()
+
+    def iniciar_execucao(self, sessao, estado):
+        """Registra a atividade da sessão, traz de volta seus artefatos e descarrega as sessões ociosas."""
+        agora = time.time()
+        with self.trava:
+            registro = self.sessoes.setdefault(sessao, {"tamanhos": {}, "em_disco": {}})
+            registro.update(estado=estado, ultimo_acesso=agora, execucao=threading.current_thread())
+            self.reidratar(sessao)
+
+        self.varrer(agora)
+
+    def finalizar_execucao(self, sessao, chaves):
+        """Mede as chaves do estado da sessão ao fim da execução; retorna os bytes residentes."""
+        with self.trava:
+            registro = self.sessoes.get(sessao)
+        if registro is None:
+            return 0
+
+        estado = registro["estado"]
+        tamanhos = {chave: tamanho_valor(estado[chave]) for chave in chaves if chave in estado}
+        with self.trava:
+            registro.update(tamanhos=tamanhos, ultimo_acesso=time.time())
+        return sum(tamanhos.values())
+
+    def descarregar(self, sessao):
+        """Grava em disco os artefatos volumosos da sessão e os substitui por marcadores."""
+        registro = self.sessoes[sessao]
+        estado = registro["estado"]
+        os.makedirs(self.diretorio, exist_ok=True)
+
+        for chave in [chave for chave in registro["tamanhos"] if chave_volumosa(chave)]:
+            valor = estado[chave] if chave in estado else None
+            if valor is None or isinstance(valor, ArtefatoEmDisco):
+                continue
+            caminho = os.path.join(self.diretorio, f"{sessao}_{chave}.pkl")
+            try:
+                with open(caminho, "wb") as f:
+                    pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                print(f"Erro ao descarregar '{chave}' da sessão {sessao}: {e}")
+                continue
+            estado[chave] = ArtefatoEmDisco(caminho, registro["tamanhos"].pop(chave))
+            registro["em_disco"][chave] = estado[chave].tamanho
+
+    def reidratar(self, sessao):
+        """Lê de volta para o estado da sessão os artefatos descarregados em disco."""
+        registro = self.sessoes[sessao]
+        estado = registro["estado"]
+
+        for chave in list(registro["em_disco"]):
+            tamanho = registro["em_disco"].pop(chave)
+            artefato = estado[chave] if chave in estado else None
+            if not isinstance(artefato, ArtefatoEmDisco):
+                continue
+            try:
+                with open(artefato.caminho, "rb") as f:
+                    estado[chave] = pickle.load(f)
+                registro["tamanhos"][chave] = tamanho
+            except Exception as e:
+                # Sem o arquivo, a chave é removida e a página a recria com o valor inicial
+                print(f"Erro ao reidratar '{chave}' da sessão {sessao}: {e}")
+                del estado[chave]
+            self.remover_arquivo(artefato.caminho)
+
+    def varrer(self, agora=None):
+        """Descarrega as sessões ociosas (ou acima do orçamento) e esquece as expiradas ou encerradas."""
+        agora = agora or time.time()
+        with self.trava:
+            ociosas = []
+            for sessao, registro in list(self.sessoes.items()):
+                if registro["execucao"].is_alive():
+                    continue
+                inativa = agora - registro["ultimo_acesso"]
+                if inativa >= self.expiracao or not self.sessao_existe(sessao):
+                    for chave in registro["em_disco"]:
+                        self.remover_arquivo(os.path.join(self.diretorio, f"{sessao}_{chave}.pkl"))
+                    del self.sessoes[sessao]
+                elif any(chave_volumosa(chave) for chave in registro["tamanhos"]) and (
+                        inativa >= self.inatividade or
+                        (inativa >= self.minimo_orcamento and sum(registro["tamanhos"].values()) > self.orcamento)):
+                    ociosas.append(sessao)
+
+            for sessao in ociosas:
+                self.descarregar(sessao)
+
+    def remover_arquivo(self, caminho):
+        """Remove um arquivo do armazenamento em disco, se existir."""
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+    def metricas(self):
+        """Bytes residentes e em disco por sessão, com o tempo de inatividade em segundos."""
+        agora = time.time()
+        with self.trava:
+            return {
+                sessao: {
+                    "residente": sum(registro["tamanhos"].values()),
+                    "em_disco": sum(registro["em_disco"].values()),
+                    "inativa": agora - registro["ultimo_acesso"]
+                }
+                for sessao, registro in self.sessoes.items()
+            }
+
+
+# Gerenciador compartilhado pelas sessões do processo
+GERENCIADOR_SESSOES = GerenciadorSessoes()
@@ -0,0 +1,243 @@
+import numpy as np
+
+from calculadoras import CalculadoraIVADual, preparar_lote
+from config import TRIBUTOS_ATUAIS
+from utils import formatar_br
+
+# Limites superiores das faixas de receita bruta em 12 meses (RBT12) - LC 123/2006, Anexos I a V
+LIMITES_FAIXAS = np.array([180_000, 360_000, 720_000, 1_800_000, 3_600_000, 4_800_000], dtype=float)
+
+# Sublimite estadual/municipal: acima dele ICMS e ISS são recolhidos fora do DAS
+SUBLIMITE_ICMS_ISS = 3_600_000
+
+# Tributos que compõem o DAS (ordem das colunas da repartição)
+TRIBUTOS_DAS = ("IRPJ", "CSLL", "COFINS", "PIS", "CPP", "IPI", "ICMS", "ISS")
+
+# Alíquota nominal e parcela a deduzir por anexo e faixa
+ANEXOS_SIMPLES = {
+    1: {  # Comércio
+        "aliquotas": [0.040, 0.073, 0.095, 0.107, 0.143, 0.190],
+        "deducoes": [0, 5_940, 13_860, 22_500, 87_300, 378_000]
+    },
+    2: {  # Indústria
+        "aliquotas": [0.045, 0.078, 0.100, 0.112, 0.147, 0.300],
+        "deducoes": [0, 5_940, 13_860, 22_500, 85_500, 720_000]
+    },
+    3: {  # Serviços (inclusive Anexo V com Fator R >= 28%)
+        "aliquotas": [0.060, 0.112, 0.135, 0.160, 0.210, 0.330],
+        "deducoes": [0, 9_360, 17_640, 35_640, 125_640, 648_000]
+    },
+    4: {  # Serviços com CPP recolhida fora do DAS
+        "aliquotas": [0.045, 0.090, 0.102, 0.140, 0.220, 0.330],
+        "deducoes": [0, 8_100, 12_420, 39_780, 183_780, 828_000]
+    },
+    5: {  # Serviços intelectuais
+        "aliquotas": [0.155, 0.180, 0.195, 0.205, 0.230, 0.305],
+        "deducoes": [0, 4_500, 9_900, 17_100, 62_100, 540_000]
+    }
+}
+
+# Repartição do DAS entre os tributos (% por faixa, na ordem de TRIBUTOS_DAS)
+REPARTICAO_SIMPLES = {
+    1: [[5.50, 3.50, 12.74, 2.76, 41.50, 0, 34.00, 0],
+        [5.50, 3.50, 12.74, 2.76, 41.50, 0, 34.00, 0],
+        [5.50, 3.50, 12.74, 2.76, 42.00, 0, 33.50, 0],
+        [5.50, 3.50, 12.74, 2.76, 42.00, 0, 33.50, 0],
+        [5.50, 3.50, 12.74, 2.76, 42.00, 0, 33.50, 0],
+        [13.50, 10.00, 28.27, 6.13, 42.10, 0, 0, 0]],
+    2: [[5.50, 3.50, 11.51, 2.49, 37.50, 7.50, 32.00, 0],
+        [5.50, 3.50, 11.51, 2.49, 37.50, 7.50, 32.00, 0],
+        [5.50, 3.50, 11.51, 2.49, 37.50, 7.50, 32.00, 0],
+        [5.50, 3.50, 11.51, 2.49, 37.50, 7.50, 32.00, 0],
+        [5.50, 3.50, 11.51, 2.49, 37.50, 7.50, 32.00, 0],
+        [8.50, 7.50, 20.96, 4.54, 23.50, 35.00, 0, 0]],
+    3: [[4.00, 3.50, 12.82, 2.78, 43.40, 0, 0, 33.50],
+        [4.00, 3.50, 14.05, 3.05, 43.40, 0, 0, 32.00],
+        [4.00, 3.50, 13.64, 2.96, 43.40, 0, 0, 32.50],
+        [4.00, 3.50, 13.64, 2.96, 43.40, 0, 0, 32.50],
+        [4.00, 3.50, 12.82, 2.78, 43.40, 0, 0, 33.50],
+        [35.00, 15.00, 16.03, 3.47, 30.50, 0, 0, 0]],
+    4: [[18.80, 15.20, 17.67, 3.83, 0, 0, 0, 44.50],
+        [19.80, 15.20, 20.55, 4.45, 0, 0, 0, 40.00],
+        [20.80, 15.20, 19.73, 4.27, 0, 0, 0, 40.00],
+        [17.80, 19.20, 18.90, 4.10, 0, 0, 0, 40.00],
+        [18.80, 19.20, 18.08, 3.92, 0, 0, 0, 40.00],
+        [53.50, 21.50, 20.55, 4.45, 0, 0, 0, 0]],
+    5: [[25.00, 15.00, 14.10, 3.05, 28.85, 0, 0, 14.00],
+        [23.00, 15.00, 14.10, 3.05, 27.85, 0, 0, 17.00],
+        [24.00, 15.00, 14.92, 3.23, 23.85, 0, 0, 19.00],
+        [21.00, 15.00, 15.74, 3.41, 23.85, 0, 0, 21.00],
+        [23.00, 12.50, 14.10, 3.05, 23.85, 0, 0, 23.50],
+        [35.00, 15.50, 16.44, 3.56, 29.50, 0, 0, 0]]
+}
+
+# Anexo padrão de cada setor de `setores_especiais`
+ANEXO_POR_SETOR = {
+    "padrao": 1,
+    "educacao": 3,
+    "saude": 5,
+    "alimentos": 1,
+    "transporte": 3,
+    "industria": 2,
+    "comercio": 1,
+    "servicos": 3
+}
+
+# Teto do ISS dentro do DAS (LC 116/2003, art. 8º); o excedente é redistribuído aos demais tributos
+TETO_ISS = 0.05
+
+# Fator R: serviços do Anexo V com folha/RBT12 a partir de 28% são tributados pelo Anexo III
+FATOR_R_MINIMO = 0.28
+
+# Tributos do DAS substituídos pela CBS e pelo IBS (LC 214/2025)
+SUBSTITUICAO_IVA = {"CBS": ("PIS", "COFINS"), "IBS": ("ICMS", "ISS")}
+
+
+def montar_tabelas():
+    """Monta as tabelas densas anexo × faixa (alíquotas, deduções e repartição)."""
+    aliquotas = np.array([ANEXOS_SIMPLES[anexo]["aliquotas"] for anexo in sorted(ANEXOS_SIMPLES)])
+    deducoes = np.array([ANEXOS_SIMPLES[anexo]["deducoes"] for anexo in sorted(ANEXOS_SIMPLES)], dtype=float)
+    reparticao = np.array([REPARTICAO_SIMPLES[anexo] for anexo in sorted(REPARTICAO_SIMPLES)]) / 100
+    return aliquotas, deducoes, reparticao
+
+
+class CalculadoraSimplesNacional:
+    """Cálculo do DAS do Simples Nacional (Anexos I a V) para lotes de empresas.
+
+    A faixa de cada empresa é resolvida por `np.searchsorted` sobre os limites de RBT12 e as tabelas
+    anexo × faixa são indexadas de uma só vez, de modo que todo o lote é calculado sem laços.
+    A repartição do DAS identifica as parcelas que a CBS e o IBS substituem durante a transição.
+    """
+
+    def __init__(self, configuracao):
+        self.config = configuracao
+        self.aliquotas, self.deducoes, self.reparticao = montar_tabelas()
+        self.calculadora_iva = CalculadoraIVADual(configuracao)
+        self.memoria_calculo = {}
+
+    def definir_anexos(self, setor, anexo=None, fator_r=None):
+        """Resolve o anexo de cada empresa: informado, ou pelo setor, com a regra do Fator R."""
+        setores = list(self.config.setores_especiais.keys())
+        if anexo is None:
+            tabela = np.array([ANEXO_POR_SETOR.get(nome, 1) for nome in setores], dtype=np.int8)
+            anexo = tabela[np.asarray(setor)]
+        anexo = np.asarray(anexo, dtype=np.int8)
+
+        if anexo.size and (anexo.min() < 1 or anexo.max() > 5):
+            raise ValueError("Anexo do Simples Nacional deve estar entre 1 e 5")
+
+        if fator_r is not None:
+            anexo = np.where((anexo == 5) & (np.asarray(fator_r) >= FATOR_R_MINIMO), 3, anexo).astype(np.int8)
+        return anexo
+
+    def calcular_das(self, receita, rbt12, anexo):
+        """Calcula o DAS de um lote: arrays de receita do período, RBT12 e anexo (1 a 5)."""
+        receita = np.asarray(receita, dtype=float)
+        rbt12 = np.asarray(rbt12, dtype=float)
+        indice_anexo = np.asarray(anexo) - 1
+
+        # Faixa pela RBT12: "até" o limite inclui o próprio limite
+        faixa = np.searchsorted(LIMITES_FAIXAS, rbt12, side="left")
+        excluida = faixa >= len(LIMITES_FAIXAS)
+        faixa = np.minimum(faixa, len(LIMITES_FAIXAS) - 1)
+
+        nominal = self.aliquotas[indice_anexo, faixa]
+        deducao = self.deducoes[indice_anexo, faixa]
+        # Início de atividade (RBT12 nula): alíquota nominal da primeira faixa
+        aliquota_efetiva = np.where(rbt12 > 0, (rbt12 * nominal - deducao) / np.where(rbt12 > 0, rbt12, 1), nominal)
+
+        # Repartição (empresa × tributo) com o teto do ISS redistribuído proporcionalmente
+        reparticao = self.reparticao[indice_anexo, faixa].copy()
+        indice_iss = TRIBUTOS_DAS.index("ISS")
+        iss_efetivo = aliquota_efetiva * reparticao[:, indice_iss]
+        excesso = np.maximum(iss_efetivo - TETO_ISS, 0)
+        if np.any(excesso > 0):
+            percentual_excesso = np.divide(excesso, aliquota_efetiva, out=np.zeros_like(excesso),
+                                           where=aliquota_efetiva > 0)
+            demais = reparticao.copy()
+            demais[:, indice_iss] = 0
+            soma_demais = demais.sum(axis=1, keepdims=True)
+            reparticao += demais / np.where(soma_demais > 0, soma_demais, 1) * percentual_excesso[:, np.newaxis]
+            reparticao[:, indice_iss] -= percentual_excesso
+
+        das = receita * aliquota_efetiva
+        valores = das[:, np.newaxis] * reparticao
+
+        return {
+            "faixa": faixa + 1,
+            "aliquota_nominal": nominal,
+            "parcela_deduzir": deducao,
+            "aliquota_efetiva": aliquota_efetiva,
+            "reparticao": reparticao,
+            "das": das,
+            "valores": valores,
+            "icms_iss_fora_das": rbt12 > SUBLIMITE_ICMS_ISS,
+            "excluida": excluida | (rbt12 > self.config.limite_simples)
+        }
+
+    def calcular_lote(self, lote, rbt12=None, anexo=None, fator_r=None, anos=None):
+        """Calcula o DAS por ano para um lote (ver `preparar_lote`) e a parcela substituída por CBS/IBS.
+
+        Sem `rbt12`, usa o faturamento anual do lote. O total do DAS não muda na transição; o que muda é
+        a parte que corresponde a PIS/COFINS (CBS) e a ICMS/ISS (IBS), conforme a extinção dos tributos.
+        """
+        if anos is None:
+            anos = list(self.config.fase_transicao.keys())
+        anos = sorted(anos)
+
+        receita = lote["faturamento"]
+        anexos = self.definir_anexos(lote["setor"], anexo, fator_r)
+        das = self.calcular_das(receita, receita if rbt12 is None else rbt12, anexos)
+
+        # Parcela do DAS substituída pela CBS e pelo IBS em cada ano (ano × empresa)
+        fatores = self.config.matriz_fatores_transicao(anos)
+        parcelas = {}
+        for tributo_iva, substituidos in SUBSTITUICAO_IVA.items():
+            parcela = np.zeros((len(anos), receita.size))
+            for tributo in substituidos:
+                substituicao = 1 - fatores[:, TRIBUTOS_ATUAIS.index(tributo)]
+                parcela += substituicao[:, np.newaxis] * das["valores"][:, TRIBUTOS_DAS.index(tributo)]
+            parcelas[tributo_iva] = parcela
+
+        self.memoria_calculo = {
+            "simples": [
+                f"Empresas: {receita.size}",
+                f"Anexos: {', '.join(str(a) for a in np.unique(anexos))}",
+                f"Acima do sublimite de ICMS/ISS: {int(das['icms_iss_fora_das'].sum())}",
+                f"Excluídas (RBT12 acima de R$ {formatar_br(self.config.limite_simples)}): {int(das['excluida'].sum())}"
+            ]
+        }
+
+        return dict(das, anos=anos, anexo=anexos, parcela_cbs=parcelas["CBS"], parcela_ibs=parcelas["IBS"],
+                    das_anual=np.broadcast_to(das["das"], (len(anos), receita.size)))
+
+    def comparar_com_iva(self, empresas, rbt12=None, anexo=None, fator_r=None, anos=None):
+        """Compara, por ano, permanecer no Simples com recolher CBS/IBS pelo regime regular do IVA Dual.
+
+        Na opção pelo regime regular, o DAS deixa de incluir as parcelas de CBS/IBS e a empresa passa a
+        apurar CBS/IBS com débitos e créditos (via `CalculadoraIVADual.calcular_lote`), podendo
+        transferir crédito integral aos clientes.
+        """
+        lote = preparar_lote(empresas, self.config)
+
+        simples = self.calcular_lote(lote, rbt12, anexo, fator_r, anos)
+        iva = self.calculadora_iva.calcular_lote(lote, simples["anos"])
+
+        das_hibrido = simples["das_anual"] - simples["parcela_cbs"] - simples["parcela_ibs"]
+        total_hibrido = das_hibrido + iva["imposto_devido"]
+
+        # Crédito que os clientes podem tomar: 20% (regras_credito) no Simples e integral no regime regular
+        credito_clientes_simples = iva["imposto_bruto"] * self.config.regras_credito["simples"]
+
+        return {
+            "anos": simples["anos"],
+            "simples": simples,
+            "das": simples["das_anual"],
+            "das_hibrido": das_hibrido,
+            "iva_regular": iva["imposto_devido"],
+            "total_hibrido": total_hibrido,
+            "diferenca": total_hibrido - simples["das_anual"],
+            "credito_clientes_simples": credito_clientes_simples,
+            "credito_clientes_regular": iva["imposto_bruto"],
+            "melhor_opcao": np.where(total_hibrido < simples["das_anual"], "regular", "simples")
+        }
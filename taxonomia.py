@@ -0,0 +1,267 @@
+import csv
+import os
+import re
+
+import numpy as np
+
+
+# Divisões da CNAE 2.3 (IBGE) - setor do IVA Dual e incidência dos tributos atuais
+# Formato: divisão: (descrição, setor, ICMS, ISS, IPI)
+DIVISOES_CNAE = {
+    1: ("Agricultura, pecuária e serviços relacionados", "alimentos", True, False, False),
+    2: ("Produção florestal", "padrao", True, False, False),
+    3: ("Pesca e aquicultura", "alimentos", True, False, False),
+    5: ("Extração de carvão mineral", "industria", True, False, False),
+    6: ("Extração de petróleo e gás natural", "industria", True, False, False),
+    7: ("Extração de minerais metálicos", "industria", True, False, False),
+    8: ("Extração de minerais não-metálicos", "industria", True, False, False),
+    9: ("Atividades de apoio à extração de minerais", "servicos", False, True, False),
+    10: ("Fabricação de produtos alimentícios", "alimentos", True, False, True),
+    11: ("Fabricação de bebidas", "industria", True, False, True),
+    12: ("Fabricação de produtos do fumo", "industria", True, False, True),
+    13: ("Fabricação de produtos têxteis", "industria", True, False, True),
+    14: ("Confecção de artigos do vestuário e acessórios", "industria", True, False, True),
+    15: ("Preparação de couros e fabricação de artefatos de couro e calçados", "industria", True, False, True),
+    16: ("Fabricação de produtos de madeira", "industria", True, False, True),
+    17: ("Fabricação de celulose, papel e produtos de papel", "industria", True, False, True),
+    18: ("Impressão e reprodução de gravações", "industria", True, False, True),
+    19: ("Fabricação de coque, derivados do petróleo e biocombustíveis", "industria", True, False, True),
+    20: ("Fabricação de produtos químicos", "industria", True, False, True),
+    21: ("Fabricação de produtos farmoquímicos e farmacêuticos", "industria", True, False, True),
+    22: ("Fabricação de produtos de borracha e de material plástico", "industria", True, False, True),
+    23: ("Fabricação de produtos de minerais não-metálicos", "industria", True, False, True),
+    24: ("Metalurgia", "industria", True, False, True),
+    25: ("Fabricação de produtos de metal, exceto máquinas e equipamentos", "industria", True, False, True),
+    26: ("Fabricação de equipamentos de informática, eletrônicos e ópticos", "industria", True, False, True),
+    27: ("Fabricação de máquinas, aparelhos e materiais elétricos", "industria", True, False, True),
+    28: ("Fabricação de máquinas e equipamentos", "industria", True, False, True),
+    29: ("Fabricação de veículos automotores, reboques e carrocerias", "industria", True, False, True),
+    30: ("Fabricação de outros equipamentos de transporte", "industria", True, False, True),
+    31: ("Fabricação de móveis", "industria", True, False, True),
+    32: ("Fabricação de produtos diversos", "industria", True, False, True),
+    33: ("Manutenção, reparação e instalação de máquinas e equipamentos", "servicos", False, True, False),
+    35: ("Eletricidade, gás e outras utilidades", "padrao", True, False, False),
+    36: ("Captação, tratamento e distribuição de água", "padrao", False, False, False),
+    37: ("Esgoto e atividades relacionadas", "servicos", False, True, False),
+    38: ("Coleta, tratamento e disposição de resíduos", "servicos", False, True, False),
+    39: ("Descontaminação e outros serviços de gestão de resíduos", "servicos", False, True, False),
+    41: ("Construção de edifícios", "servicos", False, True, False),
+    42: ("Obras de infraestrutura", "servicos", False, True, False),
+    43: ("Serviços especializados para construção", "servicos", False, True, False),
+    45: ("Comércio e reparação de veículos automotores e motocicletas", "comercio", True, False, False),
+    46: ("Comércio por atacado, exceto veículos automotores", "comercio", True, False, False),
+    47: ("Comércio varejista", "comercio", True, False, False),
+    49: ("Transporte terrestre", "transporte", True, False, False),
+    50: ("Transporte aquaviário", "transporte", True, False, False),
+    51: ("Transporte aéreo", "transporte", True, False, False),
+    52: ("Armazenamento e atividades auxiliares dos transportes", "servicos", False, True, False),
+    53: ("Correio e outras atividades de entrega", "servicos", False, True, False),
+    55: ("Alojamento", "servicos", False, True, False),
+    56: ("Alimentação", "servicos", True, False, False),
+    58: ("Edição e edição integrada à impressão", "servicos", False, False, False),
+    59: ("Atividades cinematográficas, de vídeo, de televisão e gravação de som", "servicos", False, True, False),
+    60: ("Atividades de rádio e de televisão", "servicos", False, False, False),
+    61: ("Telecomunicações", "padrao", True, False, False),
+    62: ("Atividades dos serviços de tecnologia da informação", "servicos", False, True, False),
+    63: ("Atividades de prestação de serviços de informação", "servicos", False, True, False),
+    64: ("Atividades de serviços financeiros", "servicos", False, True, False),
+    65: ("Seguros, resseguros, previdência complementar e planos de saúde", "servicos", False, True, False),
+    66: ("Atividades auxiliares dos serviços financeiros e seguros", "servicos", False, True, False),
+    68: ("Atividades imobiliárias", "servicos", False, True, False),
+    69: ("Atividades jurídicas, de contabilidade e de auditoria", "servicos", False, True, False),
+    70: ("Atividades de sedes de empresas e de consultoria em gestão", "servicos", False, True, False),
+    71: ("Serviços de arquitetura e engenharia; testes e análises técnicas", "servicos", False, True, False),
+    72: ("Pesquisa e desenvolvimento científico", "servicos", False, True, False),
+    73: ("Publicidade e pesquisa de mercado", "servicos", False, True, False),
+    74: ("Outras atividades profissionais, científicas e técnicas", "servicos", False, True, False),
+    75: ("Atividades veterinárias", "servicos", False, True, False),
+    77: ("Aluguéis não-imobiliários e gestão de ativos intangíveis", "servicos", False, True, False),
+    78: ("Seleção, agenciamento e locação de mão-de-obra", "servicos", False, True, False),
+    79: ("Agências de viagens, operadores turísticos e serviços de reservas", "servicos", False, True, False),
+    80: ("Atividades de vigilância, segurança e investigação", "servicos", False, True, False),
+    81: ("Serviços para edifícios e atividades paisagísticas", "servicos", False, True, False),
+    82: ("Serviços de escritório e de apoio administrativo", "servicos", False, True, False),
+    84: ("Administração pública, defesa e seguridade social", "padrao", False, False, False),
+    85: ("Educação", "educacao", False, True, False),
+    86: ("Atividades de atenção à saúde humana", "saude", False, True, False),
+    87: ("Atenção à saúde humana integrada com assistência social", "saude", False, True, False),
+    88: ("Serviços de assistência social sem alojamento", "servicos", False, True, False),
+    90: ("Atividades artísticas, criativas e de espetáculos", "servicos", False, True, False),
+    91: ("Atividades ligadas ao patrimônio cultural e ambiental", "servicos", False, True, False),
+    92: ("Atividades de exploração de jogos de azar e apostas", "servicos", False, True, False),
+    93: ("Atividades esportivas e de recreação e lazer", "servicos", False, True, False),
+    94: ("Atividades de organizações associativas", "servicos", False, False, False),
+    95: ("Reparação e manutenção de equipamentos e objetos pessoais", "servicos", False, True, False),
+    96: ("Outras atividades de serviços pessoais", "servicos", False, True, False),
+    97: ("Serviços domésticos", "padrao", False, False, False),
+    99: ("Organismos internacionais e outras instituições extraterritoriais", "padrao", False, False, False)
+}
+
+# Exceções no nível de classe (5 dígitos) quando a divisão não representa bem a atividade
+CLASSES_CNAE = {
+    49124: ("Transporte metroferroviário de passageiros", "transporte", False, True, False),
+    49213: ("Transporte rodoviário coletivo de passageiros, municipal e metropolitano", "transporte", False, True,
+            False),
+    45200: ("Manutenção e reparação de veículos automotores", "servicos", False, True, False),
+    95118: ("Reparação e manutenção de computadores e periféricos", "servicos", False, True, False)
+}
+
+
+def normalizar_cnae(codigo):
+    """Converte um código CNAE (ex: "4711-3/01", "47113", 4711301) para o inteiro da subclasse (7 dígitos)."""
+    if isinstance(codigo, (int, np.integer)):
+        digitos = f"{int(codigo):07d}" if int(codigo) >= 100000 else f"{int(codigo):05d}"
+    else:
+        digitos = re.sub(r"\D", "", str(codigo))
+
+    if len(digitos) == 7:
+        return int(digitos)
+    if len(digitos) == 5:
+        # Código de classe: usar a subclasse genérica "00"
+        return int(digitos) * 100
+    raise ValueError(f"Código CNAE inválido: {codigo}")
+
+
+class TaxonomiaCNAE:
+    """Taxonomia setorial indexada pela CNAE, compartilhada pelas calculadoras atual e do IVA Dual.
+
+    Cada subclasse CNAE (~1.300 códigos) é associada a um setor de `setores_especiais` e à incidência
+    dos tributos atuais (ICMS, ISS, IPI). A resolução usa uma tabela densa indexada pela classe
+    (5 dígitos), o que garante consulta O(1) tanto para um código quanto para arrays de códigos.
+    """
+
+    TRIBUTOS = ("ICMS", "ISS", "IPI")
+
+    def __init__(self, configuracao, arquivo_subclasses=None):
+        self.config = configuracao
+
+        # Setores na mesma ordem da configuração (o índice é usado nos arrays)
+        self.setores = list(self.config.setores_especiais.keys())
+        self.indice_setor = {setor: i for i, setor in enumerate(self.setores)}
+
+        # Tabela densa por classe CNAE: setor e incidências (bit 0 = ICMS, 1 = ISS, 2 = IPI)
+        self.setor_por_classe = np.full(100_000, -1, dtype=np.int16)
+        self.incidencia_por_classe = np.zeros(100_000, dtype=np.uint8)
+        self.descricoes = {}
+
+        for divisao, registro in DIVISOES_CNAE.items():
+            self._registrar(slice(divisao * 1000, (divisao + 1) * 1000), registro)
+            self.descricoes[divisao] = registro[0]
+
+        for classe, registro in CLASSES_CNAE.items():
+            self._registrar(classe, registro)
+            self.descricoes[classe] = registro[0]
+
+        # Exceções no nível de subclasse (7 dígitos), carregadas de arquivo local
+        self.subclasses = {}
+        self._chaves_subclasses = np.empty(0, dtype=np.int64)
+        self._setor_subclasses = np.empty(0, dtype=np.int16)
+        self._incidencia_subclasses = np.empty(0, dtype=np.uint8)
+
+        if arquivo_subclasses:
+            self.carregar_subclasses(arquivo_subclasses)
+
+    def _codificar(self, registro):
+        """Converte (descrição, setor, ICMS, ISS, IPI) em (índice do setor, máscara de incidência)."""
+        _, setor, icms, iss, ipi = registro
+        indice = self.indice_setor.get(setor, self.indice_setor["padrao"])
+        mascara = (1 if icms else 0) | (2 if iss else 0) | (4 if ipi else 0)
+        return indice, mascara
+
+    def _registrar(self, posicao, registro):
+        indice, mascara = self._codificar(registro)
+        self.setor_por_classe[posicao] = indice
+        self.incidencia_por_classe[posicao] = mascara
+
+    def carregar_subclasses(self, arquivo):
+        """Carrega a tabela de subclasses CNAE de um CSV local (subclasse;descricao;setor;ICMS;ISS;IPI)."""
+        if not os.path.exists(arquivo):
+            return False
+
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                for linha in csv.DictReader(f, delimiter=";"):
+                    registro = (
+                        linha.get("descricao", ""),
+                        linha["setor"],
+                        linha.get("ICMS", "0").strip() in ("1", "S", "s", "True"),
+                        linha.get("ISS", "0").strip() in ("1", "S", "s", "True"),
+                        linha.get("IPI", "0").strip() in ("1", "S", "s", "True")
+                    )
+                    codigo = normalizar_cnae(linha["subclasse"])
+                    self.subclasses[codigo] = self._codificar(registro)
+                    self.descricoes[codigo] = registro[0]
+        except Exception as e:
+            print(f"Erro ao carregar subclasses CNAE: {e}")
+            return False
+
+        # Índice ordenado das exceções para a resolução vetorizada
+        chaves = np.array(sorted(self.subclasses), dtype=np.int64)
+        self._chaves_subclasses = chaves
+        self._setor_subclasses = np.array([self.subclasses[c][0] for c in chaves], dtype=np.int16)
+        self._incidencia_subclasses = np.array([self.subclasses[c][1] for c in chaves], dtype=np.uint8)
+        return True
+
+    def classificar(self, cnae):
+        """Retorna o setor e a incidência dos tributos atuais para um código CNAE."""
+        codigo = normalizar_cnae(cnae)
+
+        if codigo in self.subclasses:
+            indice, mascara = self.subclasses[codigo]
+        else:
+            classe = codigo // 100
+            indice = int(self.setor_por_classe[classe])
+            mascara = int(self.incidencia_por_classe[classe])
+
+        if indice < 0:
+            raise ValueError(f"Código CNAE não encontrado na taxonomia: {cnae}")
+
+        setor = self.setores[indice]
+        return {
+            "setor": setor,
+            "descricao": self.descricoes.get(codigo, self.descricoes.get(codigo // 100,
+                                                                          self.descricoes.get(codigo // 100000, ""))),
+            "incidencia": {tributo: bool(mascara & (1 << i)) for i, tributo in enumerate(self.TRIBUTOS)},
+            "regras_iva": self.config.setores_especiais[setor]
+        }
+
+    def mapear(self, codigos):
+        """Mapeia um array de códigos CNAE (inteiros de 7 dígitos) para setores e incidências, de forma vetorizada.
+
+        Códigos inexistentes na taxonomia recebem o setor "padrao" com a incidência configurada para ele
+        (`incidencia_setores["padrao"]`) e ficam marcados em `encontrado` (False), que `classificar` rejeita.
+        """
+        codigos = np.asarray(codigos)
+        if codigos.dtype.kind not in "iu":
+            codigos = np.array([normalizar_cnae(c) for c in codigos.ravel()], dtype=np.int64).reshape(codigos.shape)
+
+        classes = np.clip(codigos // 100, 0, 99_999)
+        setores = self.setor_por_classe[classes]
+        mascaras = self.incidencia_por_classe[classes]
+
+        # Sobrepor as exceções de subclasse
+        if self._chaves_subclasses.size:
+            posicao = np.searchsorted(self._chaves_subclasses, codigos)
+            posicao = np.minimum(posicao, self._chaves_subclasses.size - 1)
+            encontrados = self._chaves_subclasses[posicao] == codigos
+            setores = np.where(encontrados, self._setor_subclasses[posicao], setores)
+            mascaras = np.where(encontrados, self._incidencia_subclasses[posicao], mascaras)
+
+        # Códigos desconhecidos: setor "padrao" com a incidência da configuração
+        encontrado = setores >= 0
+        incidencia_padrao = self.config.incidencia_setores["padrao"]
+        mascara_padrao = sum(1 << i for i, tributo in enumerate(self.TRIBUTOS) if incidencia_padrao.get(tributo))
+        setores = np.where(encontrado, setores, self.indice_setor["padrao"]).astype(np.int16)
+        mascaras = np.where(encontrado, mascaras, mascara_padrao)
+
+        resultado = {"setor": setores, "encontrado": encontrado}
+        for i, tributo in enumerate(self.TRIBUTOS):
+            resultado[tributo] = (mascaras & (1 << i)) > 0
+        return resultado
+
+    def regras_iva(self, setores):
+        """Retorna as regras do IVA Dual (IBS e redução da CBS) para um array de índices de setor."""
+        ibs = np.array([self.config.setores_especiais[s]["IBS"] for s in self.setores])
+        reducao_cbs = np.array([self.config.setores_especiais[s]["reducao_CBS"] for s in self.setores])
+        setores = np.asarray(setores)
+        return {"IBS": ibs[setores], "reducao_CBS": reducao_cbs[setores]}
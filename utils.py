@@ -1,9 +1,15 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 
 
@@ -12,29 +18,97 @@ def formatar_br(valor, decimais=2):
     return f"{valor:,.{decimais}f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
 
-def criar_grafico_comparativo(resultados, titulo=None):
-    """Cria um gráfico de barras comparativo dos impostos por ano usando Plotly."""
+# Indicadores da tabela longa de resultados (uma linha por ano × indicador)
+INDICADORES_RESULTADOS = {
+    "CBS": lambda resultado: resultado["cbs"],
+    "IBS": lambda resultado: resultado["ibs"],
+    "Créditos": lambda resultado: resultado["creditos"],
+    "Imposto Devido": lambda resultado: resultado["imposto_devido"],
+    "Sistema Atual": lambda resultado: (resultado.get("impostos_atuais", {}).get("total", 0)
+                                        if isinstance(resultado.get("impostos_atuais"), dict) else 0),
+    "Alíquota Efetiva (%)": lambda resultado: resultado["aliquota_efetiva"] * 100,
+    "ICMS": lambda resultado: resultado["impostos_atuais"].get("ICMS", 0),
+    "Economia ICMS": lambda resultado: resultado["impostos_atuais"].get("economia_icms", 0)
+}
+
+# Caches por impressão digital dos resultados, com descarte do item menos usado (LRU), compartilhados
+# pelas sessões e protegidos por uma trava (as sessões rodam em threads distintas)
+LIMITE_CACHE_GRAFICOS = 32
+TRAVA_CACHES = threading.Lock()
+CACHE_TABELAS = OrderedDict()
+CACHE_FIGURAS = OrderedDict()
+CACHE_ARQUIVOS = OrderedDict()
+
+
+def impressao_digital(resultados):
+    """Hash do conteúdo dos resultados; muda apenas quando uma nova simulação altera algum valor."""
+    conteudo = json.dumps(resultados, sort_keys=True, default=float)
+    return hashlib.sha1(conteudo.encode("utf-8")).hexdigest()
+
+
+def consultar_cache(cache, chave):
+    """Retorna o valor em cache (ou None), marcando-o como usado mais recentemente."""
+    with TRAVA_CACHES:
+        valor = cache.get(chave)
+        if valor is not None:
+            cache.move_to_end(chave)
+        return valor
+
+
+def guardar_cache(cache, chave, valor, limite=LIMITE_CACHE_GRAFICOS):
+    """Guarda um valor no cache, descartando os menos usados acima do limite."""
+    with TRAVA_CACHES:
+        cache[chave] = valor
+        cache.move_to_end(chave)
+        while len(cache) > limite:
+            cache.popitem(last=False)
+    return valor
+
+
+def tabela_longa_resultados(resultados, chave=None):
+    """Tabela longa (Ano, Indicador, Valor) dos resultados, montada uma vez por simulação."""
+    chave = chave or impressao_digital(resultados)
+    tabela = consultar_cache(CACHE_TABELAS, chave)
+    if tabela is None:
+        linhas = [(ano, indicador, float(extrair(resultado)))
+                  for ano, resultado in resultados.items()
+                  for indicador, extrair in INDICADORES_RESULTADOS.items()]
+        tabela = guardar_cache(CACHE_TABELAS, chave, pd.DataFrame(linhas, columns=["Ano", "Indicador", "Valor"]))
+    return tabela
+
+
+def serie_indicador(tabela, indicador):
+    """Valores de um indicador por ano, na ordem dos anos da simulação."""
+    return tabela.loc[tabela["Indicador"] == indicador, "Valor"].tolist()
+
+
+def obter_grafico(tipo, resultados, titulo, construtor, chave_resultados=None):
+    """Figura em cache (JSON do Plotly) para os resultados e o título, ou construída a partir da tabela longa.
+
+    `chave_resultados` é a impressão digital já calculada dos resultados (uma vez por simulação); sem ela,
+    a impressão é calculada aqui.
+    """
     if not resultados:
         return None
 
-    anos = list(resultados.keys())
-    cbs_valores = [resultados[ano]["cbs"] for ano in anos]
-    ibs_valores = [resultados[ano]["ibs"] for ano in anos]
-    creditos = [resultados[ano]["creditos"] for ano in anos]
-    liquido = [resultados[ano]["imposto_devido"] for ano in anos]
+    chave_resultados = chave_resultados or impressao_digital(resultados)
+    chave = (chave_resultados, tipo, titulo)
+    figura_json = consultar_cache(CACHE_FIGURAS, chave)
+    if figura_json is not None:
+        return pio.from_json(figura_json, skip_invalid=True)
+
+    figura = construtor(tabela_longa_resultados(resultados, chave_resultados), titulo)
+    guardar_cache(CACHE_FIGURAS, chave, figura.to_json())
+    return figura
 
-    df = pd.DataFrame({
-        'Ano': anos,
-        'CBS': cbs_valores,
-        'IBS': ibs_valores,
-        'Créditos': creditos,
-        'Imposto Devido': liquido
-    })
 
-    df_melt = pd.melt(df, id_vars=['Ano'], value_vars=['CBS', 'IBS', 'Créditos', 'Imposto Devido'],
-                      var_name='Categoria', value_name='Valor')
+def montar_grafico_comparativo(tabela, titulo=None):
+    """Barras agrupadas de CBS, IBS, créditos e imposto devido por ano."""
+    categorias = ['CBS', 'IBS', 'Créditos', 'Imposto Devido']
+    df_melt = tabela[tabela["Indicador"].isin(categorias)].rename(columns={"Indicador": "Categoria"})
 
     fig = px.bar(df_melt, x='Ano', y='Valor', color='Categoria', barmode='group',
+                 category_orders={'Categoria': categorias},
                  title=titulo or 'Comparativo de Impostos',
                  labels={'Valor': 'Valor (R$)', 'Ano': 'Ano'})
 
@@ -44,18 +118,14 @@ def criar_grafico_comparativo(resultados, titulo=None):
     return fig
 
 
-def criar_grafico_aliquotas(resultados, titulo=None):
-    """Cria um gráfico de linha das alíquotas efetivas usando Plotly."""
-    if not resultados:
-        return None
+def criar_grafico_comparativo(resultados, titulo=None, chave=None):
+    """Cria um gráfico de barras comparativo dos impostos por ano usando Plotly."""
+    return obter_grafico("comparativo", resultados, titulo, montar_grafico_comparativo, chave)
 
-    anos = list(resultados.keys())
-    aliquotas_efetivas = [resultados[ano]["aliquota_efetiva"] * 100 for ano in anos]
 
-    df = pd.DataFrame({
-        'Ano': anos,
-        'Alíquota Efetiva (%)': aliquotas_efetivas
-    })
+def montar_grafico_aliquotas(tabela, titulo=None):
+    """Linha da alíquota efetiva por ano."""
+    df = tabela[tabela["Indicador"] == "Alíquota Efetiva (%)"].rename(columns={"Valor": "Alíquota Efetiva (%)"})
 
     fig = px.line(df, x='Ano', y='Alíquota Efetiva (%)', markers=True,
                   title=titulo or 'Evolução da Alíquota Efetiva',
@@ -67,36 +137,18 @@ def criar_grafico_aliquotas(resultados, titulo=None):
     return fig
 
 
-def criar_grafico_transicao(resultados, titulo=None):
-    """Cria um gráfico comparativo entre sistema atual e IVA Dual."""
-    if not resultados:
-        return None
+def criar_grafico_aliquotas(resultados, titulo=None, chave=None):
+    """Cria um gráfico de linha das alíquotas efetivas usando Plotly."""
+    return obter_grafico("aliquotas", resultados, titulo, montar_grafico_aliquotas, chave)
+
 
-    anos = list(resultados.keys())
-    dados_iva = [resultado["imposto_devido"] for resultado in resultados.values()]
-    dados_atuais = []
-
-    for ano, resultado in resultados.items():
-        if "impostos_atuais" in resultado:
-            impostos = resultado["impostos_atuais"]
-            if isinstance(impostos, dict):
-                atuais = impostos.get("total", 0)
-                dados_atuais.append(atuais)
-            else:
-                dados_atuais.append(0)
-        else:
-            dados_atuais.append(0)
-
-    df = pd.DataFrame({
-        'Ano': anos,
-        'Sistema Atual': dados_atuais,
-        'IVA Dual': dados_iva
-    })
-
-    df_melt = pd.melt(df, id_vars=['Ano'], value_vars=['Sistema Atual', 'IVA Dual'],
-                      var_name='Sistema', value_name='Valor')
+def montar_grafico_transicao(tabela, titulo=None):
+    """Barras agrupadas do sistema atual e do IVA Dual por ano."""
+    df_melt = tabela[tabela["Indicador"].isin(["Sistema Atual", "Imposto Devido"])].rename(
+        columns={"Indicador": "Sistema"}).replace({"Sistema": {"Imposto Devido": "IVA Dual"}})
 
     fig = px.bar(df_melt, x='Ano', y='Valor', color='Sistema', barmode='group',
+                 category_orders={'Sistema': ['Sistema Atual', 'IVA Dual']},
                  title=titulo or 'Evolução Tributária na Transição',
                  labels={'Valor': 'Valor (R$)', 'Ano': 'Ano'})
 
@@ -106,13 +158,18 @@ def criar_grafico_transicao(resultados, titulo=None):
     return fig
 
 
-# Adicionar ao arquivo utils.py - Melhoria da função criar_grafico_incentivos
+def criar_grafico_transicao(resultados, titulo=None, chave=None):
+    """Cria um gráfico comparativo entre sistema atual e IVA Dual."""
+    return obter_grafico("transicao", resultados, titulo, montar_grafico_transicao, chave)
 
-def criar_grafico_incentivos(resultados, titulo=None):
+
+def criar_grafico_incentivos(resultados, titulo=None, chave=None):
     """Cria um gráfico para comparar o ICMS com e sem incentivos fiscais, com detalhamento."""
-    if not resultados:
-        return None
+    return obter_grafico("incentivos", resultados, titulo, montar_grafico_incentivos, chave)
+
 
+def montar_grafico_incentivos(tabela, titulo=None):
+    """ICMS com e sem incentivos por ano e detalhamento da economia por tipo de incentivo."""
     # Preparar figura
     fig = make_subplots(
         rows=1,
@@ -122,17 +179,10 @@ def criar_grafico_incentivos(resultados, titulo=None):
     )
 
     # Preparar dados para o gráfico de barras
-    anos = list(resultados.keys())
-    icms_normal = []
-    icms_incentivado = []
-    economia = []
-
-    for ano, resultado in resultados.items():
-        icms_devido = resultado["impostos_atuais"].get("ICMS", 0)
-        economia_icms = resultado["impostos_atuais"].get("economia_icms", 0)
-        icms_normal.append(icms_devido + economia_icms)
-        icms_incentivado.append(icms_devido)
-        economia.append(economia_icms)
+    anos = tabela["Ano"].unique().tolist()
+    icms_incentivado = serie_indicador(tabela, "ICMS")
+    economia = serie_indicador(tabela, "Economia ICMS")
+    icms_normal = [icms + valor for icms, valor in zip(icms_incentivado, economia)]
 
     # Gráfico de barras - ICMS com e sem incentivos
     fig.add_trace(
@@ -205,4 +255,214 @@ def criar_grafico_incentivos(resultados, titulo=None):
         barmode='group'
     )
 
-    return fig
\ No newline at end of file
+    return fig
+
+# Máximo de pontos enviados ao navegador por gráfico de carteira
+LIMITE_PONTOS_GRAFICO = 5000
+
+
+def indices_lttb(x, y, limite=LIMITE_PONTOS_GRAFICO):
+    """Índices dos pontos mantidos pelo Largest-Triangle-Three-Buckets (LTTB) em uma série ordenada por x.
+
+    Preserva o primeiro e o último ponto e, em cada faixa intermediária, o ponto que forma o maior
+    triângulo com o ponto escolhido na faixa anterior e a média da faixa seguinte.
+    """
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if limite >= n or limite < 3:
+        return np.arange(n)
+
+    x = np.asarray(x)
+    x = x.astype("datetime64[ns]").astype(np.int64).astype(float) if x.dtype.kind == "M" else x.astype(float)
+
+    # Faixas intermediárias [bordas[i], bordas[i + 1]) e médias da faixa seguinte por somas acumuladas
+    bordas = np.append(np.linspace(1, n - 1, limite - 1).astype(np.int64), n)
+    soma_x = np.concatenate(([0.0], np.cumsum(x)))
+    soma_y = np.concatenate(([0.0], np.cumsum(y)))
+    inicio_seguinte, fim_seguinte = bordas[1:-1], bordas[2:]
+    tamanho = fim_seguinte - inicio_seguinte
+    media_x = (soma_x[fim_seguinte] - soma_x[inicio_seguinte]) / tamanho
+    media_y = (soma_y[fim_seguinte] - soma_y[inicio_seguinte]) / tamanho
+
+    indices = np.empty(limite, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for i in range(limite - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        area = np.abs((x[anterior] - media_x[i]) * (y[inicio:fim] - y[anterior])
+                      - (x[anterior] - x[inicio:fim]) * (media_y[i] - y[anterior]))
+        anterior = inicio + int(np.argmax(area))
+        indices[i + 1] = anterior
+    return indices
+
+
+def agregar_densidade(x, y, faixas=60, percentis=(0.5, 99.5)):
+    """Contagem de pontos em uma grade faixas × faixas (recortada pelos percentis para ignorar extremos).
+
+    Retorna a contagem, os centros e as bordas das faixas de x e de y.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    validos = np.isfinite(x) & np.isfinite(y)
+    x, y = x[validos], y[validos]
+
+    limites = [np.percentile(valores, percentis) for valores in (x, y)]
+    contagem, bordas_x, bordas_y = np.histogram2d(x, y, bins=faixas, range=limites)
+    centros_x = (bordas_x[:-1] + bordas_x[1:]) / 2
+    centros_y = (bordas_y[:-1] + bordas_y[1:]) / 2
+    return contagem, centros_x, centros_y, bordas_x, bordas_y
+
+
+def criar_grafico_carteira(razao_custos, aliquota_efetiva, titulo=None, limite=LIMITE_PONTOS_GRAFICO):
+    """Alíquota efetiva × razão custos/faturamento de uma carteira de empresas.
+
+    Até `limite` empresas, cada uma é um ponto WebGL (Scattergl); acima disso, a densidade é agregada
+    no servidor em uma grade (Heatmap) com a curva da alíquota média por faixa de custos.
+    """
+    x = np.asarray(razao_custos, dtype=float) * 100
+    y = np.asarray(aliquota_efetiva, dtype=float) * 100
+    if x.size == 0:
+        return None
+
+    fig = go.Figure()
+    if x.size <= limite:
+        fig.add_trace(go.Scattergl(x=x, y=y, mode="markers", name="Empresas",
+                                   marker=dict(size=5, opacity=0.6, color='#3498db')))
+    else:
+        contagem, centros_x, centros_y, bordas_x, bordas_y = agregar_densidade(x, y)
+        fig.add_trace(go.Heatmap(x=centros_x, y=centros_y, z=np.where(contagem.T > 0, contagem.T, np.nan),
+                                 colorscale="Blues", colorbar=dict(title="Empresas"), name="Densidade"))
+
+        # Alíquota média por faixa de custos, nas mesmas faixas da grade (pontos fora dela são ignorados)
+        na_grade = ((x >= bordas_x[0]) & (x <= bordas_x[-1]) & (y >= bordas_y[0]) & (y <= bordas_y[-1]))
+        faixa = np.digitize(x[na_grade], bordas_x[1:-1])
+        total = np.bincount(faixa, minlength=centros_x.size)
+        media = np.divide(np.bincount(faixa, weights=y[na_grade], minlength=centros_x.size), total,
+                          out=np.full(centros_x.size, np.nan), where=total > 0)
+        fig.add_trace(go.Scattergl(x=centros_x, y=media, mode="lines", name="Média",
+                                   line=dict(color='#e74c3c', width=2)))
+
+    fig.update_layout(title=titulo or f"Alíquota Efetiva × Custos ({x.size} empresas)",
+                      xaxis_title="Custos / Faturamento (%)", yaxis_title="Alíquota Efetiva (%)",
+                      legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+    return fig
+
+
+def criar_grafico_distribuicao_setores(valores, setores, nomes_setores=None, titulo=None):
+    """Distribuição de um indicador por setor em boxplots com estatísticas calculadas no servidor.
+
+    Apenas quartis, média e limites (1,5 × intervalo interquartil) de cada setor são enviados ao navegador.
+    """
+    valores = np.asarray(valores, dtype=float)
+    setores = np.asarray(setores)
+    if valores.size == 0:
+        return None
+
+    codigos, grupo = np.unique(setores, return_inverse=True)
+    ordem = np.argsort(grupo, kind="stable")
+    grupos = np.split(valores[ordem], np.cumsum(np.bincount(grupo))[:-1])
+
+    estatisticas = {"q1": [], "median": [], "q3": [], "lowerfence": [], "upperfence": [], "mean": []}
+    for dados_grupo in grupos:
+        q1, mediana, q3 = np.percentile(dados_grupo, [25, 50, 75])
+        intervalo = q3 - q1
+        estatisticas["q1"].append(q1)
+        estatisticas["median"].append(mediana)
+        estatisticas["q3"].append(q3)
+        estatisticas["lowerfence"].append(max(dados_grupo.min(), q1 - 1.5 * intervalo))
+        estatisticas["upperfence"].append(min(dados_grupo.max(), q3 + 1.5 * intervalo))
+        estatisticas["mean"].append(dados_grupo.mean())
+
+    if nomes_setores is not None and codigos.dtype.kind in "iu":
+        rotulos = [nomes_setores[codigo] for codigo in codigos]
+    else:
+        rotulos = [str(codigo) for codigo in codigos]
+    contagens = np.bincount(grupo)
+
+    fig = go.Figure(go.Box(x=[f"{rotulo} ({contagem})" for rotulo, contagem in zip(rotulos, contagens)],
+                           boxpoints=False, marker_color='#3498db', name="", **estatisticas))
+    fig.update_layout(title=titulo or "Distribuição por Setor", showlegend=False)
+    return fig
+
+
+def criar_grafico_serie_mensal(periodos, series, titulo=None, limite=LIMITE_PONTOS_GRAFICO):
+    """Séries mensais longas (ex: saldo de caixa por período) em linhas WebGL reduzidas por LTTB.
+
+    `series` é um dicionário nome → valores; o limite de pontos é repartido entre as séries.
+    """
+    if not series:
+        return None
+
+    periodos = np.asarray(periodos)
+    pontos_por_serie = max(3, limite // len(series))
+    fig = go.Figure()
+    for nome, valores in series.items():
+        valores = np.asarray(valores, dtype=float)
+        indices = indices_lttb(periodos, valores, pontos_por_serie)
+        fig.add_trace(go.Scattergl(x=periodos[indices], y=valores[indices], mode="lines", name=nome))
+
+    fig.update_layout(title=titulo or "Evolução Mensal", yaxis_title="Valor (R$)",
+                      legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+    return fig
+
+
+# Seções da memória de cálculo: título e caminho da lista de linhas no dicionário da memória
+SECOES_MEMORIA = (
+    ("Validação de Dados", ("validacao",)),
+    ("Projeções", ("projecao",)),
+    ("Base Tributável", ("base_tributavel",)),
+    ("Alíquotas", ("aliquotas",)),
+    ("Cálculo da CBS", ("cbs",)),
+    ("Cálculo do IBS", ("ibs",)),
+    ("Cálculo dos Créditos", ("creditos",)),
+    ("Cálculo do Imposto Devido", ("imposto_devido",)),
+    ("Impostos Atuais - PIS", ("impostos_atuais", "PIS")),
+    ("Impostos Atuais - COFINS", ("impostos_atuais", "COFINS")),
+    ("Impostos Atuais - ICMS", ("impostos_atuais", "ICMS")),
+    ("Impostos Atuais - ISS", ("impostos_atuais", "ISS")),
+    ("Impostos Atuais - IPI", ("impostos_atuais", "IPI")),
+    ("Impostos Atuais - Transição", ("impostos_atuais", "transicao")),
+    ("Total Impostos Atuais", ("impostos_atuais", "total")),
+    ("Créditos Cruzados", ("creditos_cruzados",)),
+    ("Total Devido", ("total_devido",))
+)
+
+# Linhas exibidas por página em cada seção da memória de cálculo
+LINHAS_POR_PAGINA = 200
+
+
+def linhas_memoria(memoria, caminho):
+    """Linhas de uma seção da memória de cálculo (lista vazia se a seção não existir)."""
+    valor = memoria
+    for chave in caminho:
+        valor = valor.get(chave, {}) if isinstance(valor, dict) else {}
+    return valor if isinstance(valor, list) else []
+
+
+def paginar_linhas(linhas, pagina, por_pagina=LINHAS_POR_PAGINA):
+    """Bloco de texto com as linhas de uma página (1 = primeira) e o número total de páginas."""
+    total_paginas = max(1, -(-len(linhas) // por_pagina))
+    pagina = min(max(1, pagina), total_paginas)
+    inicio = (pagina - 1) * por_pagina
+    return "\n".join(str(linha) for linha in linhas[inicio:inicio + por_pagina]), total_paginas
+
+
+def texto_memoria_calculo(memoria, titulo):
+    """Memória de cálculo completa em texto, com uma seção por bloco (para exportação)."""
+    partes = [titulo, ""]
+    for titulo_secao, caminho in SECOES_MEMORIA:
+        linhas = linhas_memoria(memoria, caminho)
+        if linhas:
+            partes.append(f"=== {titulo_secao.upper()} ===")
+            partes.extend(str(linha) for linha in linhas)
+            partes.append("")
+    return "\n".join(partes)
+
+
+def arquivo_memoria_calculo(memoria, titulo):
+    """Bytes do arquivo texto da memória de cálculo, gerado uma vez por conteúdo da memória e título."""
+    chave = (impressao_digital(memoria), titulo)
+    arquivo = consultar_cache(CACHE_ARQUIVOS, chave)
+    if arquivo is None:
+        arquivo = guardar_cache(CACHE_ARQUIVOS, chave, texto_memoria_calculo(memoria, titulo).encode("utf-8"))
+    return arquivo